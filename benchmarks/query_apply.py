@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+    Micro-benchmark for applying queries to client: direct
+    QueryBackend.apply() against replaying calls recorded once and cached
+    by query key, which is the best case of a compiled plan cache (no
+    bound params recomputing). Replay must be clearly faster to pay for
+    keeping compiled plans.
+
+    $ python benchmarks/query_apply.py
+"""
+from __future__ import unicode_literals, print_function
+
+import sys
+import timeit
+
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from sphinxsearch.query import Query  # noqa
+from sphinxsearch.query.filters import Range  # noqa
+from sphinxsearch.session import protocol  # noqa
+
+
+NUMBER = 2000
+FILTER_COUNTS = (0, 10, 50, 200)
+
+
+class RecordingClient(object):
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+
+def get_backend(filters_count):
+    qs = (Query('products').like('phone').orderby('-price')
+                           .groupby('seller_id')[0:20])
+    for i in range(filters_count):
+        if i % 2:
+            qs = qs.filter(**{'attr_%s' % i: Range(i, i + 100)})
+        else:
+            qs = qs.filter(**{'attr_%s' % i: [i, i + 1, i + 2]})
+    return qs.query
+
+
+def apply_direct(backend):
+    client = protocol.SearchRequestBuilder()
+    backend.apply(protocol, client)
+    return client
+
+
+def get_replay(backend):
+    plans = {}
+
+    def apply_replay(backend):
+        key = backend.get_key()
+        calls = plans.get(key)
+        if calls is None:
+            client = RecordingClient()
+            backend.apply(protocol, client)
+            calls = plans[key] = tuple(client.calls)
+
+        client = protocol.SearchRequestBuilder()
+        for method, args in calls:
+            getattr(client, method)(*args)
+        return client
+
+    return apply_replay
+
+
+def measure_time(func, backend):
+    func(backend)
+    seconds = min(timeit.repeat(lambda: func(backend), number=NUMBER, repeat=3))
+    return seconds / NUMBER * 1e6
+
+
+def main():
+    print('%10s %12s %12s' % ('filters', 'direct us', 'replay us'))
+    for filters_count in FILTER_COUNTS:
+        backend = get_backend(filters_count)
+        replay = get_replay(backend)
+        assert apply_direct(backend).requests == replay(backend).requests
+        print('%10d %12.1f %12.1f' % (filters_count,
+                                      measure_time(apply_direct, backend),
+                                      measure_time(replay, backend)))
+
+
+if __name__ == '__main__':
+    main()
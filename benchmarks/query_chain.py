@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+    Micro-benchmark for Query cloning: time and allocated bytes of
+    10-step chains on top of queries already holding N filters.
+    With structural sharing both numbers must not grow with N.
+
+    $ python benchmarks/query_chain.py
+"""
+from __future__ import unicode_literals, print_function
+
+import sys
+import timeit
+
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from sphinxsearch.query import Query  # noqa
+from sphinxsearch.query.filters import Range  # noqa
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+
+NUMBER = 2000
+FILTER_COUNTS = (0, 10, 100, 1000)
+
+
+def get_base_query(filters_count):
+    qs = Query('products')
+    for i in range(filters_count):
+        qs = qs.filter(**{'attr_%s' % i: i})
+    return qs
+
+
+def chain(qs):
+    return (qs.filter(brand_id=1)
+              .filter(category_id=[2, 3])
+              .filter(price=Range(10, 100))
+              .orderby('-price')
+              .groupby('seller_id')
+              .max(1000)
+              .timeout(100)
+              .like('phone')
+              .override('rating', 'SPH_ATTR_INTEGER', **{'1': 5})[0:20])
+
+
+def measure_time(qs):
+    seconds = min(timeit.repeat(lambda: chain(qs), number=NUMBER, repeat=3))
+    return seconds / NUMBER * 1e6
+
+
+def measure_allocations(qs):
+    if tracemalloc is None:
+        return None
+
+    chain(qs)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = chain(qs)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    del result
+    return sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+
+
+def main():
+    print('%10s %14s %16s' % ('filters', 'us per chain', 'bytes per chain'))
+    for filters_count in FILTER_COUNTS:
+        qs = get_base_query(filters_count)
+        allocated = measure_allocations(qs)
+        print('%10d %14.1f %16s' % (filters_count,
+                                    measure_time(qs),
+                                    'n/a' if allocated is None else allocated))
+
+
+if __name__ == '__main__':
+    main()
@@ -18,6 +18,11 @@ setup(
     license='GPL',
     requires=requires,
     tests_require=tests_require,
+    entry_points={
+        'console_scripts': [
+            'sphinxsearch-xmlpipe = sphinxsearch.models.xmlpipe:main',
+        ],
+    },
     description='High-level sphinxsearch library',
     long_description=README + '\n\n' + CHANGES,
 )
@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import hashlib
+import os
+import tempfile
+
 from ..utils import is_abstract
 from .server import SearchServer
 from .indexer import Indexer
 from .commands import CommandBuilder
-from ..utils.const import CONFIG_INDENT
+from .scheduler import ReindexScheduler
+from .planner import plan_changes
+from ..utils.const import CONFIG_INDENT, CONFIG_FILE_MODE
 
 
 class Engine(object):
@@ -15,7 +21,9 @@ class Engine(object):
         self._indexer = None
         self._indexes = set()
         self.conf_file = None
+        self._config_cache = {}
         self.commands = CommandBuilder()
+        self.commands.add_rotate_listener(self.on_rotate)
 
     @property
     def api(self):
@@ -66,47 +74,106 @@ class Engine(object):
     def get_conf(self):
         return self.conf_file
 
-    def create_config(self):
-        blocks_dict = {}
-
-        server_options_dict = self.server.get_options()
-        indexer_options_dict = self.indexer.get_options()
+    @staticmethod
+    def render_block(block_name, block_attrs):
+        # type goes first, other options in key order, list values
+        # are rendered as repeated keys
+        keys = sorted(block_attrs, key=lambda key: (key != 'type', key))
+
+        block_body_list = []
+        for key in keys:
+            value = block_attrs[key]
+            values = value if isinstance(value, (list, tuple)) else [value]
+            block_body_list.extend('%s = %s' % (key, v) for v in values)
+
+        block_body = ('\n%s' % CONFIG_INDENT).join([''] + block_body_list)
+        return """%s\n{%s\n}\n""" % (block_name, block_body)
+
+    def render_blocks(self, blocks_dict):
+        # sources must be declared before indexes using them
+        names = sorted(blocks_dict, key=lambda name: (not name.startswith('source '), name))
+        return [self.render_block(name, blocks_dict[name]) for name in names]
+
+    def get_index_blocks(self, index):
+        """
+            Rendered config blocks of index, memoized until
+            index attrs or source options change
+        """
+        version = index.get_config_version()
+        cached = self._config_cache.get(index)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        blocks = self.render_blocks(index.get_option_dicts(self))
+        self._config_cache[index] = (version, blocks)
+        return blocks
+
+    def get_config_indexes(self):
+        indexes = [index for index in self.indexes if not is_abstract(index)]
+        return sorted(indexes, key=lambda index: index.__sourcename__)
 
-        models_options_dict = self.get_models_dict()
+    def create_config(self):
+        blocks = []
 
-        blocks_dict.update(server_options_dict)
-        blocks_dict.update(indexer_options_dict)
-        blocks_dict.update(models_options_dict)
+        for optionable in (self.server, self.indexer):
+            if optionable is not None:
+                blocks.extend(self.render_blocks(optionable.get_options()))
 
-        str_list = []
+        indexes = self.get_config_indexes()
+        for index in indexes:
+            blocks.extend(self.get_index_blocks(index))
 
-        for block_name, block_attrs in blocks_dict.items():
-            block_body_list = ['%s = %s' % (ak, av) for ak, av in block_attrs.items()]
-            block_body = ('\n%s' % CONFIG_INDENT).join([''] + block_body_list)
-            block = """%s\n{%s\n}\n""" % (block_name, block_body)
-            str_list.append(block)
+        # drop removed indexes
+        for index in set(self._config_cache) - set(indexes):
+            del self._config_cache[index]
 
-        return '\n'.join(str_list)
+        return '\n'.join(blocks)
 
     def save(self):
+        """
+            Writes config atomically, returns False when file
+            already has the same content
+        """
         if self.conf_file is None:
             raise RuntimeError('Engine must provide conf_file')
 
-        config_str = self.create_config()
-        with open(self.conf_file, 'w') as f:
-            f.write(config_str)
+        data = self.create_config().encode('utf-8')
+
+        mode = CONFIG_FILE_MODE
+        if os.path.exists(self.conf_file):
+            with open(self.conf_file, 'rb') as f:
+                if hashlib.sha1(f.read()).digest() == hashlib.sha1(data).digest():
+                    return False
+            mode = os.stat(self.conf_file).st_mode & 0o777
+
+        dirname = os.path.dirname(os.path.abspath(self.conf_file))
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.sphinx-conf-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(tmp_path, mode)
+            os.rename(tmp_path, self.conf_file)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        return True
 
     def get_models_dict(self):
         indexes_blocks = {}
 
-        for index in self.indexes:
-            if is_abstract(index):
-                continue
+        for index in self.get_config_indexes():
             index_option_dicts = index.get_option_dicts(self)
             indexes_blocks.update(index_option_dicts)
 
         return indexes_blocks
 
+    def plan_changes(self, old_conf=None):
+        """
+            Diffs existing config file (conf_file by default) with current
+            engine config, returns ChangePlan with minimal commands
+        """
+        return plan_changes(self, old_conf)
+
     def write(self, config_path):
         with open(config_path, 'w') as f:
             s = self.get_conf().encode('utf-8')
@@ -125,5 +192,23 @@ class Engine(object):
     def get_session(self, **kwargs):
         return self.server.get_session(**kwargs)
 
+    def reindex(self, indexes=None, **options):
+        """
+            Rebuilds plain indexes in parallel, see ReindexScheduler options
+        """
+        return ReindexScheduler(self, indexes, **options).run()
+
+    def on_rotate(self, index_names):
+        if self.server is None:
+            return
+
+        if index_names is None:
+            index_names = []
+            for index in self.indexes:
+                if not is_abstract(index):
+                    index_names.extend(index.get_index_names())
+
+        self.server.invalidate_cache(index_names)
+
 
 __all__ = ['Engine', 'SearchServer', 'Indexer']
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+    asyncio command executor, requires python 3.5+
+"""
+import asyncio
+import time
+
+from .executor import (CommandResult, STDOUT, STDERR, DEFAULT_KILL_GRACE)
+
+
+class AsyncCommandExecutor(object):
+    """
+        Runs commands with asyncio subprocesses, cancelling the task
+        terminates the command
+
+    >>> executor = AsyncCommandExecutor(timeout=3600)
+    >>> result = await executor.run(engine.commands.reindex(Products))
+    """
+    def __init__(self, timeout=None, kill_grace=DEFAULT_KILL_GRACE, **subprocess_kwargs):
+        self.timeout = timeout
+        self.kill_grace = kill_grace
+        self.subprocess_kwargs = subprocess_kwargs
+
+    async def read(self, pipe, stream, result, on_line):
+        while True:
+            line = await pipe.readline()
+            if not line:
+                return
+            line = line.decode('utf-8', 'replace').rstrip('\r\n')
+            result.lines.append((stream, line))
+            if on_line is not None:
+                on_line(stream, line)
+
+    async def stop(self, process):
+        if process.returncode is not None:
+            return
+        try:
+            process.terminate()
+            await asyncio.wait_for(process.wait(), self.kill_grace)
+        except asyncio.TimeoutError:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+    async def run_one(self, command, timeout, on_line):
+        result = CommandResult(command)
+        result.started_at = time.time()
+
+        process = await asyncio.create_subprocess_exec(*result.argv,
+                                                       stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.PIPE,
+                                                       **self.subprocess_kwargs)
+
+        async def communicate():
+            await asyncio.gather(self.read(process.stdout, STDOUT, result, on_line),
+                                 self.read(process.stderr, STDERR, result, on_line))
+            return await process.wait()
+
+        try:
+            result.returncode = await asyncio.wait_for(communicate(), timeout)
+        except asyncio.TimeoutError:
+            result.timed_out = True
+            await self.stop(process)
+            result.returncode = process.returncode
+        except asyncio.CancelledError:
+            result.cancelled = True
+            await self.stop(process)
+            raise
+        finally:
+            result.finished_at = time.time()
+        return result
+
+    async def run(self, command, timeout=None, on_line=None):
+        """
+            Runs command or CommandChain, returns CommandResult of last
+            started command. Succeeded commands get succeeded() call,
+            so rotate listeners learn about rotated indexes.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        result = None
+        for part in getattr(command, 'commands', [command]):
+            result = await self.run_one(part, timeout, on_line)
+            if not result.ok:
+                break
+            if hasattr(part, 'succeeded'):
+                part.succeeded()
+        return result
@@ -60,5 +60,11 @@ class OptionableBase(object):
     def get_option(self, name):
         return self.user_options[name]
 
+    def get_option_value(self, name, default=None):
+        value = self.user_options.get(name)
+        if value is None and name in self.__class__.OPTIONS:
+            value = getattr(self, name)
+        return default if value is None else value
+
     def del_option(self, name, value):
         return self.user_options.pop(name, None)
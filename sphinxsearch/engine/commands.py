@@ -1,21 +1,22 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from six import string_types
+from six import string_types, text_type
 
 from os.path import join
 
 from ..query.filters import Range
 from ..utils.cmdtools import (cmd_flag, cmd_decorator,
                               check_options, cmd_named_kwarg,
-                              cmd_named_arg, requires_kwarg)
+                              cmd_named_arg, requires_kwarg,
+                              CommandChain)
 
 
 def index_to_str(*index):
     if len(index) == 1:
         index = index[0]
         if isinstance(index, string_types):
-            return unicode(index)
+            return text_type(index)
         else:
             return ' '.join(index.get_index_names())
     elif len(index) == 2:
@@ -24,6 +25,32 @@ def index_to_str(*index):
         raise ValueError('index must be two strings or have get_index_names method ')
 
 
+def index_to_args(*index):
+    return index_to_str(*index).split()
+
+
+def rotate_notifier(func):
+    """
+        CommandBuilder rotate listeners are notified about indexes
+        rotated by built command once it succeeded, see Command.succeeded().
+        With nohup indexer does not rotate, its caller notifies listeners.
+    """
+    def wrapper(self, *indexes, **kwargs):
+        rotate = kwargs.get('rotate', True) and not kwargs.get('nohup', False)
+        all_indexes = kwargs.get('all', False)
+
+        cmd = func(self, *indexes, **kwargs)
+
+        if rotate:
+            if all_indexes:
+                index_names = None
+            else:
+                index_names = ' '.join(map(index_to_str, indexes)).split()
+            cmd.on_success.append(lambda: self.notify_rotate(index_names))
+        return cmd
+    return wrapper
+
+
 def cmd_loglevel_option(func):
     def wrapper(*args, **kwargs):
         level = int(kwargs.pop('logdebug', 0) or 0)
@@ -53,14 +80,14 @@ def cmd_dst_range_popper(func):
             else:
                 start = int(dst_range)
                 end = int(dst_range)
-            dst_range_str = '%s %s %s' % (dst_attr, start, end)
+            dst_range_args = [dst_attr, text_type(start), text_type(end)]
         else:
-            dst_range_str = ''
+            dst_range_args = None
 
         cmd_splitted = func(*args, **kwargs)
-        if dst_range_str:
+        if dst_range_args:
             cmd_splitted.append('--merge-dst-range')
-            cmd_splitted.append(dst_range_str)
+            cmd_splitted.extend(dst_range_args)
         return cmd_splitted
     return wrapper
 
@@ -81,12 +108,11 @@ def server_cmd_wrapper(func):
 
 
 def indextool_cmd_wrapper(func):
-    func = cmd_decorator(func)
     func = cmd_flag('optimize_rt_klists', '--optimize-rt-klists', default=False)(func)
     func = cmd_flag('strip_path', '--strip-path', default=False)(func)
-    func = cmd_flag('strip_path', '--strip-path', default=False)(func)
     func = cmd_flag('checkconfig', '--checkconfig', default=False)(func)
     func = cmd_flag('quiet', '--quiet', default=False)(func)
+    func = cmd_decorator(func)
     return func
 
 
@@ -96,6 +122,7 @@ class CommandBuilder(object):
     """
     def __init__(self, prefix=''):
         self.prefix = prefix
+        self.rotate_listeners = []
 
     @property
     def prefix(self):
@@ -114,29 +141,32 @@ class CommandBuilder(object):
         self.indextool_cmd = join(prefix, 'indextool')
         self.wordbreaker_cmd = join(prefix, 'wordbreaker')
 
+    def get_args(self, cmd):
+        return [cmd, '--config', self.config_path]
+
     @property
     def search(self):
-        return '%s --config %s' % (self.search_cmd, self.config_path)
+        return ' '.join(self.get_args(self.search_cmd))
 
     @property
     def searchd(self):
-        return '%s --config %s' % (self.searchd_cmd, self.config_path)
+        return ' '.join(self.get_args(self.searchd_cmd))
 
     @property
     def indexer(self):
-        return '%s --config %s' % (self.indexer_cmd, self.config_path)
+        return ' '.join(self.get_args(self.indexer_cmd))
 
     @property
     def spelldump(self):
-        return '%s --config %s' % (self.spelldump_cmd, self.config_path)
+        return ' '.join(self.get_args(self.spelldump_cmd))
 
     @property
     def indextool(self):
-        return '%s --config %s' % (self.indextool_cmd, self.config_path)
+        return ' '.join(self.get_args(self.indextool_cmd))
 
     @property
     def wordbreaker(self):
-        return '%s --config %s' % (self.wordbreaker_cmd, self.config_path)
+        return ' '.join(self.get_args(self.wordbreaker_cmd))
 
     def set_conf(self, config_path):
         self.config_path = config_path
@@ -144,6 +174,18 @@ class CommandBuilder(object):
     def get_conf(self):
         return self.config_path
 
+    def add_rotate_listener(self, callback):
+        """
+            callback(index_names) is called after reindex or merge command
+            with rotation succeeded, index_names is None for --all
+        """
+        self.rotate_listeners.append(callback)
+
+    def notify_rotate(self, index_names):
+        for callback in self.rotate_listeners:
+            callback(index_names)
+
+    @rotate_notifier
     @indexer_cmd_wrapper
     @cmd_flag('rotate', '--rotate', default=True)
     @cmd_flag('sighup_each', '--sighup-each', default=False)
@@ -154,7 +196,7 @@ class CommandBuilder(object):
         >>> commands.reindex('main', 'delta', deleted=0)
         >>> commands.reindex(all=True, sighup_each=True, dump='/tmp/dump.sql')
         """
-        cmd_splitted = [self.indexer]
+        cmd_splitted = self.get_args(self.indexer_cmd)
 
         all = kwargs.pop('all', False)
 
@@ -163,14 +205,16 @@ class CommandBuilder(object):
         if all:
             cmd_splitted.append('--all')
         else:
-            cmd_splitted.extend(map(index_to_str, indexes))
+            for index in indexes:
+                cmd_splitted.extend(index_to_args(index))
 
         return cmd_splitted
 
+    @rotate_notifier
     @indexer_cmd_wrapper
     @cmd_flag('rotate', '--rotate', default=True)
-    @cmd_flag('keep_attrs', '--keep-default=attrs', default=False)
-    @cmd_flag('killlists', '--merge-default=killlists', default=False)
+    @cmd_flag('keep_attrs', '--keep-attrs', default=False)
+    @cmd_flag('killlists', '--merge-killlists', default=False)
     @cmd_flag('nohup', '--nohup', default=False)
     @cmd_dst_range_popper
     def merge(self, *index):
@@ -179,10 +223,9 @@ class CommandBuilder(object):
         >>> commands.merge('main', 'delta', deleted=0)
         >>> commands.merge(Main, Delta, deleted=Range(23, 556), rotate=True)
         """
-        cmd_splitted = [self.indexer, '--merge']
-
-        index_str = index_to_str(*index)
-        cmd_splitted.append(index_str)
+        cmd_splitted = self.get_args(self.indexer_cmd)
+        cmd_splitted.append('--merge')
+        cmd_splitted.extend(index_to_args(*index))
 
         return cmd_splitted
 
@@ -201,27 +244,28 @@ class CommandBuilder(object):
 
         check_options(kwargs)
 
-        cmd_splitted = [self.indexer]
-        cmd_splitted.extend(map(index_to_str, indexes))
+        cmd_splitted = self.get_args(self.indexer_cmd)
+        for index in indexes:
+            cmd_splitted.extend(index_to_args(index))
         cmd_splitted.append('--buildstops')
 
-        cmd_splitted.append(unicode(outputfile))
-        cmd_splitted.append(unicode(int(limit)))
+        cmd_splitted.append(text_type(outputfile))
+        cmd_splitted.append(text_type(int(limit)))
         return cmd_splitted
 
     @server_cmd_wrapper
     @cmd_named_kwarg('pidfile', '--pidfile')
     def status(self):
-        return [self.searchd, '--status']
+        return self.get_args(self.searchd_cmd) + ['--status']
 
     @server_cmd_wrapper
     @cmd_named_kwarg('pidfile', '--pidfile')
     @cmd_flag('block', '--stopwait', default=False)
     def stop(self):
-        return [self.searchd, '--stop']
+        return self.get_args(self.searchd_cmd) + ['--stop']
 
     @server_cmd_wrapper
-    @cmd_named_kwarg('index', '--index', apply=index_to_str)
+    @cmd_named_kwarg('index', '--index', apply=index_to_args)
     @cmd_named_kwarg('pidfile', '--pidfile')
     @cmd_named_kwarg('listen', '--listen', conflicts=('host', 'port'))
     @cmd_named_kwarg('port', '--port', conflicts=('listen',))
@@ -244,10 +288,12 @@ class CommandBuilder(object):
                                                                   'ntservice'])
     @cmd_loglevel_option
     def start(self, **kwargs):
-        return [self.searchd, '--start']
+        return self.get_args(self.searchd_cmd) + ['--start']
 
-    @server_cmd_wrapper
     def restart(self, *args, **kwargs):
+        """
+            Returns CommandChain of stop and start commands
+        """
         pidfile = kwargs.pop('pidfile', None)
         new_pidfile = kwargs.pop('new_pidfile', pidfile)
 
@@ -261,61 +307,65 @@ class CommandBuilder(object):
 
         stop_cmd = self.stop(**stop_kwargs)
         start_cmd = self.start(*args, **start_kwargs)
-        return [stop_cmd, ';', start_cmd]
+        return CommandChain([stop_cmd, start_cmd])
 
     @indextool_cmd_wrapper
     @cmd_named_arg('file')
     def dumpconfig(self):
-        return [self.indextool, '--dumpconfig']
+        return self.get_args(self.indextool_cmd) + ['--dumpconfig']
 
     @indextool_cmd_wrapper
     @cmd_named_arg('file')
     def dumpheader(self):
-        return [self.indextool, '--dumpheader']
+        return self.get_args(self.indextool_cmd) + ['--dumpheader']
 
     @indextool_cmd_wrapper
-    @cmd_named_arg('index', apply=index_to_str)
+    @cmd_named_arg('index', apply=index_to_args)
     def build_infixes(self):
-        return [self.indextool, '--build-infixes']
+        return self.get_args(self.indextool_cmd) + ['--build-infixes']
 
     @indextool_cmd_wrapper
-    @cmd_named_arg('index', apply=index_to_str)
     @cmd_flag('rotate', '--rotate', default=True)
+    @cmd_named_arg('index', apply=index_to_args)
     def check(self):
-        return [self.indextool, '--check']
+        """
+            With rotate index waiting for rotation is checked, .tmp files
+            left by indexer --rotate --nohup are renamed to .new
+        """
+        return self.get_args(self.indextool_cmd) + ['--check']
 
     @indextool_cmd_wrapper
-    @cmd_named_arg('index', apply=index_to_str)
+    @cmd_named_arg('index', apply=index_to_args)
     def dumpdict(self):
-        return [self.indextool, '--dumpdict']
+        return self.get_args(self.indextool_cmd) + ['--dumpdict']
 
     @indextool_cmd_wrapper
-    @cmd_named_arg('index', apply=index_to_str)
+    @cmd_named_arg('index', apply=index_to_args)
     def dumpdocids(self):
-        return [self.indextool, '--dumpdocids']
+        return self.get_args(self.indextool_cmd) + ['--dumpdocids']
 
     @indextool_cmd_wrapper
-    @cmd_named_arg('index', apply=index_to_str)
+    @cmd_named_arg('index', apply=index_to_args)
     @cmd_named_kwarg('wordid', '--wordid', conflicts=['keyword'])
     @cmd_named_arg('keyword', conflicts=['wordid'])
     def dumphitlist(self):
-        return [self.indextool, '--dumphitlist']
+        return self.get_args(self.indextool_cmd) + ['--dumphitlist']
 
     @indextool_cmd_wrapper
-    @cmd_named_arg('index', apply=index_to_str)
+    @cmd_named_arg('index', apply=index_to_args)
     @cmd_named_arg('optfile')
     def fold(self):
-        return [self.indextool, '--fold']
+        return self.get_args(self.indextool_cmd) + ['--fold']
 
     @indextool_cmd_wrapper
-    @cmd_named_arg('index', apply=index_to_str)
+    @cmd_named_arg('index', apply=index_to_args)
     def htmlstrip(self):
-        return [self.indextool, '--htmlstrip']
+        return self.get_args(self.indextool_cmd) + ['--htmlstrip']
 
     @indextool_cmd_wrapper
-    @cmd_named_arg('index', apply=index_to_str)
+    @cmd_named_arg('index', apply=index_to_args)
     def morph(self):
-        return [self.indextool, '--morph']
+        return self.get_args(self.indextool_cmd) + ['--morph']
 
 
 
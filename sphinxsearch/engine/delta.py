@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import os
+import tempfile
+import time
+
+from ..loggers import logger
+from ..models.const import NOT_INDEXED_SOURCE_TYPES
+from ..utils import is_abstract, parse_size
+from .executor import CommandExecutor
+
+
+class DeltaManager(object):
+    """
+        Main+delta lifecycle for indexes with __delta__ = True: update()
+        reindexes only delta and merges it into main once delta grows past
+        max_delta_docs/max_delta_bytes or gets older than max_delta_age.
+
+        Watermarks are taken with get_watermark(index) before delta is built
+        and passed to set_watermark(index, value) after successful merge,
+        so delta source query can start from it. Merge uses
+        --merge-killlists and Index.__merge_dst_range__ ({'deleted': 0}).
+        State is kept in json file between runs.
+
+    >>> manager = DeltaManager(engine, '/var/lib/sphinx/delta.json',
+    ...                        max_delta_docs=100000,
+    ...                        get_watermark=get_max_id, set_watermark=save_max_id)
+    >>> manager.update_all()
+    """
+    def __init__(self, engine, state_path, max_delta_docs=None,
+                 max_delta_bytes=None, max_delta_age=None,
+                 get_watermark=None, set_watermark=None, timeout=None):
+        self.engine = engine
+        self.state_path = state_path
+        self.max_delta_docs = max_delta_docs
+        self.max_delta_bytes = None if max_delta_bytes is None else parse_size(max_delta_bytes)
+        self.max_delta_age = max_delta_age
+        self.get_watermark = get_watermark
+        self.set_watermark = set_watermark
+        self.executor = CommandExecutor(timeout=timeout)
+
+        self.state = self.load_state()
+
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def save_state(self):
+        dirname = os.path.dirname(os.path.abspath(self.state_path))
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.delta-state-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.state, f, sort_keys=True, indent=2)
+        os.rename(tmp_path, self.state_path)
+
+    def get_indexes(self):
+        return sorted((index for index in self.engine.indexes
+                       if not is_abstract(index) and index.__delta__ and
+                       index.__source__.source_type not in NOT_INDEXED_SOURCE_TYPES),
+                      key=lambda index: index.__sourcename__)
+
+    def get_index_state(self, index):
+        return self.state.setdefault(index.__sourcename__, {
+            'watermark': None,
+            'pending_watermark': None,
+            'delta_docs': 0,
+            'delta_bytes': 0,
+            'merged_at': None,
+            'reindexes': 0,
+            'merges': 0,
+            'last_reindex_time': None,
+            'last_merge_time': None,
+        })
+
+    def run(self, command):
+        return self.executor.run(command).check()
+
+    def reindex_delta(self, index):
+        index_state = self.get_index_state(index)
+        if self.get_watermark is not None:
+            index_state['pending_watermark'] = self.get_watermark(index)
+
+        command = self.engine.commands.reindex(index.get_delta_name(), rotate=True)
+        result = self.run(command)
+
+        docs, size, elapsed = result.report.docs, result.report.bytes, result.elapsed
+        index_state['delta_docs'] = docs
+        index_state['delta_bytes'] = size
+        index_state['reindexes'] += 1
+        index_state['last_reindex_time'] = elapsed
+        if index_state['merged_at'] is None:
+            index_state['merged_at'] = time.time()
+
+        logger.info('delta %s: %s docs, %s bytes in %.2fs',
+                    index.get_delta_name(), docs, size, elapsed)
+
+    def needs_merge(self, index):
+        index_state = self.get_index_state(index)
+
+        if self.max_delta_docs is not None and index_state['delta_docs'] >= self.max_delta_docs:
+            return True
+        if self.max_delta_bytes is not None and index_state['delta_bytes'] >= self.max_delta_bytes:
+            return True
+        if self.max_delta_age is not None and index_state['merged_at'] is not None:
+            return time.time() - index_state['merged_at'] >= self.max_delta_age
+        return False
+
+    def get_merge_command(self, index):
+        options = dict(getattr(index, '__merge_dst_range__', None) or {})
+        if len(options) > 1:
+            raise ValueError('indexer supports single --merge-dst-range')
+
+        return self.engine.commands.merge(index.__sourcename__, index.get_delta_name(),
+                                          rotate=True, killlists=True, **options)
+
+    def merge(self, index):
+        index_state = self.get_index_state(index)
+
+        elapsed = self.run(self.get_merge_command(index)).elapsed
+        index_state['merges'] += 1
+        index_state['last_merge_time'] = elapsed
+        index_state['merged_at'] = time.time()
+
+        watermark = index_state['pending_watermark']
+        if watermark is not None:
+            if self.set_watermark is not None:
+                self.set_watermark(index, watermark)
+            index_state['watermark'] = watermark
+            index_state['pending_watermark'] = None
+
+        logger.info('merged %s into %s in %.2fs',
+                    index.get_delta_name(), index.__sourcename__, elapsed)
+
+        # delta source starts from new watermark, rebuild it empty
+        self.reindex_delta(index)
+
+    def update(self, index):
+        """
+            Reindexes delta and merges it when needed,
+            returns True if merge happened
+        """
+        try:
+            self.reindex_delta(index)
+            merged = self.needs_merge(index)
+            if merged:
+                self.merge(index)
+        finally:
+            self.save_state()
+        return merged
+
+    def update_all(self):
+        return dict((index.__sourcename__, self.update(index))
+                    for index in self.get_indexes())
+
+    def get_stats(self):
+        return dict((name, dict(index_state)) for name, index_state in self.state.items())
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+    Runs CommandBuilder commands without shell and parses their output.
+
+    >>> executor = CommandExecutor(timeout=3600)
+    >>> result = executor.run(engine.commands.reindex(Products))
+    >>> result.check().report.docs
+"""
+from __future__ import unicode_literals
+
+import re
+import shlex
+import subprocess
+import threading
+import time
+
+from six import string_types
+from six.moves.queue import Queue, Empty
+
+
+STDOUT = 'stdout'
+STDERR = 'stderr'
+
+# seconds between SIGTERM and SIGKILL
+DEFAULT_KILL_GRACE = 5.0
+
+RE_INDEXING = re.compile(r"^indexing index '([^']+)'")
+RE_MERGING = re.compile(r"^merging index '([^']+)'")
+RE_TOTAL_DOCS = re.compile(r'^total (\d+) docs, (\d+) bytes')
+RE_TOTAL_TIME = re.compile(r'^total (\d+(?:\.\d+)?) sec')
+RE_WARNING = re.compile(r'^WARNING:\s*(.*)$')
+RE_ERROR = re.compile(r'^(?:ERROR|FATAL):\s*(.*)$')
+
+
+def get_argv(command):
+    """
+        Command keeps its argv, plain strings are split like shell does
+    """
+    argv = getattr(command, 'argv', None)
+    if argv is not None:
+        return list(argv)
+    if isinstance(command, string_types):
+        return shlex.split(command)
+    return list(command)
+
+
+class CommandFailed(Exception):
+    def __init__(self, command, returncode, output):
+        super(CommandFailed, self).__init__('%s exited with %s' % (command, returncode))
+        self.command = command
+        self.returncode = returncode
+        self.output = output
+
+
+class IndexStats(object):
+    def __init__(self, name):
+        self.name = name
+        self.docs = 0
+        self.bytes = 0
+        self.elapsed = None
+
+    def as_dict(self):
+        return {'name': self.name, 'docs': self.docs,
+                'bytes': self.bytes, 'elapsed': self.elapsed}
+
+
+class IndexerReport(object):
+    """
+        Structured indexer output: per index docs, bytes and time,
+        warnings and errors
+    """
+    def __init__(self):
+        self.indexes = []
+        self.warnings = []
+        self.errors = []
+        self._current = None
+
+    def get_current(self):
+        if self._current is None:
+            self._current = IndexStats(None)
+            self.indexes.append(self._current)
+        return self._current
+
+    def feed(self, line):
+        line = line.strip()
+
+        match = RE_INDEXING.match(line) or RE_MERGING.match(line)
+        if match is not None:
+            self._current = IndexStats(match.group(1))
+            self.indexes.append(self._current)
+            return
+
+        match = RE_TOTAL_DOCS.match(line)
+        if match is not None:
+            stats = self.get_current()
+            stats.docs, stats.bytes = int(match.group(1)), int(match.group(2))
+            return
+
+        match = RE_TOTAL_TIME.match(line)
+        if match is not None:
+            self.get_current().elapsed = float(match.group(1))
+            return
+
+        match = RE_WARNING.match(line)
+        if match is not None:
+            self.warnings.append(match.group(1))
+            return
+
+        match = RE_ERROR.match(line)
+        if match is not None:
+            self.errors.append(match.group(1))
+
+    @property
+    def docs(self):
+        return sum(stats.docs for stats in self.indexes)
+
+    @property
+    def bytes(self):
+        return sum(stats.bytes for stats in self.indexes)
+
+    @property
+    def elapsed(self):
+        return sum(stats.elapsed or 0.0 for stats in self.indexes)
+
+    def as_dict(self):
+        return {'indexes': [stats.as_dict() for stats in self.indexes],
+                'docs': self.docs,
+                'bytes': self.bytes,
+                'elapsed': self.elapsed,
+                'warnings': list(self.warnings),
+                'errors': list(self.errors)}
+
+
+def parse_indexer_output(output):
+    report = IndexerReport()
+    lines = output.splitlines() if isinstance(output, string_types) else output
+    for line in lines:
+        report.feed(line)
+    return report
+
+
+class CommandResult(object):
+    def __init__(self, command):
+        self.command = command
+        self.argv = get_argv(command)
+        self.returncode = None
+        self.lines = []
+        self.started_at = None
+        self.finished_at = None
+        self.timed_out = False
+        self.cancelled = False
+        self._report = None
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    @property
+    def elapsed(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    @property
+    def output(self):
+        return '\n'.join(line for _, line in self.lines)
+
+    @property
+    def stdout(self):
+        return '\n'.join(line for stream, line in self.lines if stream == STDOUT)
+
+    @property
+    def stderr(self):
+        return '\n'.join(line for stream, line in self.lines if stream == STDERR)
+
+    @property
+    def report(self):
+        if self._report is None:
+            self._report = parse_indexer_output([line for _, line in self.lines])
+        return self._report
+
+    def check(self):
+        """
+            Raises CommandFailed unless command exited with 0, returns self
+        """
+        if not self.ok:
+            raise CommandFailed(self.command, self.returncode, self.output)
+        return self
+
+    def as_dict(self):
+        return {'command': self.command,
+                'returncode': self.returncode,
+                'elapsed': self.elapsed,
+                'timed_out': self.timed_out,
+                'cancelled': self.cancelled,
+                'output': self.output}
+
+    def __repr__(self):
+        return 'CommandResult(%s, returncode=%s)' % (self.argv[0], self.returncode)
+
+
+class CommandProcess(object):
+    """
+        Running command, stdout and stderr lines are read by two threads
+        and yielded by iter_lines() in arrival order
+    """
+    def __init__(self, command, timeout=None, kill_grace=DEFAULT_KILL_GRACE, **popen_kwargs):
+        self.result = CommandResult(command)
+        self.timeout = timeout
+        self.kill_grace = kill_grace
+
+        self._queue = Queue()
+        self._open_streams = 2
+        self._stop_reason = None
+        self._lock = threading.Lock()
+
+        self.result.started_at = time.time()
+        self.process = subprocess.Popen(self.result.argv,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE,
+                                        **popen_kwargs)
+
+        self._readers = [threading.Thread(target=self.read, args=(self.process.stdout, STDOUT)),
+                         threading.Thread(target=self.read, args=(self.process.stderr, STDERR))]
+        for thread in self._readers:
+            thread.daemon = True
+            thread.start()
+
+    def read(self, pipe, stream):
+        try:
+            for line in iter(pipe.readline, b''):
+                self._queue.put((stream, line.decode('utf-8', 'replace').rstrip('\r\n')))
+        finally:
+            pipe.close()
+            self._queue.put((stream, None))
+
+    def stop(self, reason):
+        with self._lock:
+            if self._stop_reason is not None or self.process.poll() is not None:
+                return
+            self._stop_reason = reason
+
+        self.process.terminate()
+        killer = threading.Timer(self.kill_grace, self.kill)
+        killer.daemon = True
+        killer.start()
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+
+    def cancel(self):
+        """
+            Terminates command, can be called from any thread
+        """
+        self.stop('cancelled')
+
+    def iter_lines(self):
+        """
+            Yields (stream, line) tuples until both pipes are closed
+        """
+        deadline = None if self.timeout is None else self.result.started_at + self.timeout
+        while self._open_streams:
+            wait = 0.1
+            if deadline is not None:
+                wait = min(wait, max(deadline - time.time(), 0.0))
+            try:
+                stream, line = self._queue.get(timeout=wait)
+            except Empty:
+                if deadline is not None and time.time() >= deadline:
+                    self.stop('timed_out')
+                    # pipes are polled with default wait until process exits
+                    deadline = None
+                continue
+
+            if line is None:
+                self._open_streams -= 1
+                continue
+
+            self.result.lines.append((stream, line))
+            yield stream, line
+
+    def wait(self):
+        """
+            Consumes remaining output, returns CommandResult
+        """
+        for _ in self.iter_lines():
+            pass
+
+        self.result.returncode = self.process.wait()
+        self.result.finished_at = time.time()
+        self.result.timed_out = self._stop_reason == 'timed_out'
+        self.result.cancelled = self._stop_reason == 'cancelled'
+        return self.result
+
+
+class CommandExecutor(object):
+    """
+        on_line(stream, line) callback gets every output line as soon as
+        command writes it
+    """
+    def __init__(self, timeout=None, kill_grace=DEFAULT_KILL_GRACE, **popen_kwargs):
+        self.timeout = timeout
+        self.kill_grace = kill_grace
+        self.popen_kwargs = popen_kwargs
+
+    def start(self, command, timeout=None):
+        return CommandProcess(command,
+                              timeout=self.timeout if timeout is None else timeout,
+                              kill_grace=self.kill_grace,
+                              **self.popen_kwargs)
+
+    def run(self, command, timeout=None, on_line=None):
+        """
+            Runs command or CommandChain, returns CommandResult of last
+            started command. Succeeded commands get succeeded() call,
+            so rotate listeners learn about rotated indexes.
+        """
+        result = None
+        for part in getattr(command, 'commands', [command]):
+            process = self.start(part, timeout)
+            for stream, line in process.iter_lines():
+                if on_line is not None:
+                    on_line(stream, line)
+            result = process.wait()
+            if not result.ok:
+                break
+            if hasattr(part, 'succeeded'):
+                part.succeeded()
+        return result
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+    Compares existing sphinx.conf with engine config and plans
+    the smallest set of commands which applies the difference.
+
+    >>> plan = engine.plan_changes('/etc/sphinx/sphinx.conf')
+    >>> plan.changes
+    [ConfigChange('index products', 'changed', 'reindex', ['morphology'])]
+    >>> plan.apply()
+"""
+from __future__ import unicode_literals
+
+import io
+import os
+
+from collections import OrderedDict
+
+from six import text_type
+
+from ..exceptions import ConfigError
+from ..models.const import RT_SOURCE_TYPE, DISTRIBUTED_SOURCE_TYPE
+from .executor import CommandExecutor
+from .scheduler import send_sighup
+
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+# actions ordered by cost
+NOOP = 'noop'
+ROTATE = 'rotate'
+REINDEX = 'reindex'
+RESTART = 'restart'
+
+# index options searchd reloads on SIGHUP without rebuilding index files
+ROTATE_INDEX_OPTIONS = frozenset([
+    'preopen', 'mlock', 'ondisk_attrs', 'ondisk_dict', 'expand_keywords',
+    'global_idf', 'local', 'agent', 'agent_persistent', 'agent_blackhole',
+    'agent_connect_timeout', 'agent_query_timeout', 'ha_strategy',
+])
+
+
+def iter_config_lines(text):
+    """
+        Yields config lines without comments, with joined continuations
+    """
+    continued = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not continued and (not line or line.startswith('#')):
+            continue
+        if line.endswith('\\'):
+            continued.append(line[:-1].strip())
+            continue
+        if continued:
+            line = ' '.join(continued + [line]).strip()
+            continued = []
+        yield line
+    if continued:
+        yield ' '.join(continued).strip()
+
+
+def parse_config(text):
+    """
+        'source a : b { key = value }' -> {'source a': {'key': ['value']}},
+        inherited blocks get options of parent block
+    """
+    blocks = OrderedDict()
+    parents = {}
+    header = None
+    options = None
+
+    for line in iter_config_lines(text):
+        if options is None:
+            if line != '{':
+                opening = line.endswith('{')
+                name, _, parent = (line[:-1] if opening else line).partition(':')
+                header = ' '.join(name.split())
+                if parent.strip():
+                    parents[header] = '%s %s' % (header.split()[0], parent.strip())
+                if not opening:
+                    continue
+            if header is None:
+                raise ConfigError('block without name')
+            options = blocks[header] = OrderedDict()
+        elif line == '}':
+            header = options = None
+        else:
+            key, sep, value = line.partition('=')
+            if not sep:
+                raise ConfigError('invalid config line: %s' % line)
+            options.setdefault(key.strip(), []).append(value.strip())
+
+    if options is not None:
+        raise ConfigError('block %s is not closed' % header)
+
+    def resolve(name, seen=()):
+        if name not in parents:
+            return blocks[name]
+        if name in seen or parents[name] not in blocks:
+            raise ConfigError('invalid parent of block %s' % name)
+        merged = OrderedDict(resolve(parents[name], seen + (name,)))
+        merged.update(blocks[name])
+        return merged
+
+    return OrderedDict((name, resolve(name)) for name in blocks)
+
+
+def normalize_options(options):
+    normalized = {}
+    for key, value in options.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        normalized[key] = [text_type(v) for v in values]
+    return normalized
+
+
+class ConfigChange(object):
+    def __init__(self, block, kind, action, keys=()):
+        self.block = block
+        self.kind = kind
+        self.action = action
+        self.keys = sorted(keys)
+
+    @property
+    def block_type(self):
+        return self.block.split()[0]
+
+    @property
+    def name(self):
+        parts = self.block.split()
+        return parts[1] if len(parts) > 1 else None
+
+    def __eq__(self, other):
+        return (isinstance(other, ConfigChange) and
+                (self.block, self.kind, self.action, self.keys) ==
+                (other.block, other.kind, other.action, other.keys))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'ConfigChange(%r, %r, %r, %r)' % (self.block, self.kind, self.action, self.keys)
+
+
+class ChangePlan(object):
+    def __init__(self, engine, changes):
+        self.engine = engine
+        self.changes = changes
+
+    def get_actions(self, action):
+        return [change for change in self.changes if change.action == action]
+
+    @property
+    def restart(self):
+        return bool(self.get_actions(RESTART))
+
+    @property
+    def reindex(self):
+        return sorted(set(change.name for change in self.get_actions(REINDEX)))
+
+    @property
+    def rotate(self):
+        """
+            True when searchd has to reload config with SIGHUP
+        """
+        return not self.restart and not self.reindex and bool(self.get_actions(ROTATE))
+
+    @property
+    def commands(self):
+        """
+            Commands in execution order, rotate-only plans have no commands
+            and are applied with SIGHUP
+        """
+        commands = self.engine.commands
+        if self.restart:
+            plan = [commands.stop(block=True)]
+            if self.reindex:
+                plan.append(commands.reindex(*self.reindex, rotate=False))
+            plan.append(commands.start())
+            return plan
+        if self.reindex:
+            # indexer sends SIGHUP itself, so config changes are picked up too
+            return [commands.reindex(*self.reindex, rotate=True)]
+        return []
+
+    def apply(self, executor=None, save=True):
+        """
+            Saves engine config, runs commands, returns their CommandResult list
+        """
+        if save:
+            self.engine.save()
+
+        executor = executor or CommandExecutor()
+        results = [executor.run(command).check() for command in self.commands]
+
+        if self.rotate:
+            send_sighup(self.engine)
+        elif self.restart and self.reindex:
+            # indexes rebuilt without rotation are served after restart
+            self.engine.commands.notify_rotate(self.reindex)
+        return results
+
+    def __bool__(self):
+        return any(change.action != NOOP for change in self.changes)
+
+    __nonzero__ = __bool__
+
+
+def get_index_types(blocks):
+    """
+        index block name -> 'rt', 'distributed' or 'plain'
+    """
+    index_types = {}
+    for name, options in blocks.items():
+        if name.startswith('index '):
+            index_types[name] = (options.get('type') or ['plain'])[0]
+    return index_types
+
+
+def classify_index(block, kind, keys, index_type):
+    if index_type == RT_SOURCE_TYPE:
+        # rt schema lives in index files, searchd has to recreate them
+        return RESTART
+    if index_type == DISTRIBUTED_SOURCE_TYPE or kind == REMOVED:
+        return ROTATE
+    if kind == CHANGED and set(keys) <= ROTATE_INDEX_OPTIONS:
+        return ROTATE
+    return REINDEX
+
+
+def diff_blocks(old_blocks, new_blocks):
+    changes = []
+
+    old_types = get_index_types(old_blocks)
+    new_types = get_index_types(new_blocks)
+    changed_sources = set()
+
+    for block in sorted(set(old_blocks) | set(new_blocks)):
+        old = old_blocks.get(block)
+        new = new_blocks.get(block)
+
+        if old is None:
+            kind, keys = ADDED, list(new)
+        elif new is None:
+            kind, keys = REMOVED, list(old)
+        else:
+            kind = CHANGED
+            keys = [key for key in set(old) | set(new) if old.get(key) != new.get(key)]
+            if not keys:
+                continue
+
+        block_type = block.split()[0]
+        if block_type == 'searchd':
+            action = RESTART
+        elif block_type in ('indexer', 'common'):
+            # used by the next indexer run only
+            action = NOOP
+        elif block_type == 'source':
+            changed_sources.add(block.split()[1])
+            action = NOOP
+        elif old is not None and new is not None and old_types[block] != new_types[block]:
+            action = RESTART
+        else:
+            index_type = new_types[block] if new is not None else old_types[block]
+            action = classify_index(block, kind, keys, index_type)
+
+        changes.append(ConfigChange(block, kind, action, keys))
+
+    # plain indexes built from changed sources
+    planned = dict((change.block, change) for change in changes)
+    for block, options in sorted(new_blocks.items()):
+        if not block.startswith('index ') or new_types[block] != 'plain':
+            continue
+        if not set(options.get('source', ())) & changed_sources:
+            continue
+
+        change = planned.get(block)
+        if change is None:
+            changes.append(ConfigChange(block, CHANGED, REINDEX, ['source']))
+        elif change.action in (NOOP, ROTATE):
+            change.action = REINDEX
+
+    return sorted(changes, key=lambda change: change.block)
+
+
+def plan_changes(engine, old_conf=None):
+    """
+        old_conf is path of existing config, engine conf_file by default
+    """
+    old_conf = old_conf or engine.conf_file
+
+    old_blocks = {}
+    if old_conf is not None and os.path.exists(old_conf):
+        with io.open(old_conf, encoding='utf-8') as f:
+            old_blocks = parse_config(f.read())
+
+    new_blocks = {}
+    for optionable in (engine.server, engine.indexer):
+        if optionable is not None:
+            new_blocks.update(optionable.get_options())
+    new_blocks.update(engine.get_models_dict())
+
+    new_blocks = dict((name, normalize_options(options)) for name, options in new_blocks.items())
+    return ChangePlan(engine, diff_blocks(old_blocks, new_blocks))
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+
+from six import string_types, text_type
+
+from ..exceptions import ConfigError
+from ..models.const import DISTRIBUTED_SOURCE_TYPE
+
+
+class QueryRouter(object):
+    """
+        Sends queries to searchd nodes serving their indexes, queries for
+        different nodes are run in parallel, one batch per node.
+        Mirrors of the same index are used in round robin order.
+
+    >>> router = QueryRouter(default=head)
+    >>> router.add_index(Products, head)
+    >>> router.run(Query(Products), Query(ProductsShard2).filter(id=12))
+    """
+    def __init__(self, default=None):
+        self.default = default
+        self.routes = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def add_index(self, index, *servers):
+        """
+            Routes index to servers, distributed index agents are routed
+            to their own servers
+        """
+        if isinstance(index, string_types):
+            names = [text_type(index)]
+        else:
+            names = index.get_index_names()
+            source = index.__source__
+            if source.source_type == DISTRIBUTED_SOURCE_TYPE:
+                for agent in source.agents:
+                    for name in agent.get_index_names():
+                        self.routes.setdefault(name, tuple(agent.servers))
+
+        if not servers:
+            raise ValueError('index requires at least one server')
+        for name in names:
+            self.routes[name] = tuple(servers)
+
+    def get_servers(self, backend):
+        servers = None
+        for name in backend.indexes_str.split():
+            name_servers = self.routes.get(name)
+            if name_servers is None:
+                if self.default is None:
+                    raise ConfigError('no route for index %s' % name)
+                name_servers = (self.default,)
+
+            if servers is not None and servers != name_servers:
+                raise ConfigError('indexes %s are served by different nodes' % backend.indexes_str)
+            servers = name_servers
+        return servers
+
+    def get_server(self, backend):
+        servers = self.get_servers(backend)
+        if len(servers) == 1:
+            return servers[0]
+
+        with self._lock:
+            count = self._counters.get(servers, 0)
+            self._counters[servers] = count + 1
+        return servers[count % len(servers)]
+
+    def group(self, qs_list):
+        """
+            Returns [(server, [(position, qs), ...]), ...] in first use order
+        """
+        groups = []
+        positions = {}
+        for position, qs in enumerate(qs_list):
+            server = self.get_server(getattr(qs, 'query', qs))
+            if server not in positions:
+                positions[server] = len(groups)
+                groups.append((server, []))
+            groups[positions[server]][1].append((position, qs))
+        return groups
+
+    def run_group(self, server, items, results, errors):
+        try:
+            with server.get_session() as session:
+                group_results = session.run(*[qs for _, qs in items])
+        except Exception as e:
+            errors.append(e)
+            return
+
+        for (position, _), result in zip(items, group_results):
+            results[position] = result
+
+    def run(self, *qs_list):
+        """
+            Returns results in queries order, raises first node error
+        """
+        results = [None] * len(qs_list)
+        errors = []
+        groups = self.group(qs_list)
+
+        if len(groups) == 1:
+            self.run_group(groups[0][0], groups[0][1], results, errors)
+        else:
+            threads = [threading.Thread(target=self.run_group,
+                                        args=(server, items, results, errors))
+                       for server, items in groups]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+        return results
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import signal
+import threading
+import time
+
+from multiprocessing import cpu_count
+
+from six import text_type
+from six.moves.queue import Queue, Empty
+
+from ..exceptions import ConfigError
+from ..loggers import logger
+from ..models.const import NOT_INDEXED_SOURCE_TYPES
+from ..utils import is_abstract, parse_size
+from .executor import CommandExecutor
+
+
+# indexer default for mem_limit option
+DEFAULT_MEM_LIMIT = 128 * 1024 ** 2
+
+
+def get_pid(engine):
+    pid_file = engine.server.get_option_value('pid_file')
+    if not pid_file:
+        raise ConfigError('searchd pid_file option is required for rotation')
+    with open(pid_file) as f:
+        return int(f.read().strip())
+
+
+def send_sighup(engine):
+    """
+        Makes searchd reload config and rotate indexes
+    """
+    os.kill(get_pid(engine), signal.SIGHUP)
+
+
+class ReindexResult(object):
+    def __init__(self, index, command):
+        self.index = index
+        self.command = command
+        self.returncode = None
+        self.output = ''
+        self.report = None
+        self.cancelled = False
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def name(self):
+        return ' '.join(self.index.get_index_names())
+
+    @property
+    def elapsed(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    def as_dict(self):
+        return {'index': self.name,
+                'command': self.command,
+                'returncode': self.returncode,
+                'elapsed': self.elapsed,
+                'cancelled': self.cancelled,
+                'report': self.report and self.report.as_dict(),
+                'output': self.output}
+
+    def __repr__(self):
+        return 'ReindexResult(%s, returncode=%s, elapsed=%s)' % (self.name,
+                                                                 self.returncode,
+                                                                 self.elapsed)
+
+
+class ReindexScheduler(object):
+    """
+        Rebuilds plain indexes of engine with parallel indexer processes.
+        Every indexer runs with --rotate --nohup, so it only leaves .tmp
+        files. Built indexes are checked with indextool --check --rotate,
+        which renames them to .new, then searchd gets single SIGHUP and
+        rotates all of them at once.
+
+        Number of simultaneous indexers is capped by concurrency (cpu count
+        by default) and by memory/iops budgets divided by indexer
+        mem_limit/max_iops.
+
+    >>> scheduler = ReindexScheduler(engine, mem_budget='8G')
+    >>> results = scheduler.run()
+    >>> [(r.name, r.returncode, r.elapsed) for r in results]
+    """
+    def __init__(self, engine, indexes=None, concurrency=None,
+                 mem_budget=None, iops_budget=None, rotate=True,
+                 timeout=None, **command_options):
+        self.engine = engine
+        self.indexes = indexes
+        self.concurrency = concurrency or cpu_count()
+        self.mem_budget = None if mem_budget is None else parse_size(mem_budget)
+        self.iops_budget = iops_budget
+        self.rotate = rotate
+        self.executor = CommandExecutor(timeout=timeout)
+        self.command_options = command_options
+
+        self.results = []
+        self._processes = set()
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def get_indexes(self):
+        indexes = self.engine.indexes if self.indexes is None else self.indexes
+        indexes = [index for index in indexes
+                   if not is_abstract(index) and
+                   index.__source__.source_type not in NOT_INDEXED_SOURCE_TYPES]
+        return sorted(indexes, key=lambda index: index.__sourcename__)
+
+    def get_max_workers(self):
+        workers = self.concurrency
+        indexer = self.engine.indexer
+
+        if self.mem_budget is not None:
+            mem_limit = DEFAULT_MEM_LIMIT
+            if indexer is not None:
+                mem_limit = parse_size(indexer.get_option_value('mem_limit', mem_limit))
+            workers = min(workers, self.mem_budget // mem_limit)
+
+        if self.iops_budget is not None:
+            max_iops = indexer and indexer.get_option_value('max_iops')
+            if max_iops:
+                workers = min(workers, int(self.iops_budget) // int(max_iops))
+
+        if workers < 1:
+            raise ConfigError('budget is too small for single indexer process')
+        return int(workers)
+
+    def get_command(self, index):
+        return self.engine.commands.reindex(index, rotate=self.rotate,
+                                            nohup=self.rotate,
+                                            **self.command_options)
+
+    def get_rotate_commands(self, index):
+        # indextool checks single index
+        return [self.engine.commands.check(index=name, rotate=True)
+                for name in index.get_index_names()]
+
+    def prepare_rotation(self, result):
+        """
+            Turns .tmp files of built index into .new ones, failed
+            check marks result as failed
+        """
+        for command in self.get_rotate_commands(result.index):
+            command_result = self.executor.run(command)
+            result.output = '\n'.join(filter(None, [result.output, command_result.output]))
+            if not command_result.ok:
+                result.returncode = command_result.returncode
+                logger.error('indextool %s finished with code %s',
+                             result.name, result.returncode)
+                return
+
+    def run_job(self, result):
+        with self._lock:
+            if self._cancelled:
+                result.cancelled = True
+                return
+            process = self.executor.start(result.command)
+            self._processes.add(process)
+
+        try:
+            command_result = process.wait()
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+
+        result.started_at = command_result.started_at
+        result.finished_at = command_result.finished_at
+        result.returncode = command_result.returncode
+        result.output = command_result.output
+        result.report = command_result.report
+        result.cancelled = command_result.cancelled
+
+        log = logger.info if result.ok else logger.error
+        log('indexer %s finished with code %s in %.2fs',
+            result.name, result.returncode, result.elapsed)
+
+    def worker(self, queue):
+        while True:
+            try:
+                result = queue.get_nowait()
+            except Empty:
+                return
+
+            try:
+                self.run_job(result)
+            except OSError as e:
+                result.finished_at = time.time()
+                result.returncode = -1
+                result.output = text_type(e)
+                logger.error('indexer %s failed to start: %s', result.name, e)
+
+    def cancel(self):
+        """
+            Terminates running indexers and skips queued ones,
+            can be called from any thread
+        """
+        with self._lock:
+            self._cancelled = True
+            processes = list(self._processes)
+        for process in processes:
+            process.cancel()
+
+    def send_sighup(self):
+        send_sighup(self.engine)
+
+    def run(self):
+        """
+            Returns ReindexResult list in indexes order
+        """
+        self._cancelled = False
+        self.results = [ReindexResult(index, self.get_command(index))
+                        for index in self.get_indexes()]
+
+        queue = Queue()
+        for result in self.results:
+            queue.put(result)
+
+        threads = [threading.Thread(target=self.worker, args=(queue,))
+                   for _ in range(min(self.get_max_workers(), len(self.results)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if not self.rotate or self._cancelled:
+            return self.results
+
+        for result in self.results:
+            if result.ok:
+                self.prepare_rotation(result)
+
+        rotated = [result for result in self.results if result.ok]
+        if rotated and not self._cancelled:
+            self.send_sighup()
+
+            index_names = []
+            for result in rotated:
+                index_names.extend(result.index.get_index_names())
+            # entries cached while indexers were running are stale as well
+            self.engine.commands.notify_rotate(index_names)
+
+        return self.results
+
+    def get_report(self):
+        return [result.as_dict() for result in self.results]
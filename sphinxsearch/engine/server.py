@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from six import with_metaclass
+from six import text_type, with_metaclass
 
 from ..session import SessionFactory
+from ..session.cache import LocalCache
+from ..session.excerpts import ExcerptBuilder
+from ..session.keywords import KeywordStats
 from ..exceptions import ConfigError
 from .base import OptionableMeta, OptionableBase
 
@@ -50,26 +53,80 @@ class _SearchServerMeta(OptionableMeta):
                'prefork_rotation_throttle']
 
 
+PROTOCOLS = ('sphinx', 'mysql41')
+
+
+def parse_listen(listen):
+    """
+        Returns (host, port, protocol) for 'host:port[:protocol]' and
+        'port[:protocol]' listen specs, None for unix sockets
+
+    >>> parse_listen('127.0.0.1:9306:mysql41')
+    ('127.0.0.1', 9306, 'mysql41')
+    """
+    parts = text_type(listen).split(':')
+
+    protocol = 'sphinx'
+    if parts[-1] in PROTOCOLS:
+        protocol = parts.pop()
+
+    if len(parts) == 1:
+        parts.insert(0, 'localhost')
+    if len(parts) != 2 or not parts[1].isdigit():
+        return None
+
+    host, port = parts
+    return host, int(port), protocol
+
+
 class SearchServer(with_metaclass(_SearchServerMeta, OptionableBase)):
-    option_block_name = 'server'
+    option_block_name = 'searchd'
 
-    def __init__(self, host=None, port=None, listen=None):
+    def __init__(self, host=None, port=None, listen=None, protocol=None, **session_options):
+        """
+            session_options are passed to SessionFactory:
+            pool_size, idle_timeout, max_lifetime, pool_timeout, result_cache,
+            replicas, balancing, failure_threshold, reset_timeout,
+            health_interval, retry_timeout.
+            protocol (or listen suffix) 'mysql41' switches sessions to SphinxQL
+        """
         super(SearchServer, self).__init__()
         self._api = None
+        self.excerpt_builder = None
+        self.keyword_stats = None
+        self.protocol = protocol or 'sphinx'
+
+        if protocol is not None and protocol not in PROTOCOLS:
+            raise ValueError('Unknown protocol %s' % protocol)
 
         if listen and not (host or port):
-            self.listen_str = unicode(listen)
+            self.listen_str = text_type(listen)
+            address = parse_listen(listen)
+            if address is not None:
+                host, port, self.protocol = address
+                self.init_sessions(host, port, session_options)
         elif host and port:
             self.listen_str = '%s:%s' % (host, port)
-            self.host = host
-            self.port = port
-            self.session_maker = SessionFactory()
-            self.session_maker.set_server(self)
+            if protocol is not None:
+                self.listen_str += ':%s' % protocol
+            self.init_sessions(host, port, session_options)
         else:
             raise ValueError('You nust provide host and port or listen')
 
+    def init_sessions(self, host, port, session_options):
+        self.host = host
+        self.port = port
+        self.session_maker = SessionFactory(**session_options)
+        self.session_maker.set_server(self)
+        self.session_options = session_options
+        self._async_session_maker = None
+
     @property
     def api(self):
+        if self.protocol == 'mysql41':
+            from ..session import sphinxql
+            return sphinxql
+
         if self._api is None:
             raise ConfigError("SearchServer instance doesn't provide api")
         return self._api
@@ -77,6 +134,8 @@ class SearchServer(with_metaclass(_SearchServerMeta, OptionableBase)):
     @api.setter
     def api(self, value):
         self._api = value
+        if hasattr(self, 'session_maker'):
+            self.session_maker.reset()
 
     @api.deleter
     def api(self, value):
@@ -88,6 +147,60 @@ class SearchServer(with_metaclass(_SearchServerMeta, OptionableBase)):
     def get_session(self, **kwargs):
         return self.session_maker(**kwargs)
 
+    def get_pool_stats(self):
+        return self.session_maker.get_stats()
+
+    @property
+    def async_session_maker(self):
+        if self.protocol != 'sphinx':
+            raise ConfigError('asyncio sessions require sphinx protocol listener')
+
+        if self.session_options.get('replicas'):
+            raise ConfigError('asyncio sessions do not support replicas')
+
+        if self._async_session_maker is None:
+            from ..session.aio import AsyncSessionFactory, ASYNC_SESSION_OPTIONS
+
+            options = dict((key, value) for key, value in self.session_options.items()
+                           if key in ASYNC_SESSION_OPTIONS)
+            self._async_session_maker = AsyncSessionFactory(**options)
+            self._async_session_maker.set_server(self)
+        return self._async_session_maker
+
+    def get_async_session(self):
+        return self.async_session_maker()
+
+    def invalidate_cache(self, index_names):
+        if hasattr(self, 'session_maker'):
+            self.session_maker.invalidate_cache(index_names)
+        if self.excerpt_builder is not None:
+            self.excerpt_builder.invalidate(index_names)
+        if self.keyword_stats is not None:
+            self.keyword_stats.invalidate(index_names)
+
+    def get_excerpt_builder(self):
+        """
+            excerpt_builder attribute may be set to ExcerptBuilder with
+            other cache or workers
+        """
+        if self.excerpt_builder is None:
+            self.excerpt_builder = ExcerptBuilder(self, cache=LocalCache())
+        return self.excerpt_builder
+
+    def build_excerpts(self, index, docs, words, **options):
+        return self.get_excerpt_builder().build(index, docs, words, **options)
+
+    def get_keyword_stats(self):
+        if self.keyword_stats is None:
+            self.keyword_stats = KeywordStats(self)
+        return self.keyword_stats
+
+    def build_keywords(self, index, queries, hits=False):
+        """
+            Returns keywords lists in queries order
+        """
+        return self.get_keyword_stats().get(index, queries, hits)
+
     def get_options_dict(self):
         opt_dict = super(SearchServer, self).get_options_dict()
         opt_dict['listen'] = self.listen_str
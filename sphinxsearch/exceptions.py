@@ -4,3 +4,30 @@ from __future__ import unicode_literals
 
 class ConfigError(Exception):
     pass
+
+
+class SessionError(Exception):
+    pass
+
+
+class ConnectError(SessionError):
+    pass
+
+
+class PoolTimeout(SessionError):
+    pass
+
+
+class QueryError(SessionError):
+    pass
+
+
+class ReplicaUpdateError(QueryError):
+    """
+        Attributes are not updated on every replica, updated is
+        {(host, port): documents count}, failed is {(host, port): error}
+    """
+    def __init__(self, message, updated, failed):
+        super(ReplicaUpdateError, self).__init__(message)
+        self.updated = updated
+        self.failed = failed
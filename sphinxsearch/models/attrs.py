@@ -1,15 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from six import with_metaclass
+from calendar import timegm
+
+from six import binary_type, text_type, with_metaclass
 
 from abc import ABCMeta, abstractmethod, abstractproperty
 
+from ..utils import Versioned
 from .const import (SQL_SOURCE_TYPE, XML_SOURCE_TYPE, RT_SOURCE_TYPE,
                     RANGE_QUERY_START, RANGE_QUERY_END)
 
 
-class AbstractAttr(with_metaclass(ABCMeta, object)):
+class AbstractAttr(with_metaclass(ABCMeta, Versioned)):
     def __init__(self):
         self.binded = False
         self.name = None
@@ -20,60 +23,134 @@ class AbstractAttr(with_metaclass(ABCMeta, object)):
 
     def bind(self, model, name):
         self.binded = True
+        self.model = model
         self.name = name
 
 
 class AbstractUnitAttr(AbstractAttr):
+    value_type = text_type
+    default = ''
+    min_value = None
+    max_value = None
+
     @abstractproperty  # pragma: no cover
     def type_str():
         """"""
 
-    def get_type(self):
-        source_type = self.model.source_type
+    def clean(self, value):
+        """
+            Converts document value to attr type, raises ValueError
+        """
+        if isinstance(value, binary_type) and self.value_type is text_type:
+            value = value.decode('utf-8')
+        value = self.value_type(value)
+
+        if self.min_value is not None and not self.min_value <= value <= self.max_value:
+            raise ValueError('%s value %s is out of range' % (self.name, value))
+        return value
+
+    def get_type(self, source_type=None):
+        if source_type is None:
+            source_type = self.model.__source__.source_type
         return '%s_attr_%s' % (source_type, self.type_str)
 
-    def get_option(self):
-        return self.get_type(), self.name
+    def get_option(self, attr_name=None, source_type=None):
+        return self.get_type(source_type), attr_name or self.name
 
 
 class Int(AbstractUnitAttr):
     type_str = 'uint'
+    api_const = 'SPH_ATTR_INTEGER'
+    xml_type = 'int'
+    value_type = int
+    default = 0
+    min_value = 0
+    max_value = 2 ** 32 - 1
 
 
 class BigInt(AbstractUnitAttr):
     type_str = 'bigint'
+    api_const = 'SPH_ATTR_BIGINT'
+    xml_type = 'bigint'
+    value_type = int
+    default = 0
+    min_value = -2 ** 63
+    max_value = 2 ** 63 - 1
 
 
 class Bool(AbstractUnitAttr):
     type_str = 'bool'
+    api_const = 'SPH_ATTR_BOOL'
+    xml_type = 'bool'
+    default = 0
+
+    def clean(self, value):
+        return int(bool(value))
 
 
 class Float(AbstractUnitAttr):
     type_str = 'float'
+    api_const = 'SPH_ATTR_FLOAT'
+    xml_type = 'float'
+    value_type = float
+    default = 0.0
 
 
 class TimeStamp(AbstractUnitAttr):
     type_str = 'timestamp'
+    api_const = 'SPH_ATTR_TIMESTAMP'
+    xml_type = 'timestamp'
+    value_type = int
+    default = 0
+    min_value = 0
+    max_value = 2 ** 32 - 1
+
+    def clean(self, value):
+        if hasattr(value, 'timetuple'):
+            value = timegm(value.timetuple())
+        return super(TimeStamp, self).clean(value)
 
 
 class String(AbstractUnitAttr):
     type_str = 'string'
+    api_const = 'SPH_ATTR_STRING'
+    xml_type = 'string'
 
 
 class StringOrd(AbstractUnitAttr):
     type_str = 'str2ordinal'
+    api_const = 'SPH_ATTR_ORDINAL'
+    xml_type = 'str2ordinal'
 
 
 class WordCount(AbstractUnitAttr):
     type_str = 'str2wordcount'
+    api_const = 'SPH_ATTR_INTEGER'
+    xml_type = 'wordcount'
 
 
 class MVA(AbstractAttr):
+    api_const = 'SPH_ATTR_MULTI'
+    default = ()
+
     def __init__(self, attr_type, query=None):
         assert issubclass(attr_type, AbstractUnitAttr), 'attr_type mut be AbstractUnitAttr subtype'
         self.attr_type_str = attr_type.type_str
         self.attr_type = attr_type
         self._query = query
+        self._item_attr = attr_type()
+
+    @property
+    def xml_type(self):
+        if issubclass(self.attr_type, BigInt):
+            return 'multi_64'
+        return 'multi'
+
+    def clean(self, value):
+        """
+            Sorted unique tuple of attr_type values
+        """
+        return tuple(sorted(set(self._item_attr.clean(item) for item in value)))
 
     @property
     def query(self):
@@ -99,7 +176,7 @@ class MVA(AbstractAttr):
             type_postfix = '64'
         else:
             raise RuntimeError('Unknown attr_type: %s' % type(self.attr_type))
-        key = '%s_attr__attr_multimulti%s' % (XML_SOURCE_TYPE, type_postfix)
+        key = '%s_attr_multi%s' % (XML_SOURCE_TYPE, type_postfix)
         return key, attr_name
 
     def get_sql_option(self, attr_name):
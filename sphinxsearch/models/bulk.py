@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from six import binary_type, text_type
+from six.moves.queue import Queue, Empty, Full
+
+from ..exceptions import ConfigError, ConnectError, QueryError
+from ..loggers import logger
+from .const import RT_SOURCE_TYPE
+
+
+DEFAULT_BULK_BATCH_SIZE = 1000
+DEFAULT_BULK_WORKERS = 4
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_DELAY = 0.5
+
+COMMANDS = ('INSERT', 'REPLACE')
+
+_stop = object()
+
+
+class DocumentCleaner(object):
+    """
+        Validates documents against index __attrs__ and __fields__,
+        returns row tuples in columns order
+    """
+    def __init__(self, index):
+        if index.__source__.source_type != RT_SOURCE_TYPE:
+            raise TypeError('%s is not RT index' % index.__name__)
+
+        self.attrs = sorted(index.__attrs__.items())
+        self.fields = tuple(getattr(index, '__fields__', ()))
+        self.columns = ('id',) + self.fields + tuple(name for name, _ in self.attrs)
+        self.known = frozenset(self.columns)
+
+    def clean(self, doc):
+        unknown = set(doc) - self.known
+        if unknown:
+            raise ValueError('unknown columns: %s' % ', '.join(sorted(unknown)))
+
+        doc_id = int(doc['id'])
+        if doc_id <= 0:
+            raise ValueError('document id must be positive, got %s' % doc_id)
+
+        row = [doc_id]
+        for name in self.fields:
+            value = doc.get(name, '')
+            row.append(value.decode('utf-8') if isinstance(value, binary_type) else text_type(value))
+        for name, attr in self.attrs:
+            value = doc.get(name)
+            row.append(attr.default if value is None else attr.clean(value))
+        return tuple(row)
+
+
+class BulkStats(object):
+    def __init__(self):
+        self.rows = 0
+        self.batches = 0
+        self.retries = 0
+        self.started_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def add_batch(self, rows, retries):
+        with self._lock:
+            self.rows += rows
+            self.batches += 1
+            self.retries += retries
+
+    def get_stats(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {'rows': self.rows,
+                'batches': self.batches,
+                'retries': self.retries,
+                'elapsed': elapsed,
+                'rows_per_second': self.rows / elapsed if elapsed else 0.0}
+
+
+class BulkWriter(object):
+    """
+        Streams documents into RT index with multi-row INSERT/REPLACE
+        over pooled SphinxQL connections. Batches are built in caller thread
+        and consumed by workers through bounded queue, so caller blocks
+        when workers fall behind.
+
+    >>> writer = BulkWriter(Products, server.session_maker.pool, workers=4)
+    >>> writer.run(iter_documents())
+    {'rows': 100000, 'batches': 100, ...}
+    """
+    def __init__(self, index, pool, command='INSERT',
+                 batch_size=DEFAULT_BULK_BATCH_SIZE,
+                 workers=DEFAULT_BULK_WORKERS,
+                 max_pending=None,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 retry_delay=DEFAULT_RETRY_DELAY):
+        if command not in COMMANDS:
+            raise ValueError('command must be one of %s' % ', '.join(COMMANDS))
+        if batch_size < 1 or workers < 1:
+            raise ValueError('batch_size and workers must be positive')
+        if not hasattr(pool.api.SphinxClient, 'Execute'):
+            raise ConfigError('bulk writes require SphinxQL connections, '
+                              'searchd %s:%s must listen with mysql41 protocol'
+                              % (pool.host, pool.port))
+
+        self.index_name = index.get_index_names()[0]
+        self.cleaner = DocumentCleaner(index)
+        self.pool = pool
+        self.command = command
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_pending = max_pending or workers * 2
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+        self.stats = None
+        self._error = None
+
+    def get_statement(self, rows):
+        row_sql = '(%s)' % ', '.join(['%s'] * len(self.cleaner.columns))
+        sql = '%s INTO %s (%s) VALUES %s' % (self.command,
+                                             self.index_name,
+                                             ', '.join(self.cleaner.columns),
+                                             ', '.join([row_sql] * len(rows)))
+        params = []
+        for row in rows:
+            params.extend(row)
+        return sql, tuple(params)
+
+    def iter_batches(self, docs):
+        batch = []
+        for doc in docs:
+            batch.append(self.cleaner.clean(doc))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def execute(self, rows):
+        """
+            Sends one batch, reconnecting on connection errors,
+            returns retries count
+        """
+        sql, params = self.get_statement(rows)
+        retries = 0
+
+        while True:
+            conn = None
+            try:
+                conn = self.pool.acquire()
+                if conn.client.Execute(sql, params) is not None:
+                    return retries
+
+                error = conn.client.GetLastError()
+                if not conn.client.IsConnectError():
+                    raise QueryError(error)
+                conn.broken = True
+            except ConnectError as e:
+                error = text_type(e)
+            finally:
+                if conn is not None:
+                    self.pool.release(conn)
+
+            if retries >= self.max_retries:
+                raise ConnectError(error)
+
+            retries += 1
+            logger.warning('Bulk %s into %s failed (%s), retry %s',
+                           self.command, self.index_name, error, retries)
+            time.sleep(self.retry_delay * 2 ** (retries - 1))
+
+    def worker(self, queue):
+        while True:
+            rows = queue.get()
+            if rows is _stop:
+                return
+            if self._error is not None:
+                continue
+
+            try:
+                retries = self.execute(rows)
+            except Exception as e:
+                self._error = e
+            else:
+                self.stats.add_batch(len(rows), retries)
+
+    def put(self, queue, item):
+        # stop waiting for free slot once some worker failed
+        while self._error is None:
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def run(self, docs):
+        """
+            Returns stats dict, raises first validation or write error
+        """
+        self.stats = BulkStats()
+        self._error = None
+
+        queue = Queue(self.max_pending)
+        threads = [threading.Thread(target=self.worker, args=(queue,))
+                   for _ in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            for rows in self.iter_batches(docs):
+                if not self.put(queue, rows):
+                    break
+        finally:
+            if self._error is not None:
+                # drop pending batches, workers are going to stop anyway
+                try:
+                    while True:
+                        queue.get_nowait()
+                except Empty:
+                    pass
+            for _ in threads:
+                queue.put(_stop)
+            for thread in threads:
+                thread.join()
+            self.stats.finished_at = time.time()
+
+        if self._error is not None:
+            raise self._error
+        return self.stats.get_stats()
+
+
+def bulk_write(index, server, docs, command, **options):
+    pool = server.session_maker.pool
+    writer = BulkWriter(index, pool, command, **options)
+    return writer.run(docs)
@@ -5,6 +5,10 @@ SQL_SOURCE_TYPE = 'sql'
 XML_SOURCE_TYPE = 'xmlpipe'
 XML1_SOURCE_TYPE = 'xmlpipe2'
 RT_SOURCE_TYPE = 'rt'
+DISTRIBUTED_SOURCE_TYPE = 'distributed'
+
+# indexes which are not built by indexer
+NOT_INDEXED_SOURCE_TYPES = (RT_SOURCE_TYPE, DISTRIBUTED_SOURCE_TYPE)
 
 RANGE_QUERY_START = '$start'
 RANGE_QUERY_END = '$end'
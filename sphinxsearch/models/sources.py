@@ -4,14 +4,28 @@ from abc import ABCMeta
 from six import with_metaclass
 
 from .attrs import AbstractAttr
+from .bulk import bulk_write
 from .types import AbstractIndexType
-from ..utils import is_abstract, set_abstract
+from ..utils import is_abstract, set_abstract, next_version
 
 
 class IndexBase(object):
     __abstract__ = True
 
 
+def get_class_attrs(src_cls):
+    """
+        Public class attributes including inherited ones,
+        same as dir() scan without sorting and getattr calls
+    """
+    cls_attrs = {}
+    for klass in reversed(src_cls.__mro__):
+        for name, value in vars(klass).items():
+            if not name.startswith('__'):
+                cls_attrs[name] = value
+    return cls_attrs
+
+
 class IndexMeta(ABCMeta):
     def __new__(cls, cls_name, cls_parents, cls_dict):
         src_cls = ABCMeta.__new__(cls, cls_name, cls_parents, cls_dict)
@@ -23,16 +37,13 @@ class IndexMeta(ABCMeta):
 
         set_abstract(src_cls, is_abc)
 
-        cls_attr_names = [nm for nm in dir(src_cls) if not nm.startswith('__')]
-
-        cls_dict = dict([(name, getattr(src_cls, name)) for name in cls_attr_names])
-
         if not is_abstract(src_cls):
             cls.validate(src_cls)
             source_attrs_dict = {}
 
-            for name, attr in cls_dict.items():
+            for name, attr in get_class_attrs(src_cls).items():
                 if isinstance(attr, AbstractAttr):
+                    attr.bind(src_cls, name)
                     source_attrs_dict[name] = attr
 
             src_cls.__attrs__ = source_attrs_dict
@@ -42,6 +53,25 @@ class IndexMeta(ABCMeta):
 
         return src_cls
 
+    def __setattr__(cls, name, value):
+        if isinstance(value, AbstractAttr) and not is_abstract(cls):
+            value.bind(cls, name)
+            attrs = dict(cls.__attrs__)
+            attrs[name] = value
+            ABCMeta.__setattr__(cls, '__attrs__', attrs)
+
+        ABCMeta.__setattr__(cls, name, value)
+        # config of index has to be generated again
+        ABCMeta.__setattr__(cls, '__config_version__', next_version())
+
+    def __delattr__(cls, name):
+        ABCMeta.__delattr__(cls, name)
+        if name in getattr(cls, '__attrs__', {}):
+            attrs = dict(cls.__attrs__)
+            del attrs[name]
+            ABCMeta.__setattr__(cls, '__attrs__', attrs)
+        ABCMeta.__setattr__(cls, '__config_version__', next_version())
+
     @classmethod
     def get_source_name(cls, index_cls):
         name = index_cls.__name__
@@ -68,16 +98,48 @@ class Index(with_metaclass(IndexMeta, IndexBase)):
 
         attr_conf_options = {}
 
-        for name, attr in cls.__attrs__.items():
+        # sphinx config repeats key for every attr of the same type
+        for name, attr in sorted(cls.__attrs__.items()):
             key, value = attr.get_option(name, source_type)
-            attr_conf_options[key] = value
+            attr_conf_options.setdefault(key, []).append(value)
 
         return cls.__source__.get_option_dicts(cls, attr_conf_options)
 
+    @classmethod
+    def get_config_version(cls):
+        """
+            Changes whenever index attrs or source options are changed,
+            in place changes of __attrs__ and attr or source objects too
+        """
+        return (cls.__config_version__, cls.__source__.get_config_version(),
+                tuple((name, id(attr), attr.get_config_version())
+                      for name, attr in sorted(cls.__attrs__.items())))
+
+    @classmethod
+    def bulk_insert(cls, server, docs, **options):
+        """
+            Writes documents (dicts with id, __fields__ and __attrs__ keys)
+            into RT index through SphinxQL server with multi-row INSERT.
+            options: batch_size, workers, max_pending, max_retries, retry_delay
+        """
+        return bulk_write(cls, server, docs, 'INSERT', **options)
+
+    @classmethod
+    def bulk_replace(cls, server, docs, **options):
+        """
+            Same as bulk_insert with REPLACE, existing documents are overwritten
+        """
+        return bulk_write(cls, server, docs, 'REPLACE', **options)
+
+    @classmethod
+    def get_delta_name(cls):
+        if not cls.__delta__:
+            return None
+        return '%s_delta' % cls.__sourcename__
+
     @classmethod
     def get_index_names(cls):
         names = (cls.__sourcename__,)
         if cls.__delta__:
-            delta_index_name = '{}_delta : {}'.format(cls.__sourcename__)
-            names = names + (delta_index_name,)
+            names = names + (cls.get_delta_name(),)
         return names
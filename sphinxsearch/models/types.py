@@ -1,19 +1,21 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, print_function
 
-from six import with_metaclass
+from six import string_types, text_type, with_metaclass
 
 from abc import ABCMeta, abstractmethod, abstractproperty
 
-from .const import RT_SOURCE_TYPE, SQL_SOURCE_TYPE, XML_SOURCE_TYPE
+from .const import (RT_SOURCE_TYPE, SQL_SOURCE_TYPE, XML_SOURCE_TYPE,
+                    XML1_SOURCE_TYPE, DISTRIBUTED_SOURCE_TYPE)
+from ..utils import Versioned
 
 
 __all__ = ['RT', 'ODBC', 'XML', 'MysqlCertificate',
-           'MysqlSource', 'MssqlSource', 'PgsqlSource']
+           'MysqlSource', 'MssqlSource', 'PgsqlSource',
+           'Agent', 'Distributed']
 
 
-class AbstractIndexType(with_metaclass(ABCMeta, object)):
-
+class AbstractIndexType(with_metaclass(ABCMeta, Versioned)):
     @abstractmethod  # pragma: no cover
     def get_option_dicts(index, attrs_conf):
         """"""
@@ -34,7 +36,7 @@ class RT(AbstractIndexType):
             options['type'] = self.source_type
             options.update(attrs_options)
 
-            option_dicts[index_name] = options
+            option_dicts['index %s' % index_name] = options
 
         return option_dicts
 
@@ -46,7 +48,9 @@ class AbstractSourceType(AbstractIndexType):
 
         for index_name in index.get_index_names():
             source_name = index_name
-            option_dicts['source %s' % source_name] = attrs_options
+            source_options = self.get_source_options()
+            source_options.update(attrs_options)
+            option_dicts['source %s' % source_name] = source_options
 
             index_options = self.get_index_options(index)
             index_options['source'] = source_name
@@ -54,9 +58,8 @@ class AbstractSourceType(AbstractIndexType):
 
         return option_dicts
 
-    def get_source_options(self, index, attrs_options):
-        print(attrs_options)
-        return attrs_options
+    def get_source_options(self):
+        return {}
 
     def get_index_options(self, index):
         return {}
@@ -79,15 +82,28 @@ class XML(AbstractSourceType):
         self.command = command
         self.fixup_utf8 = fixup_utf8
 
-    def get_option_dicts(self):
+    def get_option_dicts(self, index, attrs_options):
+        # schema is sent in-stream by xmlpipe command, see models.xmlpipe
         option_dicts = {}
 
+        for index_name in index.get_index_names():
+            source_options = {'type': XML1_SOURCE_TYPE}
+            source_options.update(self.get_source_options())
+            option_dicts['source %s' % index_name] = source_options
+
+            index_options = self.get_index_options(index)
+            index_options['source'] = index_name
+            option_dicts['index %s' % index_name] = index_options
+
+        return option_dicts
+
+    def get_source_options(self):
         source_options = {}
         source_options['%s_command' % self.source_type] = self.command
         if self.fixup_utf8 is not None:
             source_options['xmlpipe_fixup_utf8'] = int(bool(self.fixup_utf8))
 
-        return option_dicts
+        return source_options
 
 
 class BaseDB(AbstractSourceType):
@@ -120,7 +136,7 @@ class BaseDB(AbstractSourceType):
         return source_options
 
 
-class MysqlCertificate(object):
+class MysqlCertificate(Versioned):
     def __init__(self, cert, key, ca):
         self.cert = cert
         self.key = key
@@ -139,6 +155,10 @@ class MysqlSource(BaseDB):
         self.certificate = kwargs.get('certificate')
         super(MysqlSource, self).__init__('mysql', *args, **kwargs)
 
+    def get_config_version(self):
+        return (self.__config_version__,
+                self.certificate and self.certificate.get_config_version())
+
     def get_source_options(self):
         source_options = super(MysqlSource, self).get_source_options()
         if self.certificate:
@@ -169,4 +189,107 @@ class PgsqlSource(BaseDB):
         super(PgsqlSource, self).__init__('pgsql', *args, **kwargs)
 
 
+def get_index_names(index):
+    if isinstance(index, string_types):
+        return [text_type(index)]
+    return list(index.get_index_names())
+
+
+class Agent(Versioned):
+    """
+        Remote shard of distributed index: indexes served by SearchServer,
+        several servers are mirrors of the same shard
+
+    >>> Agent(ProductsShard1, node1, node2)
+    """
+    def __init__(self, index, *servers, **kwargs):
+        if not servers:
+            raise ValueError('agent requires at least one server')
+
+        self.index = index
+        self.servers = servers
+        self.blackhole = kwargs.pop('blackhole', False)
+        if kwargs:
+            raise TypeError('unknown options: %s' % ', '.join(kwargs))
+
+    def get_index_names(self):
+        return get_index_names(self.index)
+
+    def get_config_version(self):
+        return (self.__config_version__,
+                tuple((server.host, server.port) for server in self.servers))
+
+    def get_option(self):
+        mirrors = '|'.join('%s:%s' % (server.host, server.port) for server in self.servers)
+        return '%s:%s' % (mirrors, ','.join(self.get_index_names()))
+
+
+class Distributed(AbstractIndexType):
+    """
+        Index of type = distributed, searches local indexes and agents
+        on other searchd nodes in parallel
+
+    >>> class Products(Index):
+    ...     __source__ = Distributed(local=[Products0],
+    ...                              agents=[Agent(Products1, node1),
+    ...                                      Agent(Products2, node2, node3)],
+    ...                              persistent=True, ha_strategy='nodeads')
+    """
+    source_type = DISTRIBUTED_SOURCE_TYPE
+
+    def __init__(self, local=(), agents=(), persistent=False, ha_strategy=None,
+                 connect_timeout=None, query_timeout=None):
+        if not local and not agents:
+            raise ValueError('distributed index requires local indexes or agents')
+
+        self.local = tuple(local)
+        self.agents = tuple(agents)
+        self.persistent = persistent
+        self.ha_strategy = ha_strategy
+        self.connect_timeout = connect_timeout
+        self.query_timeout = query_timeout
+
+    def get_config_version(self):
+        return (self.__config_version__,
+                tuple(agent.get_config_version() for agent in self.agents))
+
+    def get_local_names(self):
+        names = []
+        for index in self.local:
+            names.extend(get_index_names(index))
+        return names
+
+    def get_servers(self):
+        servers = []
+        for agent in self.agents:
+            for server in agent.servers:
+                if server not in servers:
+                    servers.append(server)
+        return servers
+
+    def get_server_indexes(self, server):
+        """
+            Agent indexes served by server, for building config of that node
+        """
+        return [agent.index for agent in self.agents if server in agent.servers]
+
+    def get_option_dicts(self, index, attrs_options):
+        options = {'type': self.source_type}
+
+        local = self.get_local_names()
+        if local:
+            options['local'] = local
+
+        agent_key = 'agent_persistent' if self.persistent else 'agent'
+        for agent in self.agents:
+            key = 'agent_blackhole' if agent.blackhole else agent_key
+            options.setdefault(key, []).append(agent.get_option())
+
+        if self.ha_strategy is not None:
+            options['ha_strategy'] = self.ha_strategy
+        if self.connect_timeout is not None:
+            options['agent_connect_timeout'] = self.connect_timeout
+        if self.query_timeout is not None:
+            options['agent_query_timeout'] = self.query_timeout
 
+        return {'index %s' % index.__sourcename__: options}
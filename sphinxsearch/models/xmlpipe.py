@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+    Streaming xmlpipe2 producer driven by Index model attrs.
+
+    Index with XML source can point indexer to console script:
+
+    >>> XML(command=get_command('myapp.indexes:Products', 'myapp.feeds:iter_products'))
+
+    which runs `sphinxsearch-xmlpipe myapp.indexes:Products myapp.feeds:iter_products`.
+"""
+from __future__ import unicode_literals
+
+import argparse
+import re
+import sys
+
+from importlib import import_module
+from xml.sax.saxutils import escape, quoteattr
+
+from six import binary_type, text_type
+
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+CONSOLE_SCRIPT = 'sphinxsearch-xmlpipe'
+
+# characters not allowed in XML 1.0 documents
+RE_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def to_text(value):
+    if isinstance(value, binary_type):
+        value = value.decode('utf-8', 'replace')
+    return RE_INVALID_XML_CHARS.sub(' ', text_type(value))
+
+
+class XMLPipeWriter(object):
+    """
+        Writes xmlpipe2 stream into binary file object, output is flushed
+        every buffer_size bytes, so memory does not depend on documents count
+
+    >>> with XMLPipeWriter(Products, sys.stdout.buffer) as writer:
+    ...     writer.write_documents(iter_products())
+    ...     writer.write_killlist([1, 2, 3])
+    """
+    def __init__(self, index, stream, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.index = index
+        self.stream = stream
+        self.buffer_size = buffer_size
+
+        self.fields = tuple(getattr(index, '__fields__', ()))
+        self.attrs = sorted(index.__attrs__.items())
+
+        self.documents = 0
+        self._buffer = []
+        self._buffered = 0
+        self._started = False
+        self._closed = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.flush()
+
+    def write(self, data):
+        data = data.encode('utf-8')
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.stream.write(b''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+        self.stream.flush()
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+
+        self.write('<?xml version="1.0" encoding="utf-8"?>\n<sphinx:docset>\n')
+        self.write_schema()
+
+    def write_schema(self):
+        lines = ['<sphinx:schema>']
+        for name in self.fields:
+            lines.append('<sphinx:field name=%s/>' % quoteattr(name))
+        for name, attr in self.attrs:
+            lines.append('<sphinx:attr name=%s type=%s/>' % (quoteattr(name),
+                                                            quoteattr(attr.xml_type)))
+        lines.append('</sphinx:schema>\n')
+        self.write('\n'.join(lines))
+
+    def get_value(self, attr, value):
+        value = attr.clean(value)
+        if isinstance(value, tuple):
+            return ','.join(map(text_type, value))
+        return to_text(value)
+
+    def write_document(self, doc):
+        self.start()
+
+        doc_id = int(doc['id'])
+        if doc_id <= 0:
+            raise ValueError('document id must be positive, got %s' % doc_id)
+
+        lines = ['<sphinx:document id="%d">' % doc_id]
+        for name in self.fields:
+            value = doc.get(name)
+            if value is not None:
+                lines.append('<%s>%s</%s>' % (name, escape(to_text(value)), name))
+        for name, attr in self.attrs:
+            value = doc.get(name)
+            if value is not None:
+                lines.append('<%s>%s</%s>' % (name, escape(self.get_value(attr, value)), name))
+        lines.append('</sphinx:document>\n')
+
+        self.write('\n'.join(lines))
+        self.documents += 1
+
+    def write_documents(self, docs):
+        for doc in docs:
+            self.write_document(doc)
+
+    def write_killlist(self, ids):
+        self.start()
+
+        self.write('<sphinx:killlist>\n')
+        for doc_id in ids:
+            self.write('<id>%d</id>\n' % int(doc_id))
+        self.write('</sphinx:killlist>\n')
+
+    def close(self):
+        if self._closed:
+            return
+        self.start()
+        self._closed = True
+
+        self.write('</sphinx:docset>\n')
+        self.flush()
+
+
+def load_object(path):
+    """
+        'package.module:name' -> object
+    """
+    module_name, _, name = path.partition(':')
+    if not name:
+        raise ValueError('expected module:name, got %s' % path)
+    return getattr(import_module(module_name), name)
+
+
+def get_command(index_path, docs_path, killlist_path=None):
+    """
+        xmlpipe_command value for XML source type
+    """
+    parts = [CONSOLE_SCRIPT, index_path, docs_path]
+    if killlist_path:
+        parts.extend(['--killlist', killlist_path])
+    return ' '.join(parts)
+
+
+def main(argv=None, stream=None):
+    parser = argparse.ArgumentParser(prog=CONSOLE_SCRIPT,
+                                     description='Write xmlpipe2 stream for sphinxsearch Index')
+    parser.add_argument('index', help='index class, module:Name')
+    parser.add_argument('docs', help='callable returning documents iterable, module:name')
+    parser.add_argument('--killlist', help='callable returning ids iterable, module:name')
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_BUFFER_SIZE)
+    args = parser.parse_args(argv)
+
+    if stream is None:
+        stream = getattr(sys.stdout, 'buffer', sys.stdout)
+
+    index = load_object(args.index)
+    docs = load_object(args.docs)
+
+    with XMLPipeWriter(index, stream, args.buffer_size) as writer:
+        writer.write_documents(docs())
+        if args.killlist:
+            writer.write_killlist(load_object(args.killlist)())
+
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
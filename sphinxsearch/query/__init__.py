@@ -1,28 +1,40 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from six import string_types
+from operator import itemgetter
+from sys import maxsize
 
+from six import string_types, text_type
+
+from ..exceptions import QueryError
 from ..models.attrs import AbstractAttr
-from ..utils.cmd_tools import requires_kwarg
+from ..session.results import ResultSet
+from ..utils.persistent import PersistentMap
+from .facets import FacetSearch, DEFAULT_FACET_LIMIT
 from .groupby import GroupByOperator
-from .filters import BaseFilterOperator, Any
-from .orderby import AbtractSortMode, Attr
+from .filters import BaseFilterOperator, All, Any, IDRange
+from .optimizer import NOTHING, intersect_id_ranges, iter_ops, optimize_filter
+from .orderby import AbtractSortMode, Attr, Relevance
+from .scroll import iterate_by_id, DEFAULT_BATCH_SIZE
+
+
+DEFAULT_LIMIT = 20
 
 
 class QuerySettingsMixin(object):
     def setUp(self):
         self.offset = 0
-        self.limit = 0
+        self.limit = DEFAULT_LIMIT
         self.max_matches = 0
         self.cutoff = 0
 
         self.timeout = 0
-        self.overrides = {}
+        self.overrides = PersistentMap()
         self.select = '*'
+        self.cache_ttl = None
 
     def set_override(self, attr_name, attr_type, update_dict):
-        self.overrides[(attr_name, attr_type)] = update_dict
+        self.overrides = self.overrides.set((attr_name, attr_type), update_dict)
 
     def set_limit(self, offset, limit, max_matches, cutoff):
         self.offset = offset
@@ -33,17 +45,55 @@ class QuerySettingsMixin(object):
     def set_timeout(self, milliseconds):
         self.timeout = milliseconds
 
+    def set_cache_ttl(self, ttl):
+        self.cache_ttl = ttl
+
     def set_select(self, fields):
         self.select = fields
 
+    def get_select(self):
+        if isinstance(self.select, string_types):
+            return self.select
+        return ', '.join(self.select)
+
 
 class FilterMixin(object):
     def setUp(self):
-        self.filters = {}
+        self.filters = PersistentMap()
         self.geo_anchor = None
+        self.matches_nothing = False
 
     def add_filter(self, attr_name, filter_op):
-        self.filters[attr_name] = filter_op
+        """
+            Filters of the same attr are intersected with All
+        """
+        current = self.filters.get(attr_name)
+        if current is not None:
+            filter_op = All(*(iter_ops(current) + iter_ops(filter_op)))
+        self.filters = self.filters.set(attr_name, filter_op)
+
+    def set_filter(self, attr_name, filter_op):
+        self.filters = self.filters.set(attr_name, filter_op)
+
+    def remove_filter(self, attr_name):
+        self.filters = self.filters.remove(attr_name)
+
+    def pop_id_ranges(self):
+        """
+            Removes IDRange filters of all attrs, returns them
+        """
+        id_ranges = []
+        for attr_name, op in self.get_filters():
+            ops = iter_ops(op)
+            rest = [sub_op for sub_op in ops if not isinstance(sub_op, IDRange)]
+            if len(rest) == len(ops):
+                continue
+
+            id_ranges.extend(sub_op for sub_op in ops if isinstance(sub_op, IDRange))
+            self.remove_filter(attr_name)
+            if rest:
+                self.set_filter(attr_name, rest[0] if len(rest) == 1 else All(*rest))
+        return id_ranges
 
     def set_geo_anchor(self, lat_field, long_field, lat, long):
         self.geo_anchor = (lat_field, long_field, lat, long)
@@ -51,7 +101,7 @@ class FilterMixin(object):
 
 class SearchSettingsMixin(object):
     def setUp(self):
-        self.sort_modes = []
+        self.sort_mode = None
 
     def set_sort_mode(self, sort_mode):
         self.sort_mode = sort_mode
@@ -79,7 +129,8 @@ class UpdateMixin(object):
         self.values = values
 
 
-class QueryBackend(QuerySettingsMixin, FilterMixin, GroupBySettingsMixin, UpdateMixin):
+class QueryBackend(QuerySettingsMixin, FilterMixin, SearchSettingsMixin,
+                   GroupBySettingsMixin, UpdateMixin):
     def __init__(self, indexes_str):
         self.indexes_str = indexes_str
         self.term = ''
@@ -90,21 +141,152 @@ class QueryBackend(QuerySettingsMixin, FilterMixin, GroupBySettingsMixin, Update
         GroupBySettingsMixin.setUp(self)
         UpdateMixin.setUp(self)
 
+    def set_term(self, term):
+        self.term = term
+
+    def clone(self):
+        """
+            filters and overrides are persistent maps shared with
+            the clone, so cloning costs O(1) regardless of query size
+        """
+        new_instance = self.__class__.__new__(self.__class__)
+        new_instance.__dict__ = self.__dict__.copy()
+        return new_instance
+
+    def get_filters(self):
+        return sorted(self.filters.items(), key=itemgetter(0))
+
+    def fit_filters(self, max_filter_values):
+        """
+            Returns backend with filters fitting searchd max_filter_values,
+            self when nothing changes
+        """
+        fitted = self
+        for attr_name, op in self.get_filters():
+            fitted_op = op.fit(attr_name, max_filter_values)
+            if fitted_op is not op:
+                if fitted is self:
+                    fitted = self.clone()
+                fitted.set_filter(attr_name, fitted_op)
+        return fitted.merge_id_ranges()
+
+    def merge_id_ranges(self):
+        """
+            searchd keeps only last SetIDRange of query, so IDRange
+            filters of all attrs are intersected into single one.
+            Returns self when there is at most one IDRange.
+        """
+        count = sum(isinstance(sub_op, IDRange)
+                    for _, op in self.get_filters() for sub_op in iter_ops(op))
+        if count < 2:
+            return self
+
+        merged = self.clone()
+        id_range = intersect_id_ranges(merged.pop_id_ranges())
+        if id_range is NOTHING:
+            merged.matches_nothing = True
+        else:
+            merged.add_filter('@id', id_range)
+        return merged
+
+    def optimize_filters(self):
+        """
+            Returns backend with optimized filters, self when nothing
+            changes. matches_nothing is set when filters can not match.
+        """
+        optimized = self
+        for attr_name, op in self.get_filters():
+            optimized_op = optimize_filter(attr_name, op)
+            if optimized_op is op:
+                continue
+
+            if optimized is self:
+                optimized = self.clone()
+            if optimized_op is NOTHING:
+                optimized.matches_nothing = True
+            elif optimized_op is None:
+                optimized.remove_filter(attr_name)
+            else:
+                optimized.set_filter(attr_name, optimized_op)
+        return optimized.merge_id_ranges()
+
+    def get_overrides(self):
+        return sorted(self.overrides.items(), key=itemgetter(0))
+
+    def get_key(self):
+        """
+            Hashable state of query, result cache key
+        """
+        return (self.indexes_str, self.term, self.offset, self.limit, self.max_matches,
+                self.cutoff, self.timeout, self.get_select(), repr(self.sort_mode),
+                repr(self.group_by), self.group_by_distinct, self.geo_anchor,
+                tuple((attr_name, op.get_key()) for attr_name, op in self.get_filters()),
+                tuple(self.get_overrides()))
+
+    def apply(self, api, client):
+        """
+            Replays backend state against sphinxapi client and queues
+            it with AddQuery
+        """
+        client.ResetFilters()
+        client.ResetGroupBy()
+        client.ResetOverrides()
+        client.SetIDRange(0, 0)
+
+        client.SetLimits(self.offset, self.limit, self.max_matches, self.cutoff)
+        client.SetMaxQueryTime(self.timeout)
+        client.SetSelect(self.get_select())
+
+        for attr_name, filter_op in self.get_filters():
+            filter_op.apply(client, attr_name)
+
+        if self.geo_anchor is not None:
+            client.SetGeoAnchor(*self.geo_anchor)
+
+        if self.sort_mode is None:
+            Relevance.reset(api, client)
+        else:
+            self.sort_mode.apply(api, client)
+
+        if self.group_by is not None:
+            self.group_by.apply(api, client)
+        if self.group_by_distinct is not None:
+            client.SetGroupDistinct(self.group_by_distinct)
+
+        for (attr_name, attr_type), values in self.get_overrides():
+            client.SetOverride(attr_name, getattr(api, attr_type), values)
+
+        client.AddQuery(self.term, self.indexes_str)
+
     def result_handler(self, *args, **kwargs):
         if self.handler:
             return self.handler(*args, **kwargs)
 
-    def build_excerpts(self, docs, words, **options):
-        pass
+    def get_main_index(self):
+        """
+            First index of query, its tokenizer settings are used
+            for excerpts and keywords
+        """
+        index = self.indexes_str.split()[0]
+        if index == '*':
+            raise QueryError('excerpts and keywords require index name')
+        return index
+
+    def build_excerpts(self, server, docs, words, options):
+        return server.build_excerpts(self.get_main_index(), docs, words, **options)
+
+    def build_keywords(self, server, queries, hits):
+        return server.build_keywords(self.get_main_index(), queries, hits)
 
 
 
 def clone_method(method):
     def wrapper(self, *args, **kwargs):
-        if self._clonable:
+        if not self._clonable:
             raise RuntimeError('Not clonable')
-        method(self, *args, **kwargs)
-        return self.clone()
+        new_instance = self.clone()
+        method(new_instance, *args, **kwargs)
+        return new_instance
     return wrapper
 
 
@@ -112,20 +294,27 @@ class Query(object):
 
     def __init__(self, index):
         if isinstance(index, string_types):
-            indexes_str = unicode(index)
+            indexes_str = text_type(index)
         else:
-            self.index = index
-            indexes_str = index.get_index_names()
+            indexes_str = ' '.join(index.get_index_names())
 
-        self._index = index
+        self.index = index
         self.query = QueryBackend(indexes_str)
         self._clonable = True
 
+    def clone(self):
+        new_instance = self.__class__.__new__(self.__class__)
+        new_instance.__dict__ = self.__dict__.copy()
+        new_instance.query = self.query.clone()
+        return new_instance
+
     @clone_method
     def filter(self, **filters):
         """
+            SetFilter, SetFilterRange, SetFilterFloatRange, SetIDRange,
+            filters of already filtered attr are intersected
         """
-        for attr_name, attr_filter in filters:
+        for attr_name, attr_filter in filters.items():
             if not isinstance(attr_filter, BaseFilterOperator):
                 attr_filter = Any(attr_filter)
 
@@ -134,7 +323,7 @@ class Query(object):
     @clone_method
     def orderby(self, value):
         if not isinstance(value, AbtractSortMode):
-            value = Attr(unicode(value))
+            value = Attr(text_type(value))
         self.query.set_sort_mode(value)
 
     @clone_method
@@ -149,33 +338,46 @@ class Query(object):
         """
             SetGeoAnchor
         """
-        self.query.set_geo_anchor(unicode(lat_field),
-                                  unicode(long_field),
+        self.query.set_geo_anchor(text_type(lat_field),
+                                  text_type(long_field),
                                   float(lat),
                                   float(long))
 
     @clone_method
     def like(self, query):
-        pass
-
-    @clone_method
-    def __getitem__(self, i):
         """
-            SetLimits
+            Full-text query term passed to AddQuery
         """
-        self.query.set_limit(int(i), int(i) + 1)
+        self.query.set_term(query)
 
     @clone_method
-    def __getslice__(self, start, end):
+    def __getitem__(self, i):
         """
             SetLimits
         """
-        offset = self.query.offset + start
-        limit = self.query.limit - (end - start)
+        if isinstance(i, slice):
+            start = int(i.start or 0)
+            offset = self.query.offset + start
+            if i.stop is None:
+                limit = self.query.limit
+            else:
+                limit = int(i.stop) - start
+        else:
+            offset = self.query.offset + int(i)
+            limit = 1
+
+        if limit <= 0:
+            raise IndexError('empty slices are not supported')
+
         max_matches = self.query.max_matches
         cutoff = self.query.cutoff
         self.query.set_limit(offset, limit, max_matches, cutoff)
 
+    def __getslice__(self, start, end):
+        if end == maxsize:
+            end = None
+        return self.__getitem__(slice(start, end))
+
     @clone_method
     def max(self, value):
         """
@@ -187,35 +389,31 @@ class Query(object):
         cutoff = self.query.cutoff
         self.query.set_limit(offset, limit, max_matches, cutoff)
 
-    @clone_method
     def add_max(self, value):
         max_matches = self.query.max_matches + int(value)
-        self.max(max_matches)
+        return self.max(max_matches)
 
-    @clone_method
     def pop_max(self, value):
         max_matches = self.query.max_matches - int(value)
         assert max_matches
-        self.max(max_matches)
+        return self.max(max_matches)
 
     @clone_method
     def cutoff(self, value):
         offset = self.query.offset
         limit = self.query.limit
-        max_matches = self.max_matches
+        max_matches = self.query.max_matches
         cutoff = int(value)
         self.query.set_limit(offset, limit, max_matches, cutoff)
 
-    @clone_method
     def add_cutoff(self, value):
         cutoff = self.query.cutoff + int(value)
-        self.cutoff(cutoff)
+        return self.cutoff(cutoff)
 
-    @clone_method
     def pop_cutoff(self, value):
         cutoff = self.query.cutoff - int(value)
         assert cutoff
-        self.cutoff(cutoff)
+        return self.cutoff(cutoff)
 
     @clone_method
     # query result options
@@ -240,20 +438,24 @@ class Query(object):
 
     @clone_method
     def override(self, attr, attr_type=None, **update_dict):
+        """
+            SetOverride, attr_type is sphinxapi SPH_ATTR_* constant name
+        """
         if isinstance(attr, AbstractAttr):
             attr_name = attr.name
-            attr_type = attr.get_type()
+            attr_type = attr.api_const
         else:
-            attr_name = unicode(attr_name)
-            if not isinstance(attr_type):
+            attr_name = text_type(attr)
+            if not isinstance(attr_type, string_types):
                 raise TypeError('Argument attr_type required')
-            attr_type = unicode(attr_type)
+            attr_type = text_type(attr_type)
 
-        if not update_dict:
-            self.query.set_override(attr, attr_type, update_dict)
+        if update_dict:
+            values = dict((int(k), v) for k, v in update_dict.items())
+            self.query.set_override(attr_name, attr_type, values)
 
     def update(self, **update_dict):
-        new_inctance = self._clone()
+        new_inctance = self.clone()
         new_inctance.parent = self
         new_inctance._clonable = False
 
@@ -269,20 +471,70 @@ class Query(object):
         new_inctance.query.handler = handler
         return new_inctance
 
-    def raw_update(self, index, attrs, values):
-        self._clonable = False
-        self.query.set_update(attrs, values)
-        return self
-        return self
+    def raw_update(self, attrs, values):
+        new_instance = self.clone()
+        new_instance._clonable = False
+        new_instance.query.set_update(attrs, values)
+        return new_instance
+
+    def iterate(self, session, batch_size=DEFAULT_BATCH_SIZE, prefetch=True):
+        """
+            Yields all matches in document id order. Pages are fetched with
+            IDRange after last seen id instead of growing offset/max_matches,
+            next page is prefetched while current one is consumed.
+            Session must not be used elsewhere until iteration ends.
+        """
+        return iterate_by_id(session, self, int(batch_size), prefetch)
+
+    def facets(self, *facets, **options):
+        """
+            FacetSearch of attr names or GroupByOperators, limit option
+            is count of values per facet. Facets of attr names are
+            sorted by documents count.
+        """
+        limit = options.pop('limit', DEFAULT_FACET_LIMIT)
+        if options:
+            raise TypeError('unexpected options: %s' % ', '.join(sorted(options)))
+        return FacetSearch(self, facets, limit)
+
+    def fetch(self, session):
+        """
+            Runs query, returns ResultSet with attr columns typed
+            by __attrs__ of queried Index class (columnar sessions
+            return ResultSet typed by searchd attr types)
+        """
+        result, = session.run(self)
+        if result.get('error'):
+            raise QueryError(result['error'])
+        return ResultSet.from_result(result, self.index)
+
+    def keywords(self, server, query, hits=False):
+        """
+            BuildKeywords, query is string or list of strings,
+            for list keywords lists are returned in its order
+        """
+        if isinstance(query, string_types):
+            return self.query.build_keywords(server, [query], hits)[0]
+        return self.query.build_keywords(server, query, hits)
 
-    def keywords(self, query, hits=False):
-        self._clonable = False
-        self.query.set_keywords()
+    def excerpts(self, server, docs, words, **options):
+        """
+            BuildExcerpts for docs (e.g. bodies of found documents),
+            returns iterator over snippets in docs order
+        """
+        return self.query.build_excerpts(server, docs, words, options)
 
-    def excerpts(self, docs, words, **options):
-        self._clonable = False
-        self.query.build_excerpts(docs, words, options)
-        return self
+    @clone_method
+    def cache(self, ttl=True):
+        """
+            Opt-in for session result cache, ttl in seconds,
+            True means cache default, False disables caching
+        """
+        if ttl is False:
+            ttl = None
+        elif ttl is not True:
+            ttl = int(ttl)
+        self.query.set_cache_ttl(ttl)
 
     @clone_method
     # quering options
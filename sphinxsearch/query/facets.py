@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+    Faceted search: main query and one grouped query per facet are sent
+    with one Session.run(), facet queries share main query filters except
+    filter of own attr (drill-sideways), so counts of other values of
+    already filtered attr stay visible.
+
+    >>> facets = qs.filter(brand_id=[1, 2]).facets('brand_id', Month('created'), limit=10)
+    >>> result = facets.run(session)
+    >>> result.matches, result['brand_id'].values
+    ([...], [(1, 120), (2, 80), (3, 15)])
+"""
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+
+from six import text_type
+
+from ..exceptions import QueryError
+from .groupby import GroupByOperator
+
+
+DEFAULT_FACET_LIMIT = 20
+DEFAULT_FACET_SORT = '@count desc'
+
+
+def get_facet_name(group_by):
+    """
+        attr name for plain group by, e.g. created__month for Month('created')
+    """
+    if type(group_by) is GroupByOperator:
+        return group_by.attr_name
+    return '%s__%s' % (group_by.attr_name, type(group_by).__name__.lower())
+
+
+def check_result(result):
+    if result.get('error'):
+        raise QueryError(result['error'])
+    return result
+
+
+class Facet(object):
+    """
+        values are (group value, documents count) pairs in group sort order,
+        total is count of all groups
+    """
+    def __init__(self, name, group_by, result):
+        self.name = name
+        self.group_by = group_by
+        self.values = [(match['attrs']['@groupby'], match['attrs']['@count'])
+                       for match in result['matches']]
+        self.total = result['total_found']
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return 'Facet(%s, %r)' % (self.name, self.values)
+
+
+class FacetResult(object):
+    def __init__(self, result, facets):
+        self.result = result
+        self.facets = facets
+
+    @property
+    def matches(self):
+        return self.result['matches']
+
+    @property
+    def total_found(self):
+        return self.result['total_found']
+
+    def __getitem__(self, name):
+        return self.facets[name]
+
+    def __iter__(self):
+        return iter(self.facets.values())
+
+
+class FacetSearch(object):
+    """
+        Built by Query.facets(). Queries fit one round trip while their
+        count does not exceed session max_batch_queries.
+    """
+    def __init__(self, qs, facets, limit=DEFAULT_FACET_LIMIT):
+        self.qs = qs
+        self.limit = int(limit)
+        self.facets = OrderedDict()
+
+        for group_by in facets:
+            if not isinstance(group_by, GroupByOperator):
+                group_by = GroupByOperator(text_type(group_by), DEFAULT_FACET_SORT)
+            name = get_facet_name(group_by)
+            if name in self.facets:
+                raise QueryError('facet %s is requested twice' % name)
+            self.facets[name] = group_by
+
+    def get_facet_backend(self, group_by):
+        backend = self.qs.query.clone()
+        if group_by.attr_name in backend.filters:
+            backend.remove_filter(group_by.attr_name)
+        backend.set_group_by(group_by)
+        backend.set_group_by_distinct(None)
+        backend.set_limit(0, self.limit, backend.max_matches, backend.cutoff)
+        return backend
+
+    @property
+    def queries(self):
+        """
+            Main query backend followed by facet backends
+        """
+        return [self.qs.query] + [self.get_facet_backend(group_by)
+                                  for group_by in self.facets.values()]
+
+    def parse(self, results):
+        """
+            FacetResult of Session.run(*queries) results
+        """
+        results = [check_result(result) for result in results]
+        facets = OrderedDict((name, Facet(name, group_by, result))
+                             for (name, group_by), result in zip(self.facets.items(),
+                                                                 results[1:]))
+        return FacetResult(results[0], facets)
+
+    def run(self, session):
+        return self.parse(session.run(*self.queries))
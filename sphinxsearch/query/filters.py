@@ -1,5 +1,137 @@
 # -*- coding: utf-8 -*-
+import sys
+
+from array import array
 from copy import copy
+from itertools import islice
+
+from six import binary_type, string_types
+from six.moves import zip
+
+from ..exceptions import QueryError
+
+
+# searchd default for max_filter_values option
+DEFAULT_MAX_FILTER_VALUES = 4096
+
+try:
+    array('q')
+    INT64_TYPECODE = 'q'
+except ValueError:
+    # python 2 array has no 'q', its 'l' is 64 bit on 64 bit platforms
+    INT64_TYPECODE = 'l'
+INT64_FORMATS = frozenset(['q', '<q', '>q', '=q', '@q', INT64_TYPECODE])
+# buffer formats of other than native byte order
+SWAPPED_INT64_FORMATS = frozenset(['>q' if sys.byteorder == 'little' else '<q'])
+
+ID_ATTRS = ('id', '@id')
+
+
+def is_sorted_unique(values):
+    return all(a < b for a, b in zip(values, islice(values, 1, None)))
+
+
+def to_int64_array(values):
+    """
+        Returns sorted array of unique values, sorted int64 arrays
+        are used as is
+    """
+    if isinstance(values, array) and values.typecode == INT64_TYPECODE:
+        result = values
+    elif hasattr(values, 'dtype'):
+        # numpy arrays are sorted and deduplicated by numpy itself
+        import numpy
+        return array(INT64_TYPECODE, numpy.unique(values).astype('=i8').tobytes())
+    elif isinstance(values, memoryview) and values.itemsize == 8 and values.format in INT64_FORMATS:
+        result = array(INT64_TYPECODE, values.tobytes())
+        if values.format in SWAPPED_INT64_FORMATS:
+            result.byteswap()
+    else:
+        result = array(INT64_TYPECODE, map(int, values))
+
+    if is_sorted_unique(result):
+        return result
+    return array(INT64_TYPECODE, sorted(set(result)))
+
+
+def array_to_bytes(values):
+    if hasattr(values, 'tobytes'):
+        return values.tobytes()
+    return values.tostring()
+
+
+def is_collection(value):
+    if isinstance(value, (string_types, binary_type)):
+        return False
+    return isinstance(value, memoryview) or hasattr(value, '__iter__')
+
+
+class FilterValues(object):
+    """
+        Sorted unique int64 values of SetFilter kept in array,
+        packed into searchd wire format at once
+    """
+    __slots__ = ('array', '_packed')
+
+    def __init__(self, values):
+        self.array = to_int64_array(values)
+        self._packed = None
+
+    @classmethod
+    def from_array(cls, values):
+        instance = cls.__new__(cls)
+        instance.array = values
+        instance._packed = None
+        return instance
+
+    def __len__(self):
+        return len(self.array)
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.from_array(self.array[key])
+        return self.array[key]
+
+    def __eq__(self, other):
+        if isinstance(other, FilterValues):
+            return self.array == other.array
+        if isinstance(other, list):
+            return self.tolist() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash(self.pack())
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def tolist(self):
+        return self.array.tolist()
+
+    def pack(self):
+        """
+            Big endian int64 values as bytes
+        """
+        if self._packed is None:
+            values = self.array
+            if sys.byteorder == 'little':
+                values = array(INT64_TYPECODE, values)
+                values.byteswap()
+            self._packed = array_to_bytes(values)
+        return self._packed
+
+    def is_contiguous(self):
+        return len(self.array) > 0 and self.array[-1] - self.array[0] + 1 == len(self.array)
+
+    def split(self, size):
+        return [self[start:start + size] for start in range(0, len(self), size)]
 
 
 class FiltersContainer(object):
@@ -13,14 +145,38 @@ class BaseFilterOperator(object):
     def __init__(self):
         self.exclude = False
 
+    def get_params(self):
+        raise NotImplementedError()
+
     def apply(self, client, attr_name):
         raise NotImplementedError()
 
+    def fit(self, attr_name, max_values):
+        """
+            Returns operator sending at most max_values values per filter
+        """
+        return self
+
     def revert(self):
         new_instance = copy(self)
         new_instance.exclude = not new_instance.exclude
         return new_instance
 
+    def get_key(self):
+        return (type(self), self.exclude) + tuple(self.get_params())
+
+    def __eq__(self, other):
+        if not isinstance(other, BaseFilterOperator):
+            return NotImplemented
+        return self.get_key() == other.get_key()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash(self.get_key())
+
     def __repr__(self):
         return "%s(attr_name, %s, %s)" % (self.api_method,
                                           repr(self.values),
@@ -28,15 +184,46 @@ class BaseFilterOperator(object):
 
 
 class Any(BaseFilterOperator):
+    """
+        Any(1, 2, 3) or Any(values) where values is list, range,
+        array, memoryview or numpy array of integers
+    """
     api_method = 'SetFilter'
 
     def __init__(self, *values):
         super(Any, self).__init__()
-        self.values = map(int, values)
+        if len(values) == 1 and is_collection(values[0]):
+            values = values[0]
+        self.values = values if isinstance(values, FilterValues) else FilterValues(values)
+
+    def get_params(self):
+        return (self.values,)
 
     def apply(self, client, attr_name):
         client.SetFilter(attr_name, self.values, self.exclude)
 
+    def fit(self, attr_name, max_values):
+        """
+            Contiguous values become range filter, excluded values are
+            split into several filters. Filters of the same attr are
+            intersected, so included values can not be split.
+        """
+        if len(self.values) <= max_values:
+            return self
+
+        start, end = self.values[0], self.values[-1]
+        if self.values.is_contiguous():
+            if attr_name in ID_ATTRS and not self.exclude:
+                return IDRange(start, end)
+            op = Range(start, end)
+            op.exclude = self.exclude
+            return op
+
+        if not self.exclude:
+            raise QueryError('%s filter has %s values, max_filter_values is %s'
+                             % (attr_name, len(self.values), max_values))
+        return All(*[Not(Any(chunk)) for chunk in self.values.split(max_values)])
+
 
 class All(BaseFilterOperator):
     def __init__(self, *values):
@@ -53,18 +240,38 @@ class All(BaseFilterOperator):
 
         self.sub_ops = tuple(sub_ops)
 
+    def apply(self, client, attr_name):
+        for sub_op in self.sub_ops:
+            sub_op.apply(client, attr_name)
+
     def revert(self):
         new_instance = copy(self)
         new_instance.sub_ops = [op.revert() for op in new_instance.sub_ops]
         return new_instance
 
+    def get_key(self):
+        # order of sub filters does not matter
+        return (All, frozenset(self.sub_ops))
+
+    def fit(self, attr_name, max_values):
+        sub_ops = []
+        for op in self.sub_ops:
+            fitted = op.fit(attr_name, max_values)
+            sub_ops.extend(fitted.sub_ops if isinstance(fitted, All) else [fitted])
+
+        if all(a is b for a, b in zip(sub_ops, self.sub_ops)) and len(sub_ops) == len(self.sub_ops):
+            return self
+        new_instance = copy(self)
+        new_instance.sub_ops = tuple(sub_ops)
+        return new_instance
+
     def __repr__(self):
         return '\n'.join([repr(sub) for sub in self.sub_ops])
 
 
 class Range(BaseFilterOperator):
     values_type = int
-    api_method = 'SetRange'
+    api_method = 'SetFilterRange'
 
     def __init__(self, start, end):
         super(Range, self).__init__()
@@ -73,6 +280,12 @@ class Range(BaseFilterOperator):
         self.start = start
         self.end = end
 
+    def get_params(self):
+        return (self.start, self.end)
+
+    def apply(self, client, attr_name):
+        client.SetFilterRange(attr_name, self.start, self.end, self.exclude)
+
     def __repr__(self):
         return "%s(attr_name, %s, %s, %s)" % (self.api_method,
                                               self.start,
@@ -81,13 +294,27 @@ class Range(BaseFilterOperator):
 
 
 class FloatRange(Range):
-    api_method = 'SetFloatRange'
+    api_method = 'SetFilterFloatRange'
     values_type = float
 
+    def apply(self, client, attr_name):
+        client.SetFilterFloatRange(attr_name, self.start, self.end, self.exclude)
+
 
 class IDRange(Range):
     api_method = 'SetIDRange'
 
+    def __init__(self, start, end):
+        # single document range is allowed by SetIDRange
+        BaseFilterOperator.__init__(self)
+        start, end = int(start), int(end)
+        assert start <= end
+        self.start = start
+        self.end = end
+
+    def apply(self, client, attr_name):
+        client.SetIDRange(self.start, self.end)
+
     def revert(self, *args, **kwargs):
         raise RuntimeError('casting Not for IDRange is not allowed')
 
@@ -4,11 +4,20 @@
 class GroupByOperator(object):
     api_option = 'SPH_GROUPBY_ATTR'
 
-    def get_api_option(self, engine):
-        return getattr(engine.api, self.api_option)
+    def __init__(self, attr_name, group_sort='@group desc'):
+        self.attr_name = attr_name
+        self.group_sort = group_sort
 
-    def apply():
-        pass
+    def get_api_option(self, api):
+        return getattr(api, self.api_option)
+
+    def apply(self, api, client):
+        client.SetGroupBy(self.attr_name, self.get_api_option(api), self.group_sort)
+
+    def __repr__(self):
+        return 'SetGroupBy(%s, %s, %s)' % (self.attr_name,
+                                           self.api_option,
+                                           self.group_sort)
 
 
 class Day(GroupByOperator):
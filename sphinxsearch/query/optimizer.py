@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+    Filter optimizer: filters of every attr are merged into the smallest
+    equivalent set, queries whose filters can not match are not sent.
+    E.g. Range(10, 100), Range(50, 200) and Not([1, 60]) of one attr
+    become Range(50, 100) and Not(60).
+"""
+from __future__ import unicode_literals
+
+from copy import copy
+
+from .filters import All, Any, Range, FloatRange, IDRange
+
+
+class MatchNothing(object):
+    def __repr__(self):
+        return 'NOTHING'
+
+
+# filter which no document can match
+NOTHING = MatchNothing()
+
+
+def iter_ops(op):
+    if isinstance(op, All):
+        return list(op.sub_ops)
+    return [op]
+
+
+def make_range(start, end, exclude=False):
+    if start == end:
+        op = Any(start)
+    else:
+        op = Range(start, end)
+    op.exclude = exclude
+    return op
+
+
+def optimize_any(attr_name, op):
+    values = op.values
+    if not values:
+        # no values to match or to exclude
+        return None if op.exclude else NOTHING
+
+    # range is two int64 bounds, so shorter value lists are as cheap
+    if values.is_contiguous() and len(values) > 2:
+        return make_range(values[0], values[-1], op.exclude)
+    return op
+
+
+def optimize_float(ops):
+    """
+        Intersects included float ranges, excluded ones are kept
+    """
+    included = [op for op in ops if not op.exclude]
+    if len(included) < 2:
+        return ops
+
+    start = max(op.start for op in included)
+    end = min(op.end for op in included)
+    if start > end:
+        return NOTHING
+
+    merged = copy(included[0])
+    merged.start, merged.end = start, end
+    return [merged] + [op for op in ops if op.exclude]
+
+
+def optimize_int(attr_name, ops):
+    """
+        Any and Range operators of one attr as their intersection,
+        NOTHING when it is empty
+    """
+    values = None
+    excluded = set()
+    excluded_ranges = []
+    start = end = None
+
+    for op in ops:
+        if isinstance(op, Any):
+            if op.exclude:
+                excluded.update(op.values)
+            elif values is None:
+                values = set(op.values)
+            else:
+                values &= set(op.values)
+        elif op.exclude:
+            excluded_ranges.append((op.start, op.end))
+        else:
+            start = op.start if start is None else max(start, op.start)
+            end = op.end if end is None else min(end, op.end)
+
+    if start is not None and start > end:
+        return NOTHING
+
+    if values is not None:
+        # included values hold all constraints
+        values = [value for value in values
+                  if (start is None or start <= value <= end) and value not in excluded and
+                  not any(s <= value <= e for s, e in excluded_ranges)]
+        if not values:
+            return NOTHING
+        return [optimize_any(attr_name, Any(values))]
+
+    if start is not None:
+        changed = True
+        while changed:
+            changed = False
+            for s, e in excluded_ranges:
+                if s <= start and end <= e:
+                    return NOTHING
+                if s <= start <= e:
+                    start, changed = e + 1, True
+                elif s <= end <= e:
+                    end, changed = s - 1, True
+            while start <= end and start in excluded:
+                start, changed = start + 1, True
+            while start <= end and end in excluded:
+                end, changed = end - 1, True
+            if start > end:
+                return NOTHING
+
+        # exclusions outside of included range are redundant
+        excluded = set(value for value in excluded if start <= value <= end)
+        excluded_ranges = [(s, e) for s, e in excluded_ranges if s <= end and e >= start]
+
+    result = []
+    if start is not None:
+        result.append(make_range(start, end))
+    for s, e in sorted(excluded_ranges):
+        if s == e:
+            excluded.add(s)
+        else:
+            result.append(make_range(s, e, exclude=True))
+    if excluded:
+        op = Any(excluded)
+        op.exclude = True
+        result.insert(1 if start is not None else 0, optimize_any(attr_name, op))
+    return result
+
+
+def intersect_id_ranges(id_ranges):
+    """
+        Single IDRange of all given ones, NOTHING when they do not overlap
+    """
+    start = max(op.start for op in id_ranges)
+    end = min(op.end for op in id_ranges)
+    if start > end:
+        return NOTHING
+    return IDRange(start, end)
+
+
+def optimize_filter(attr_name, op):
+    """
+        Returns equivalent operator, op itself when nothing changes,
+        None when filter is redundant and NOTHING when no document
+        can match
+    """
+    ops = iter_ops(op)
+
+    if len(ops) == 1:
+        if type(ops[0]) is Any:
+            return optimize_any(attr_name, ops[0])
+        return ops[0]
+
+    # IDRange limits document ids, not values of attr
+    int_ops = [sub for sub in ops if type(sub) in (Any, Range)]
+    float_ops = [sub for sub in ops if type(sub) is FloatRange]
+    id_ops = [sub for sub in ops if type(sub) is IDRange]
+    other_ops = [sub for sub in ops if type(sub) not in (Any, Range, FloatRange, IDRange)]
+
+    id_range = intersect_id_ranges(id_ops) if id_ops else None
+    if id_range is NOTHING:
+        return NOTHING
+
+    optimized = []
+    for group in (optimize_int(attr_name, int_ops) if int_ops else [],
+                  optimize_float(float_ops),
+                  [id_range] if id_range else [],
+                  other_ops):
+        if group is NOTHING:
+            return NOTHING
+        optimized.extend(group)
+
+    if not optimized:
+        return None
+    if len(optimized) == 1:
+        return optimized[0]
+
+    result = All(*optimized)
+    return op if result == op else result
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from six import with_metaclass
+from six import text_type, with_metaclass
 
 from abc import ABCMeta, abstractproperty
 
@@ -14,37 +14,32 @@ class AbtractSortMode(with_metaclass(ABCMeta, object)):
     def api_const():
         """"""
 
-    def get_api_option(self, engine):
-        return getattr(engine.api, self.api_const)
-
-    @abstractproperty  # pragma: no cover
-    def expr():
-        """"""
-
     def __init__(self, expr):
         self.expr = expr
 
-    def get_api_const(self, engine):
-        return getattr(engine.api, self.api_const)
+    def get_api_const(self, api):
+        return getattr(api, self.api_const)
 
-    def apply(self, engine):
-        engine.api.SetSortMode(self.get_api_const(engine), self.attr_name)
+    def apply(self, api, client):
+        client.SetSortMode(self.get_api_const(api), self.expr)
 
     @classmethod
-    def reset(cls, engine):
-        sort_relevance = engine.api.SPH_SORT_RELEVANCE
-        engine.api.SetSortMode(sort_relevance)
+    def reset(cls, api, client):
+        sort_relevance = api.SPH_SORT_RELEVANCE
+        client.SetSortMode(sort_relevance)
 
     def __hash__(self):
-        return hash(self.api_const, self.attr_name)
+        return hash((self.api_const, self.expr))
 
     def __repr__(self):
-        return 'SetSortMode(%s, %s)' % (self.api_const, self.attr_name)
+        return 'SetSortMode(%s, %s)' % (self.api_const, self.expr)
 
 
 class Relevance(AbtractSortMode):
     api_const = 'SPH_SORT_RELEVANCE'
-    expr = ''
+
+    def __init__(self, expr=''):
+        super(Relevance, self).__init__(expr)
 
 
 class BaseAttrSortMode(AbtractSortMode):
@@ -91,7 +86,7 @@ class MultiSort(AbtractSortMode):
             if isinstance(mode, BaseAttrSortMode):
                 mode = mode.toExtendedMode()
             else:
-                mode = unicode(mode)
+                mode = text_type(mode)
             mode_str_list.append(mode)
 
         self.expr = ', '.join(mode_str_list)
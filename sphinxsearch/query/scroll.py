@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+
+from six.moves.queue import Queue, Full
+
+from ..exceptions import QueryError
+from .filters import IDRange
+from .orderby import Asc
+
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_DOCUMENT_ID = 2 ** 64 - 1
+
+_done = object()
+
+
+def fetch_batches(session, qs, batch_size):
+    """
+        Yields lists of matches sorted by id. Every batch is requested
+        from offset 0 with IDRange starting after last seen id, so
+        searchd never sorts more than batch_size matches.
+    """
+    backend = qs.orderby(Asc('@id')).query.clone()
+
+    # IDRange filters are replaced with batch ranges
+    start, end = 1, MAX_DOCUMENT_ID
+    for id_range in backend.pop_id_ranges():
+        start = max(start, id_range.start)
+        end = min(end, id_range.end)
+    backend.set_limit(0, batch_size, batch_size, backend.cutoff)
+
+    while start <= end:
+        batch_backend = backend.clone()
+        batch_backend.add_filter('@id', IDRange(start, end))
+
+        result, = session.run(batch_backend)
+        if result.get('error'):
+            raise QueryError(result['error'])
+
+        matches = result['matches']
+        if matches:
+            yield matches
+        if len(matches) < batch_size:
+            return
+
+        start = matches[-1]['id'] + 1
+
+
+def prefetch(batches):
+    """
+        Consumes batches iterator in background thread, keeping at most
+        one fetched batch ahead of the caller
+    """
+    queue = Queue(1)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def worker():
+        try:
+            for batch in batches:
+                if not put((batch, None)):
+                    return
+        except Exception as e:
+            put((_done, e))
+        else:
+            put((_done, None))
+
+    thread = threading.Thread(target=worker)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            batch, error = queue.get()
+            if error is not None:
+                raise error
+            if batch is _done:
+                return
+            yield batch
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def iterate_by_id(session, qs, batch_size=DEFAULT_BATCH_SIZE, prefetch_next=True):
+    batches = fetch_batches(session, qs, batch_size)
+    if prefetch_next:
+        batches = prefetch(batches)
+
+    for matches in batches:
+        for match in matches:
+            yield match
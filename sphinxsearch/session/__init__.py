@@ -1,35 +1,313 @@
 # -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from ..exceptions import QueryError
+from ..query.filters import DEFAULT_MAX_FILTER_VALUES
+from .pool import (ConnectionPool, PooledConnection, DEFAULT_POOL_SIZE,
+                   DEFAULT_IDLE_TIMEOUT, DEFAULT_MAX_LIFETIME)
+from .replicas import (ReplicaSet, ReplicaSessionMixin, P2C,
+                       DEFAULT_FAILURE_THRESHOLD, DEFAULT_RESET_TIMEOUT)
+from .results import ResultSet
+
+
+# searchd default for max_batch_queries option
+DEFAULT_MAX_BATCH_QUERIES = 32
+
+
+def prepare_backend(qs, max_filter_values):
+    """
+        Query backend with optimized filters fitting max_filter_values
+    """
+    backend = getattr(qs, 'query', qs).optimize_filters()
+    if backend.matches_nothing:
+        return backend
+    return backend.fit_filters(max_filter_values)
+
+
+def get_empty_result():
+    return {'status': 0, 'error': '', 'warning': '', 'fields': [], 'attrs': [],
+            'matches': [], 'total': 0, 'total_found': 0, 'time': '0.000', 'words': []}
+
+
+def fill_empty_results(backends, results):
+    """
+        Results of sent queries with empty results of queries
+        matching nothing in between
+    """
+    results = iter(results)
+    return [get_empty_result() if backend.matches_nothing else next(results)
+            for backend in backends]
+
+
+def get_endpoint(server):
+    if isinstance(server, (list, tuple)):
+        host, port = server
+        return host, int(port)
+    return server.host, int(server.port)
 
 
 class SessionFactory(object):
-    def __init__(self):
-        pass
+    """
+        replicas are SearchServer instances or (host, port) pairs serving
+        the same indexes as server. With replicas every batch goes to
+        replica chosen by balancing ('p2c' or 'least_outstanding'),
+        replicas failing failure_threshold times in a row are ejected for
+        reset_timeout seconds, searches failed with connection errors are
+        retried on other replicas within query timeout or retry_timeout.
+    """
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 max_lifetime=DEFAULT_MAX_LIFETIME,
+                 pool_timeout=None,
+                 result_cache=None,
+                 replicas=None,
+                 balancing=P2C,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT,
+                 health_interval=None,
+                 retry_timeout=None,
+                 columnar=False):
+        self.server = None
+        self.result_cache = result_cache
+        self.columnar = columnar
+        self.pool_options = dict(size=pool_size,
+                                 idle_timeout=idle_timeout,
+                                 max_lifetime=max_lifetime,
+                                 timeout=pool_timeout)
+        self.replicas = list(replicas or ())
+        self.replica_options = dict(balancing=balancing,
+                                    failure_threshold=failure_threshold,
+                                    reset_timeout=reset_timeout)
+        self.health_interval = health_interval
+        self.retry_timeout = retry_timeout
+        self.replica_set = None
+        self._pool = None
 
     def set_server(self, server):
         self.server = server
+        self.reset()
 
-    def __call__(self):
+        if self.replicas:
+            endpoints = [get_endpoint(server)] + [get_endpoint(replica)
+                                                  for replica in self.replicas]
+            self.replica_set = ReplicaSet(endpoints, self.pool_options, **self.replica_options)
+
+    @property
+    def pool(self):
         api = self.server.api
-        host = self.server.host
-        port = self.server.port
-        return Session(api, host, port)
+        if self.replica_set is not None:
+            # pool of server itself, e.g. for bulk writes
+            return self.replica_set.replicas[0].get_pool(api)
+
+        if self._pool is None or self._pool.api is not api:
+            self.reset()
+            self._pool = ConnectionPool(api,
+                                        self.server.host,
+                                        self.server.port,
+                                        **self.pool_options)
+        return self._pool
+
+    def reset(self):
+        if self._pool is not None:
+            self._pool.clear()
+        self._pool = None
+        if self.replica_set is not None:
+            self.replica_set.reset()
+
+    def get_stats(self):
+        if self.replica_set is not None:
+            return self.replica_set.replicas[0].get_stats()['pool']
+        if self._pool is None:
+            return None
+        return self._pool.get_stats()
+
+    def get_replica_stats(self):
+        if self.replica_set is None:
+            return None
+        return self.replica_set.get_stats()
+
+    def check_health(self):
+        """
+            Probes ejected replicas, returns healthy replicas count
+        """
+        if self.replica_set is None:
+            return None
+        return self.replica_set.check_health(self.server.api)
+
+    def invalidate_cache(self, index_names):
+        if self.result_cache is not None:
+            self.result_cache.invalidate(index_names)
+
+    def get_max_batch_queries(self):
+        return int(self.server.get_option_value('max_batch_queries',
+                                                DEFAULT_MAX_BATCH_QUERIES))
+
+    def get_max_filter_values(self):
+        return int(self.server.get_option_value('max_filter_values',
+                                                DEFAULT_MAX_FILTER_VALUES))
+
+    def __call__(self):
+        if self.replica_set is not None:
+            if self.health_interval:
+                self.replica_set.start_health_checks(lambda: self.server.api,
+                                                     self.health_interval)
+            return ReplicaSession(self.replica_set, self.server.api,
+                                  max_batch_queries=self.get_max_batch_queries(),
+                                  max_filter_values=self.get_max_filter_values(),
+                                  result_cache=self.result_cache,
+                                  retry_timeout=self.retry_timeout,
+                                  columnar=self.columnar)
+
+        pool = self.pool
+        return Session(pool.api, pool.host, pool.port, pool=pool,
+                       max_batch_queries=self.get_max_batch_queries(),
+                       max_filter_values=self.get_max_filter_values(),
+                       result_cache=self.result_cache,
+                       columnar=self.columnar)
 
 
 class Session(object):
 
-    def __init__(self, api, host, port):
+    def __init__(self, api, host, port, pool=None,
+                 max_batch_queries=DEFAULT_MAX_BATCH_QUERIES,
+                 max_filter_values=DEFAULT_MAX_FILTER_VALUES,
+                 result_cache=None, columnar=False):
         self.api = api
         self.host = host
         self.port = port
+        self.pool = pool
+        self.max_batch_queries = max_batch_queries
+        self.max_filter_values = max_filter_values
+        self.result_cache = result_cache
+        self.columnar = columnar
+        self._conn = None
 
     def __enter__(self):
-        pass
+        return self
 
     def __exit__(self, *args):
         self.close()
 
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn.client
+
+    def _connect(self):
+        if self.pool is not None:
+            return self.pool.acquire()
+
+        client = self.api.SphinxClient()
+        client.SetServer(self.host, int(self.port))
+        return PooledConnection(client)
+
     def close(self):
-        self.conn.Close()
+        if self._conn is None:
+            return
+
+        conn, self._conn = self._conn, None
+        if self.pool is None:
+            conn.close()
+            return
+
+        if conn.client.IsConnectError():
+            conn.broken = True
+        self.pool.release(conn)
 
     def run(self, *qs_list):
-        pass
+        """
+            Sends queries with AddQuery/RunQueries, one round trip per
+            max_batch_queries queries. Results are returned in order,
+            queries marked with Query.cache() are served from result_cache.
+            Filters are optimized and fitted to max_filter_values,
+            queries which can not match get empty results without
+            round trip. Columnar sessions return ResultSet instances.
+        """
+        backends = [prepare_backend(qs, self.max_filter_values) for qs in qs_list]
+
+        if self.result_cache is None:
+            results = self._run(backends)
+        else:
+            results = self.result_cache.run(backends, self._run)
+
+        if self.columnar:
+            return [ResultSet.from_result(result) for result in results]
+        return results
+
+    def _run(self, backends):
+        results = []
+        batch_size = self.max_batch_queries
+        sent = [backend for backend in backends if not backend.matches_nothing]
+
+        for start in range(0, len(sent), batch_size):
+            batch = sent[start:start + batch_size]
+            results.extend(self._run_batch(batch))
+
+        return fill_empty_results(backends, results)
+
+    def discard_conn(self):
+        """
+            Drops connection with requests left queued in client,
+            otherwise next RunQueries would send them again
+        """
+        if self._conn is not None:
+            self._conn.broken = True
+            self.close()
+
+    def _run_batch(self, backends):
+        client = self.conn
+
+        try:
+            for backend in backends:
+                backend.apply(self.api, client)
+            results = client.RunQueries()
+        except Exception:
+            self.discard_conn()
+            raise
+
+        if results is None:
+            error = client.GetLastError()
+            self.discard_conn()
+            raise QueryError(error)
+        return results
+
+    def build_excerpts(self, docs, index, words, options=None):
+        """
+            BuildExcerpts, returns snippets in docs order
+        """
+        client = self.conn
+        excerpts = client.BuildExcerpts(docs, index, words, options or {})
+        if excerpts is None:
+            raise QueryError(client.GetLastError())
+        return excerpts
+
+    def build_keywords(self, query, index, hits=False):
+        """
+            BuildKeywords, returns list of dicts with tokenized and
+            normalized forms, docs and hits with hits=True
+        """
+        client = self.conn
+        keywords = client.BuildKeywords(query, index, hits)
+        if keywords is None:
+            raise QueryError(client.GetLastError())
+        return keywords
+
+    def update_attributes(self, index, attrs, values, mva=False):
+        """
+            UpdateAttributes, values is {doc_id: [values in attrs order]},
+            returns updated documents count
+        """
+        client = self.conn
+        updated = client.UpdateAttributes(index, attrs, values, mva)
+        if updated is None or updated < 0:
+            raise QueryError(client.GetLastError())
+        return updated
+
+
+class ReplicaSession(ReplicaSessionMixin, Session):
+    def __init__(self, replica_set, api, retry_timeout=None, **kwargs):
+        primary = replica_set.replicas[0]
+        super(ReplicaSession, self).__init__(api, primary.host, primary.port, **kwargs)
+        self.replica_set = replica_set
+        self.retry_timeout = retry_timeout
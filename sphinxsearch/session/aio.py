@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+    asyncio session speaking searchd binary protocol, requires python 3.5+
+"""
+import asyncio
+import time
+
+from ..exceptions import ConnectError, PoolTimeout, QueryError
+from ..query.filters import DEFAULT_MAX_FILTER_VALUES
+from . import protocol, fill_empty_results, prepare_backend, DEFAULT_MAX_BATCH_QUERIES
+from .pool import DEFAULT_POOL_SIZE, DEFAULT_IDLE_TIMEOUT, DEFAULT_MAX_LIFETIME
+from .results import ResultSet
+
+
+DEFAULT_TIMEOUT_GRACE = 0.5
+
+# SearchServer session options used by AsyncSessionFactory,
+# replicas related ones are ignored
+ASYNC_SESSION_OPTIONS = ('pool_size', 'idle_timeout', 'max_lifetime', 'pool_timeout',
+                         'timeout_grace', 'result_cache', 'columnar')
+
+
+class AsyncConnection(object):
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.created_at = time.time()
+        self.used_at = self.created_at
+        self.broken = False
+        self.generation = 0
+
+    @classmethod
+    async def open(cls, host, port):
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            raise ConnectError('connection to %s:%s failed: %s' % (host, port, e))
+
+        conn = cls(reader, writer)
+        try:
+            writer.write(protocol.CLIENT_VERSION)
+            server_version, = protocol.ResponseReader(await reader.readexactly(4)).unpack('>L')
+            if server_version < 1:
+                raise ConnectError('expected searchd protocol version 1+, got %s' % server_version)
+            writer.write(protocol.PERSIST_REQUEST)
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError) as e:
+            conn.close()
+            raise ConnectError('handshake with %s:%s failed: %s' % (host, port, e))
+        return conn
+
+    def is_expired(self, now, idle_timeout, max_lifetime):
+        if idle_timeout and now - self.used_at > idle_timeout:
+            return True
+        if max_lifetime and now - self.created_at > max_lifetime:
+            return True
+        return False
+
+    def is_alive(self):
+        return not (self.broken or self.reader.at_eof() or self.writer.transport.is_closing())
+
+    def send(self, request):
+        self.writer.write(request)
+
+    async def read_response(self):
+        header = await self.reader.readexactly(protocol.HEADER_SIZE)
+        status, _, length = protocol.parse_header(header)
+        body = await self.reader.readexactly(length)
+        return protocol.check_response(status, body)
+
+    def close(self):
+        self.broken = True
+        self.writer.close()
+
+
+class AsyncConnectionPool(object):
+    """
+        Bounded pool of persistent searchd connections for single event loop
+    """
+    def __init__(self, host, port,
+                 size=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 max_lifetime=DEFAULT_MAX_LIFETIME,
+                 timeout=None):
+        if size < 1:
+            raise ValueError('pool size must be positive')
+
+        self.host = host
+        self.port = int(port)
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+
+        self._idle = []
+        self._generation = 0
+        self._semaphore = asyncio.Semaphore(size)
+
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.discarded = 0
+
+    async def acquire(self):
+        if self._semaphore.locked():
+            self.waits += 1
+
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeout('no free connection to %s:%s in %ss'
+                              % (self.host, self.port, self.timeout))
+
+        now = time.time()
+        while self._idle:
+            conn = self._idle.pop()
+            if conn.is_alive() and not conn.is_expired(now, self.idle_timeout, self.max_lifetime):
+                self.hits += 1
+                conn.used_at = now
+                return conn
+            self.discarded += 1
+            conn.close()
+
+        try:
+            conn = await AsyncConnection.open(self.host, self.port)
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+        conn.generation = self._generation
+        self.misses += 1
+        return conn
+
+    def release(self, conn):
+        if conn.is_alive() and conn.generation == self._generation:
+            conn.used_at = time.time()
+            self._idle.append(conn)
+        else:
+            self.discarded += 1
+            conn.close()
+        self._semaphore.release()
+
+    def clear(self):
+        """
+            Closes idle connections, checked out ones are closed on release
+        """
+        self._generation += 1
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def get_stats(self):
+        return {'size': self.size,
+                'idle': len(self._idle),
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'discarded': self.discarded}
+
+
+class AsyncSessionFactory(object):
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 max_lifetime=DEFAULT_MAX_LIFETIME,
+                 pool_timeout=None,
+                 timeout_grace=DEFAULT_TIMEOUT_GRACE,
+                 result_cache=None,
+                 columnar=False):
+        self.server = None
+        self.result_cache = result_cache
+        self.columnar = columnar
+        self.pool_options = dict(size=pool_size,
+                                 idle_timeout=idle_timeout,
+                                 max_lifetime=max_lifetime,
+                                 timeout=pool_timeout)
+        self.timeout_grace = timeout_grace
+        self._pool = None
+
+    def set_server(self, server):
+        self.server = server
+        self.reset()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = AsyncConnectionPool(self.server.host,
+                                             self.server.port,
+                                             **self.pool_options)
+        return self._pool
+
+    def reset(self):
+        if self._pool is not None:
+            self._pool.clear()
+        self._pool = None
+
+    def get_stats(self):
+        if self._pool is None:
+            return None
+        return self._pool.get_stats()
+
+    def __call__(self):
+        max_batch_queries = int(self.server.get_option_value('max_batch_queries',
+                                                             DEFAULT_MAX_BATCH_QUERIES))
+        max_filter_values = int(self.server.get_option_value('max_filter_values',
+                                                             DEFAULT_MAX_FILTER_VALUES))
+        return AsyncSession(self.pool,
+                            max_batch_queries=max_batch_queries,
+                            max_filter_values=max_filter_values,
+                            timeout_grace=self.timeout_grace,
+                            result_cache=self.result_cache,
+                            columnar=self.columnar)
+
+
+class AsyncSession(object):
+    """
+    >>> async with server.get_async_session() as session:
+    ...     results = await session.run(qs1, qs2)
+    """
+    def __init__(self, pool, max_batch_queries=DEFAULT_MAX_BATCH_QUERIES,
+                 timeout_grace=DEFAULT_TIMEOUT_GRACE, result_cache=None,
+                 max_filter_values=DEFAULT_MAX_FILTER_VALUES, columnar=False):
+        self.pool = pool
+        self.columnar = columnar
+        self.max_batch_queries = max_batch_queries
+        self.max_filter_values = max_filter_values
+        self.timeout_grace = timeout_grace
+        self.result_cache = result_cache
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+    def get_timeout(self, backends):
+        """
+            Client-side deadline: sum of per-query max times plus grace,
+            None when any query is not limited by timeout()
+        """
+        timeouts = [backend.timeout for backend in backends]
+        if not all(timeouts):
+            return None
+        return sum(timeouts) / 1000.0 + self.timeout_grace
+
+    async def run(self, *qs_list):
+        """
+            Sends every max_batch_queries chunk as separate request
+            pipelined over one connection and reads responses in order,
+            columnar sessions decode matches straight into ResultSet columns
+        """
+        backends = [prepare_backend(qs, self.max_filter_values) for qs in qs_list]
+
+        if self.result_cache is None:
+            return await self._run(backends)
+
+        results, keys = self.result_cache.lookup(backends)
+        missed = [i for i, result in enumerate(results) if result is None]
+        if missed:
+            missed_backends = [backends[i] for i in missed]
+            fresh_results = await self._run(missed_backends)
+            self.result_cache.store(missed_backends, [keys[i] for i in missed], fresh_results)
+            for i, result in zip(missed, fresh_results):
+                results[i] = result
+        return results
+
+    async def _run(self, backends):
+        sent = [backend for backend in backends if not backend.matches_nothing]
+        if len(sent) < len(backends):
+            results = fill_empty_results(backends, await self._run(sent))
+            if self.columnar:
+                return [ResultSet.from_result(result) for result in results]
+            return results
+        if not backends:
+            return []
+
+        batches = []
+        for start in range(0, len(backends), self.max_batch_queries):
+            builder = protocol.SearchRequestBuilder()
+            for backend in backends[start:start + self.max_batch_queries]:
+                backend.apply(protocol, builder)
+            batches.append(builder)
+
+        conn = await self.pool.acquire()
+        try:
+            return await asyncio.wait_for(self._run_batches(conn, batches),
+                                          self.get_timeout(backends))
+        except QueryError:
+            raise
+        except BaseException:
+            # response stream position is unknown after cancellation or error
+            conn.close()
+            raise
+        finally:
+            self.pool.release(conn)
+
+    async def _run_batches(self, conn, batches):
+        for builder in batches:
+            conn.send(builder.get_request())
+        await conn.writer.drain()
+
+        results = []
+        error = None
+
+        # every response must be consumed to keep persistent connection usable
+        for builder in batches:
+            try:
+                warning, payload = await conn.read_response()
+            except protocol.ProtocolError as e:
+                error = error or QueryError(str(e))
+                continue
+            batch_results = protocol.parse_search_response(payload, len(builder),
+                                                           self.columnar)
+            if warning:
+                for result in batch_results:
+                    result['warning'] = result['warning'] or warning
+            results.extend(batch_results)
+
+        if error is not None:
+            raise error
+        return results
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+
+from six import with_metaclass
+
+from abc import ABCMeta, abstractmethod
+
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 60
+
+KEY_PREFIX = 'sphinxsearch:'
+
+
+class CacheBackend(with_metaclass(ABCMeta, object)):
+    """
+        Storage interface for ResultCache, implement it to share cached
+        results between processes (memcached, redis, ...)
+    """
+    evictions = 0
+
+    @abstractmethod  # pragma: no cover
+    def get(self, key):
+        """
+            Returns stored value or None
+        """
+
+    @abstractmethod  # pragma: no cover
+    def set(self, key, value, ttl=None):
+        """
+            ttl is in seconds, None means no expiration
+        """
+
+    @abstractmethod  # pragma: no cover
+    def delete(self, key):
+        """"""
+
+
+class LocalCache(CacheBackend):
+    """
+        In-process thread-safe LRU with per-entry TTL
+    """
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                self.evictions += 1
+                return None
+
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = None if ttl is None else time.time() + ttl
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires_at)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResultCache(object):
+    """
+        Caches search results of queries marked with Query.cache().
+
+        Keys include generation token of every index the query reads,
+        invalidate() replaces those tokens, so entries of rotated
+        indexes become unreachable and age out of the backend.
+    """
+    def __init__(self, backend=None, ttl=DEFAULT_CACHE_TTL):
+        self.backend = backend if backend is not None else LocalCache()
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_generation(self, index_name):
+        key = '%sgeneration:%s' % (KEY_PREFIX, index_name)
+        generation = self.backend.get(key)
+        if generation is None:
+            # fresh token instead of a constant, so entries stored before
+            # generation key was evicted never become reachable again
+            generation = uuid.uuid4().hex
+            self.backend.set(key, generation)
+        return generation
+
+    def invalidate(self, index_names):
+        for index_name in index_names:
+            key = '%sgeneration:%s' % (KEY_PREFIX, index_name)
+            self.backend.set(key, uuid.uuid4().hex)
+            self.invalidations += 1
+
+    def get_key(self, backend):
+        index_names = backend.indexes_str.split()
+        generations = tuple(self.get_generation(name) for name in index_names)
+        source = repr((backend.get_key(), generations))
+        digest = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        return '%sresult:%s' % (KEY_PREFIX, digest)
+
+    def get_ttl(self, backend):
+        if backend.cache_ttl is True:
+            return self.ttl
+        return backend.cache_ttl
+
+    def lookup(self, backends):
+        """
+            Returns (results, keys): results has None for every miss,
+            keys is None for queries not marked as cacheable
+        """
+        results = []
+        keys = []
+
+        for backend in backends:
+            if backend.cache_ttl is None:
+                results.append(None)
+                keys.append(None)
+                continue
+
+            key = self.get_key(backend)
+            result = self.backend.get(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+            results.append(result)
+            keys.append(key)
+
+        return results, keys
+
+    def store(self, backends, keys, results):
+        for backend, key, result in zip(backends, keys, results):
+            if key is None or result is None or result.get('error'):
+                continue
+            self.backend.set(key, result, self.get_ttl(backend))
+
+    def run(self, backends, run_func):
+        """
+            Serves cached results and passes only missed queries to run_func
+        """
+        results, keys = self.lookup(backends)
+
+        missed = [i for i, result in enumerate(results) if result is None]
+        if missed:
+            missed_backends = [backends[i] for i in missed]
+            fresh_results = run_func(missed_backends)
+            self.store(missed_backends, [keys[i] for i in missed], fresh_results)
+            for i, result in zip(missed, fresh_results):
+                results[i] = result
+
+        return results
+
+    def get_stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.backend.evictions,
+                'invalidations': self.invalidations}
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+    Batched BuildExcerpts: documents are split into chunks fitting searchd
+    max_packet_size, chunks are built concurrently over pooled connections,
+    snippets are cached by document hash, words and options.
+
+    >>> builder = ExcerptBuilder(server, cache=LocalCache(), workers=4)
+    >>> for snippet in builder.build('products', bodies, 'red phone', limit=200):
+    ...     print(snippet)
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import threading
+
+from six import binary_type, text_type
+from six.moves.queue import Queue, Empty
+
+from ..exceptions import QueryError
+from ..utils import REQUEST_OVERHEAD, get_max_packet_size
+
+
+DEFAULT_WORKERS = 4
+DEFAULT_EXCERPT_TTL = 600
+
+# every document is prefixed with its length
+DOC_OVERHEAD = 4
+
+KEY_PREFIX = 'sphinxsearch:excerpt:'
+
+
+def to_bytes(value):
+    if isinstance(value, binary_type):
+        return value
+    return text_type(value).encode('utf-8')
+
+
+def chunk_docs(positions, sizes, max_size):
+    """
+        Splits positions into consecutive chunks with total size up to max_size
+    """
+    chunks = []
+    chunk = []
+    chunk_size = 0
+    for position in positions:
+        size = sizes[position] + DOC_OVERHEAD
+        if chunk and chunk_size + size > max_size:
+            chunks.append(chunk)
+            chunk = []
+            chunk_size = 0
+        chunk.append(position)
+        chunk_size += size
+
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class ExcerptJob(object):
+    def __init__(self, positions, docs):
+        self.positions = positions
+        self.docs = docs
+        self.excerpts = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class ExcerptBuilder(object):
+    """
+        server is SearchServer, its sessions provide pooled connections.
+        cache is CacheBackend (e.g. LocalCache), None disables caching.
+    """
+    def __init__(self, server, cache=None, workers=DEFAULT_WORKERS, ttl=DEFAULT_EXCERPT_TTL):
+        self.server = server
+        self.cache = cache
+        self.workers = workers
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, index_names):
+        """
+            Makes cached snippets of rotated indexes unreachable
+        """
+        with self._lock:
+            for name in index_names:
+                self._generations[name] = self._generations.get(name, 0) + 1
+
+    def get_key_digest(self, index, words, options):
+        """
+            sha1 of request parameters, document hash is added per document
+        """
+        digest = hashlib.sha1()
+        source = repr((index, self._generations.get(index, 0), words, sorted(options.items())))
+        digest.update(to_bytes(source))
+        return digest
+
+    def get_key(self, digest, doc):
+        digest = digest.copy()
+        digest.update(hashlib.sha1(to_bytes(doc)).digest())
+        return KEY_PREFIX + digest.hexdigest()
+
+    def lookup(self, keys):
+        excerpts = []
+        for key in keys:
+            excerpt = self.cache.get(key)
+            if excerpt is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            excerpts.append(excerpt)
+        return excerpts
+
+    def build_chunk(self, index, docs, words, options):
+        with self.server.get_session() as session:
+            return session.build_excerpts(docs, index, words, options)
+
+    def run_jobs(self, queue, index, words, options, keys, cancelled):
+        while not cancelled.is_set():
+            try:
+                job = queue.get_nowait()
+            except Empty:
+                return
+
+            try:
+                job.excerpts = self.build_chunk(index, job.docs, words, options)
+                if len(job.excerpts) != len(job.docs):
+                    raise QueryError('expected %s excerpts, got %s' % (len(job.docs),
+                                                                       len(job.excerpts)))
+            except Exception as e:
+                job.error = e
+            else:
+                if keys is not None:
+                    for position, excerpt in zip(job.positions, job.excerpts):
+                        self.cache.set(keys[position], excerpt, self.ttl)
+            finally:
+                job.done.set()
+
+    def build(self, index, docs, words, **options):
+        """
+            Starts building at once, returns iterator over snippets in
+            docs order. options are BuildExcerpts options: before_match,
+            after_match, limit, around, ...
+        """
+        index = text_type(index)
+        words = text_type(words)
+        docs = list(docs)
+
+        keys = None
+        excerpts = [None] * len(docs)
+        if self.cache is not None:
+            digest = self.get_key_digest(index, words, options)
+            keys = [self.get_key(digest, doc) for doc in docs]
+            excerpts = self.lookup(keys)
+
+        missed = [position for position, excerpt in enumerate(excerpts) if excerpt is None]
+        cancelled = threading.Event()
+        jobs = self.start_jobs(index, docs, words, options, missed, keys, cancelled)
+        return self.iter_excerpts(excerpts, jobs, cancelled)
+
+    def start_jobs(self, index, docs, words, options, positions, keys, cancelled):
+        if not positions:
+            return []
+
+        request_size = REQUEST_OVERHEAD + len(to_bytes(index)) + len(to_bytes(words))
+        max_size = get_max_packet_size(self.server) - request_size
+        sizes = dict((position, len(to_bytes(docs[position]))) for position in positions)
+        for position, size in sizes.items():
+            if size + DOC_OVERHEAD > max_size:
+                raise QueryError('document %s does not fit max_packet_size' % position)
+
+        # smaller chunks when everything fits, so every worker gets a part
+        payload = sum(sizes.values()) + DOC_OVERHEAD * len(positions)
+        chunk_size = min(max_size, -(-payload // self.workers))
+
+        jobs = []
+        queue = Queue()
+        for chunk in chunk_docs(positions, sizes, chunk_size):
+            job = ExcerptJob(chunk, [docs[position] for position in chunk])
+            jobs.append(job)
+            queue.put(job)
+
+        for _ in range(min(self.workers, len(jobs))):
+            thread = threading.Thread(target=self.run_jobs,
+                                      args=(queue, index, words, options, keys, cancelled))
+            thread.daemon = True
+            thread.start()
+        return jobs
+
+    def iter_excerpts(self, excerpts, jobs, cancelled):
+        pending = dict((job.positions[0], job) for job in jobs)
+        try:
+            for position, excerpt in enumerate(excerpts):
+                job = pending.pop(position, None)
+                if job is not None:
+                    job.done.wait()
+                    if job.error is not None:
+                        raise job.error
+                    for job_position, job_excerpt in zip(job.positions, job.excerpts):
+                        excerpts[job_position] = job_excerpt
+                    excerpt = excerpts[position]
+                yield excerpt
+        finally:
+            # consumer stopped early, queued chunks are not sent
+            cancelled.set()
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
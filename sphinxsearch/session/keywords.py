@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+    BuildKeywords with per-index LRU of tokenized and normalized keywords,
+    entries of an index are dropped when it rotates.
+
+    >>> stats = KeywordStats(server)
+    >>> stats.get('products', ['red phones', 'iphone case'], hits=True)
+    [[{'tokenized': 'red', 'normalized': 'red', 'docs': 120, 'hits': 180}, ...], ...]
+"""
+from __future__ import unicode_literals
+
+import threading
+
+from six import text_type
+
+from .cache import LocalCache
+
+
+DEFAULT_KEYWORDS_CACHE_SIZE = 4096
+
+
+# stats fields BuildKeywords returns with hits=True only
+STATS_KEYS = ('docs', 'hits')
+
+
+def copy_keywords(keywords, hits=True):
+    if hits:
+        return [dict(keyword) for keyword in keywords]
+    return [dict((key, value) for key, value in keyword.items() if key not in STATS_KEYS)
+            for keyword in keywords]
+
+
+class KeywordStats(object):
+    """
+        server is SearchServer, maxsize limits cached queries of every index
+    """
+    def __init__(self, server, maxsize=DEFAULT_KEYWORDS_CACHE_SIZE):
+        self.server = server
+        self.maxsize = maxsize
+
+        self.hits = 0
+        self.misses = 0
+        self._caches = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get_cache(self, index):
+        with self._lock:
+            cache = self._caches.get(index)
+            if cache is None:
+                cache = self._caches[index] = LocalCache(self.maxsize)
+            return cache, self._generations.get(index, 0)
+
+    def invalidate(self, index_names):
+        with self._lock:
+            for name in index_names:
+                self._caches.pop(name, None)
+                self._generations[name] = self._generations.get(name, 0) + 1
+
+    def lookup(self, cache, query, hits):
+        # stats answer serves requests without stats too
+        keywords = cache.get((query, True))
+        if keywords is None and not hits:
+            keywords = cache.get((query, False))
+        return keywords
+
+    def fetch(self, index, queries, hits):
+        """
+            One pooled connection for all queries, sphinx protocol
+            has no multi-query keywords request
+        """
+        with self.server.get_session() as session:
+            return [session.build_keywords(query, index, hits) for query in queries]
+
+    def get(self, index, queries, hits=False):
+        """
+            Returns keywords lists in queries order, repeated and
+            cached queries are not sent
+        """
+        index = text_type(index)
+        queries = [text_type(query) for query in queries]
+        hits = bool(hits)
+        cache, generation = self.get_cache(index)
+
+        found = {}
+        missed = []
+        for query in queries:
+            if query in found:
+                continue
+            keywords = self.lookup(cache, query, hits)
+            if keywords is None:
+                missed.append(query)
+            found[query] = keywords
+        self.hits += len(found) - len(missed)
+        self.misses += len(missed)
+
+        if missed:
+            fetched = self.fetch(index, missed, hits)
+            # index rotated meanwhile, answers may be outdated
+            stale = self.get_cache(index)[1] != generation
+            for query, keywords in zip(missed, fetched):
+                found[query] = keywords
+                if not stale:
+                    cache.set((query, hits), keywords)
+
+        return [copy_keywords(found[query], hits) for query in queries]
+
+    def get_stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': sum(len(cache) for cache in list(self._caches.values()))}
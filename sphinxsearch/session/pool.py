@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import select
+import threading
+import time
+
+from collections import deque
+
+from ..exceptions import ConnectError, PoolTimeout
+from ..loggers import logger
+
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_IDLE_TIMEOUT = 60
+DEFAULT_MAX_LIFETIME = 3600
+
+
+class PooledConnection(object):
+    """
+        Persistent searchd connection owned by ConnectionPool
+    """
+    def __init__(self, client):
+        self.client = client
+        self.created_at = time.time()
+        self.used_at = self.created_at
+        self.broken = False
+        # pool generation, connections of cleared pool are closed on release
+        self.generation = 0
+
+    def is_expired(self, now, idle_timeout, max_lifetime):
+        if idle_timeout and now - self.used_at > idle_timeout:
+            return True
+        if max_lifetime and now - self.created_at > max_lifetime:
+            return True
+        return False
+
+    def is_alive(self):
+        if self.broken:
+            return False
+
+        sock = getattr(self.client, '_socket', None)
+        if sock is None:
+            return False
+
+        # idle persistent socket must not be readable,
+        # otherwise searchd closed it or sent garbage
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (select.error, ValueError, TypeError):
+            return False
+        return not readable
+
+    def close(self):
+        try:
+            self.client.Close()
+        except Exception:  # pragma: no cover
+            logger.exception('Error while closing searchd connection')
+
+
+class ConnectionPool(object):
+    """
+        Bounded thread-safe pool of persistent (Open()'ed) sphinxapi clients
+
+    >>> pool = ConnectionPool(sphinxapi, 'localhost', 9312, size=4)
+    >>> conn = pool.acquire()
+    >>> pool.release(conn)
+    """
+    def __init__(self, api, host, port,
+                 size=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 max_lifetime=DEFAULT_MAX_LIFETIME,
+                 timeout=None):
+        if size < 1:
+            raise ValueError('pool size must be positive')
+
+        self.api = api
+        self.host = host
+        self.port = int(port)
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+
+        self._idle = deque()
+        self._opened = 0
+        self._generation = 0
+        self._cond = threading.Condition(threading.Lock())
+
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.discarded = 0
+
+    def connect(self):
+        client = self.api.SphinxClient()
+        client.SetServer(self.host, self.port)
+        if not client.Open():
+            raise ConnectError(client.GetLastError())
+        return PooledConnection(client)
+
+    def acquire(self, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+
+        deadline = None if timeout is None else time.time() + timeout
+        stale = []
+
+        with self._cond:
+            waited = False
+            generation = self._generation
+
+            while True:
+                conn = self._pop_idle(stale)
+                if conn is not None:
+                    self.hits += 1
+                    break
+
+                if self._opened < self.size:
+                    self._opened += 1
+                    self.misses += 1
+                    break
+
+                if not waited:
+                    waited = True
+                    self.waits += 1
+
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise PoolTimeout('no free connection to %s:%s in %ss'
+                                          % (self.host, self.port, timeout))
+                    self._cond.wait(remaining)
+
+        for old_conn in stale:
+            old_conn.close()
+
+        if conn is None:
+            try:
+                conn = self.connect()
+            except Exception:
+                with self._cond:
+                    self._opened -= 1
+                    self._cond.notify()
+                raise
+            conn.generation = generation
+
+        conn.used_at = time.time()
+        return conn
+
+    def release(self, conn):
+        discard = not conn.is_alive()
+
+        with self._cond:
+            discard = discard or conn.generation != self._generation
+            if discard:
+                self._opened -= 1
+                self.discarded += 1
+            else:
+                conn.used_at = time.time()
+                self._idle.append(conn)
+            self._cond.notify()
+
+        if discard:
+            conn.close()
+
+    def clear(self):
+        """
+            Closes idle connections, checked out ones are closed on release
+        """
+        with self._cond:
+            self._generation += 1
+            idle = list(self._idle)
+            self._idle.clear()
+            self._opened -= len(idle)
+            self._cond.notify_all()
+
+        for conn in idle:
+            conn.close()
+
+    def get_stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return {'size': self.size,
+                    'opened': self._opened,
+                    'idle': idle,
+                    'in_use': self._opened - idle,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'waits': self.waits,
+                    'discarded': self.discarded}
+
+    def _pop_idle(self, stale):
+        # called under lock; most recently used connections go first
+        now = time.time()
+
+        while self._idle:
+            conn = self._idle.pop()
+            if conn.is_expired(now, self.idle_timeout, self.max_lifetime) or not conn.is_alive():
+                self._opened -= 1
+                self.discarded += 1
+                stale.append(conn)
+                continue
+            return conn
+
+        return None
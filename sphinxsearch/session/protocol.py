@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+"""
+    Pure-python encoder/decoder for searchd binary protocol (2.0 command
+    versions). The module mirrors sphinxapi constants, so it can be passed
+    to QueryBackend.apply() as api together with SearchRequestBuilder as client.
+"""
+from __future__ import unicode_literals
+
+from struct import pack, unpack_from, calcsize
+
+from six import text_type
+
+from ..query.filters import FilterValues
+
+
+SEARCHD_COMMAND_SEARCH = 0
+SEARCHD_COMMAND_EXCERPT = 1
+SEARCHD_COMMAND_UPDATE = 2
+SEARCHD_COMMAND_KEYWORDS = 3
+SEARCHD_COMMAND_PERSIST = 4
+SEARCHD_COMMAND_STATUS = 5
+
+VER_COMMAND_SEARCH = 0x119
+VER_COMMAND_EXCERPT = 0x104
+VER_COMMAND_UPDATE = 0x102
+VER_COMMAND_KEYWORDS = 0x100
+VER_COMMAND_STATUS = 0x100
+
+SEARCHD_OK = 0
+SEARCHD_ERROR = 1
+SEARCHD_RETRY = 2
+SEARCHD_WARNING = 3
+
+SPH_MATCH_EXTENDED2 = 6
+SPH_RANK_PROXIMITY_BM25 = 0
+
+SPH_SORT_RELEVANCE = 0
+SPH_SORT_ATTR_DESC = 1
+SPH_SORT_ATTR_ASC = 2
+SPH_SORT_TIME_SEGMENTS = 3
+SPH_SORT_EXTENDED = 4
+SPH_SORT_EXPR = 5
+
+SPH_FILTER_VALUES = 0
+SPH_FILTER_RANGE = 1
+SPH_FILTER_FLOATRANGE = 2
+
+SPH_ATTR_NONE = 0
+SPH_ATTR_INTEGER = 1
+SPH_ATTR_TIMESTAMP = 2
+SPH_ATTR_ORDINAL = 3
+SPH_ATTR_BOOL = 4
+SPH_ATTR_FLOAT = 5
+SPH_ATTR_BIGINT = 6
+SPH_ATTR_STRING = 7
+SPH_ATTR_MULTI = 0x40000001
+SPH_ATTR_MULTI64 = 0x40000002
+
+SPH_GROUPBY_DAY = 0
+SPH_GROUPBY_WEEK = 1
+SPH_GROUPBY_MONTH = 2
+SPH_GROUPBY_YEAR = 3
+SPH_GROUPBY_ATTR = 4
+SPH_GROUPBY_ATTRPAIR = 5
+
+HEADER_FORMAT = '>2HL'
+HEADER_SIZE = calcsize(HEADER_FORMAT)
+
+CLIENT_VERSION = pack('>L', 1)
+PERSIST_REQUEST = pack('>2H2L', SEARCHD_COMMAND_PERSIST, 0, 4, 1)
+
+DEFAULT_MAX_MATCHES = 1000
+
+
+def pack_string(value):
+    if isinstance(value, text_type):
+        value = value.encode('utf-8')
+    return pack('>L', len(value)) + value
+
+
+class SearchRequestBuilder(object):
+    """
+        sphinxapi.SphinxClient compatible setters which serialize
+        AddQuery calls into SEARCHD_COMMAND_SEARCH request
+    """
+    def __init__(self):
+        self.requests = []
+
+        self._offset = 0
+        self._limit = 20
+        self._max_matches = DEFAULT_MAX_MATCHES
+        self._cutoff = 0
+        self._sort = SPH_SORT_RELEVANCE
+        self._sort_by = ''
+        self._min_id = 0
+        self._max_id = 0
+        self._max_query_time = 0
+        self._select = '*'
+
+        self.ResetFilters()
+        self.ResetGroupBy()
+        self.ResetOverrides()
+
+    def __len__(self):
+        return len(self.requests)
+
+    def ResetFilters(self):
+        self._filters = []
+        self._anchor = None
+
+    def ResetGroupBy(self):
+        self._group_by = ''
+        self._group_func = SPH_GROUPBY_DAY
+        self._group_sort = '@group desc'
+        self._group_distinct = ''
+
+    def ResetOverrides(self):
+        self._overrides = {}
+
+    def SetLimits(self, offset, limit, maxmatches=0, cutoff=0):
+        self._offset = offset
+        self._limit = limit
+        if maxmatches > 0:
+            self._max_matches = maxmatches
+        if cutoff >= 0:
+            self._cutoff = cutoff
+
+    def SetMaxQueryTime(self, maxquerytime):
+        self._max_query_time = maxquerytime
+
+    def SetSelect(self, select):
+        self._select = select
+
+    def SetIDRange(self, minid, maxid):
+        assert minid <= maxid
+        self._min_id = minid
+        self._max_id = maxid
+
+    def SetFilter(self, attribute, values, exclude=0):
+        body = pack('>2L', SPH_FILTER_VALUES, len(values))
+        if isinstance(values, FilterValues):
+            body += values.pack()
+        else:
+            body += pack('>%dq' % len(values), *values)
+        self._filters.append((attribute, body, exclude))
+
+    def SetFilterRange(self, attribute, min_, max_, exclude=0):
+        body = pack('>L2q', SPH_FILTER_RANGE, min_, max_)
+        self._filters.append((attribute, body, exclude))
+
+    def SetFilterFloatRange(self, attribute, min_, max_, exclude=0):
+        body = pack('>L2f', SPH_FILTER_FLOATRANGE, min_, max_)
+        self._filters.append((attribute, body, exclude))
+
+    def SetGeoAnchor(self, attrlat, attrlong, latitude, longitude):
+        self._anchor = (attrlat, attrlong, latitude, longitude)
+
+    def SetSortMode(self, mode, clause=''):
+        self._sort = mode
+        self._sort_by = clause
+
+    def SetGroupBy(self, attribute, func, groupsort='@group desc'):
+        self._group_by = attribute
+        self._group_func = func
+        self._group_sort = groupsort
+
+    def SetGroupDistinct(self, attribute):
+        self._group_distinct = attribute
+
+    def SetOverride(self, name, type, values):
+        self._overrides[name] = (type, values)
+
+    def AddQuery(self, query, index='*', comment=''):
+        req = [pack('>5L', self._offset, self._limit, SPH_MATCH_EXTENDED2,
+                    SPH_RANK_PROXIMITY_BM25, self._sort),
+               pack_string(self._sort_by),
+               pack_string(query),
+               pack('>L', 0),  # weights
+               pack_string(index),
+               pack('>LQQ', 1, self._min_id, self._max_id),
+               pack('>L', len(self._filters))]
+
+        for attribute, body, exclude in self._filters:
+            req.append(pack_string(attribute) + body + pack('>L', int(bool(exclude))))
+
+        req.append(pack('>L', self._group_func) + pack_string(self._group_by))
+        req.append(pack('>L', self._max_matches) + pack_string(self._group_sort))
+        req.append(pack('>3L', self._cutoff, 0, 0))  # cutoff, retry count, retry delay
+        req.append(pack_string(self._group_distinct))
+
+        if self._anchor is None:
+            req.append(pack('>L', 0))
+        else:
+            attrlat, attrlong, latitude, longitude = self._anchor
+            req.append(pack('>L', 1) + pack_string(attrlat) + pack_string(attrlong))
+            req.append(pack('>2f', latitude, longitude))
+
+        req.append(pack('>L', 0))  # per-index weights
+        req.append(pack('>L', self._max_query_time))
+        req.append(pack('>L', 0))  # per-field weights
+        req.append(pack_string(comment))
+
+        req.append(pack('>L', len(self._overrides)))
+        for name, (attr_type, values) in self._overrides.items():
+            req.append(pack_string(name) + pack('>2L', attr_type, len(values)))
+            if attr_type == SPH_ATTR_FLOAT:
+                value_format = '>Qf'
+            elif attr_type == SPH_ATTR_BIGINT:
+                value_format = '>Qq'
+            else:
+                value_format = '>Ql'
+            for doc_id, value in values.items():
+                req.append(pack(value_format, doc_id, value))
+
+        req.append(pack_string(self._select))
+
+        self.requests.append(b''.join(req))
+        return len(self.requests) - 1
+
+    def get_request(self):
+        body = b''.join(self.requests)
+        header = pack('>2H3L', SEARCHD_COMMAND_SEARCH, VER_COMMAND_SEARCH,
+                      len(body) + 8, 0, len(self.requests))
+        return header + body
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class ResponseReader(object):
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+
+    def unpack(self, fmt):
+        values = unpack_from(fmt, self.data, self.offset)
+        self.offset += calcsize(fmt)
+        return values
+
+    def read_uint(self):
+        return self.unpack('>L')[0]
+
+    def read_bytes(self):
+        length = self.read_uint()
+        value = self.data[self.offset:self.offset + length]
+        self.offset += length
+        return value
+
+    def read_string(self):
+        return self.read_bytes().decode('utf-8', 'replace')
+
+
+def parse_header(header):
+    """
+        Returns (status, version, length) of searchd response
+    """
+    return unpack_from(HEADER_FORMAT, header)
+
+
+def check_response(status, body):
+    """
+        Returns (warning, payload) for OK/WARNING statuses, raises ProtocolError otherwise
+    """
+    if status == SEARCHD_OK:
+        return '', body
+    if status == SEARCHD_WARNING:
+        reader = ResponseReader(body)
+        warning = reader.read_string()
+        return warning, body[reader.offset:]
+    if status == SEARCHD_ERROR:
+        raise ProtocolError('searchd error: %s' % body[4:].decode('utf-8', 'replace'))
+    if status == SEARCHD_RETRY:
+        raise ProtocolError('temporary searchd error: %s' % body[4:].decode('utf-8', 'replace'))
+    raise ProtocolError('unknown status code %d' % status)
+
+
+def _read_attr_value(reader, attr_type):
+    if attr_type == SPH_ATTR_FLOAT:
+        return reader.unpack('>f')[0]
+    if attr_type == SPH_ATTR_BIGINT:
+        return reader.unpack('>q')[0]
+    if attr_type == SPH_ATTR_STRING:
+        return reader.read_string()
+    if attr_type == SPH_ATTR_MULTI:
+        count = reader.read_uint()
+        return list(reader.unpack('>%dL' % count))
+    if attr_type == SPH_ATTR_MULTI64:
+        count = reader.read_uint() // 2
+        return list(reader.unpack('>%dq' % count))
+    return reader.read_uint()
+
+
+def parse_search_response(payload, count, columnar=False):
+    """
+        Decodes RunQueries payload into sphinxapi-like result dicts,
+        into ResultSet instances without per match dicts when columnar
+    """
+    # results module depends on constants of this one
+    from .results import ResultSet
+
+    reader = ResponseReader(payload)
+    results = []
+
+    for _ in range(count):
+        result = {'error': '', 'warning': ''}
+        results.append(result)
+
+        status = result['status'] = reader.read_uint()
+        if status != SEARCHD_OK:
+            message = reader.read_string()
+            if status == SEARCHD_WARNING:
+                result['warning'] = message
+            else:
+                result['error'] = message
+                continue
+
+        result['fields'] = [reader.read_string() for _ in range(reader.read_uint())]
+
+        attrs = []
+        for _ in range(reader.read_uint()):
+            name = reader.read_string()
+            attrs.append((name, reader.read_uint()))
+        result['attrs'] = [list(attr) for attr in attrs]
+
+        matches_count, id64 = reader.unpack('>2L')
+        match_format = '>QL' if id64 else '>2L'
+
+        if columnar:
+            ids, weights = [], []
+            columns = dict((name, []) for name, _ in attrs)
+            for _ in range(matches_count):
+                doc_id, weight = reader.unpack(match_format)
+                ids.append(doc_id)
+                weights.append(weight)
+                for name, attr_type in attrs:
+                    columns[name].append(_read_attr_value(reader, attr_type))
+        else:
+            matches = result['matches'] = []
+            for _ in range(matches_count):
+                doc_id, weight = reader.unpack(match_format)
+                match_attrs = {}
+                for name, attr_type in attrs:
+                    match_attrs[name] = _read_attr_value(reader, attr_type)
+                matches.append({'id': doc_id, 'weight': weight, 'attrs': match_attrs})
+
+        total, total_found, time_ms, words_count = reader.unpack('>4L')
+        result['total'] = total
+        result['total_found'] = total_found
+        result['time'] = '%.3f' % (time_ms / 1000.0)
+
+        words = result['words'] = []
+        for _ in range(words_count):
+            word = reader.read_string()
+            docs, hits = reader.unpack('>2L')
+            words.append({'word': word, 'docs': docs, 'hits': hits})
+
+        if columnar:
+            results[-1] = ResultSet.from_columns(ids, weights, columns, result)
+
+    if columnar:
+        # failed queries have no matches to decode
+        return [ResultSet.from_result(result) for result in results]
+    return results
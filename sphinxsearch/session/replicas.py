@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+    Replica sets for SessionFactory: balancing, circuit breaker,
+    health checks and retries of searches on another replica.
+
+    >>> server = SearchServer('node1', 9312, replicas=[('node2', 9312), ('node3', 9312)],
+    ...                       balancing='p2c', health_interval=5)
+"""
+from __future__ import unicode_literals
+
+import random
+import threading
+import time
+
+from ..exceptions import (ConnectError, PoolTimeout, QueryError, ReplicaUpdateError,
+                          SessionError)
+from ..loggers import logger
+from .pool import ConnectionPool
+
+
+P2C = 'p2c'
+LEAST_OUTSTANDING = 'least_outstanding'
+BALANCING = (P2C, LEAST_OUTSTANDING)
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_RESET_TIMEOUT = 10.0
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker(object):
+    """
+        Opens after failure_threshold failures in a row, after reset_timeout
+        lets single trial request through (half open), its result closes
+        or opens breaker again
+    """
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if time.time() - self.opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+
+class Replica(object):
+    def __init__(self, host, port, pool_options, breaker):
+        self.host = host
+        self.port = int(port)
+        self.pool_options = pool_options
+        self.breaker = breaker
+
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def get_pool(self, api):
+        with self._lock:
+            if self._pool is None or self._pool.api is not api:
+                if self._pool is not None:
+                    self._pool.clear()
+                self._pool = ConnectionPool(api, self.host, self.port, **self.pool_options)
+            return self._pool
+
+    def reset(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.clear()
+
+    def begin(self):
+        with self._lock:
+            self.outstanding += 1
+            self.requests += 1
+
+    def end(self, ok):
+        with self._lock:
+            self.outstanding -= 1
+            if not ok:
+                self.failures += 1
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def check(self, api):
+        """
+            Opens and closes new connection, updates breaker
+        """
+        try:
+            conn = ConnectionPool(api, self.host, self.port, size=1).connect()
+        except ConnectError as e:
+            logger.warning('replica %s:%s health check failed: %s', self.host, self.port, e)
+            self.breaker.record_failure()
+            return False
+
+        conn.close()
+        self.breaker.record_success()
+        return True
+
+    def get_stats(self):
+        pool = self._pool
+        return {'host': self.host,
+                'port': self.port,
+                'state': self.breaker.state,
+                'outstanding': self.outstanding,
+                'requests': self.requests,
+                'failures': self.failures,
+                'pool': pool and pool.get_stats()}
+
+    def __repr__(self):
+        return 'Replica(%s:%s, %s)' % (self.host, self.port, self.breaker.state)
+
+
+class ReplicaSet(object):
+    def __init__(self, endpoints, pool_options, balancing=P2C,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT):
+        if balancing not in BALANCING:
+            raise ValueError('balancing must be one of %s' % ', '.join(BALANCING))
+
+        self.balancing = balancing
+        self.replicas = [Replica(host, port, pool_options,
+                                 CircuitBreaker(failure_threshold, reset_timeout))
+                         for host, port in endpoints]
+        self._checker = None
+
+    def choose(self, exclude=()):
+        """
+            Least outstanding replica among allowed ones, p2c compares
+            two random replicas instead of scanning all of them
+        """
+        candidates = [replica for replica in self.replicas if replica not in exclude]
+        random.shuffle(candidates)
+
+        while candidates:
+            if self.balancing == P2C:
+                pair = candidates[:2]
+            else:
+                pair = candidates
+            replica = min(pair, key=lambda replica: replica.outstanding)
+
+            if replica.breaker.allow():
+                return replica
+            candidates.remove(replica)
+
+        raise ConnectError('no available replicas')
+
+    def check_health(self, api):
+        """
+            Probes replicas with open breakers, returns healthy replicas count
+        """
+        healthy = 0
+        for replica in self.replicas:
+            if replica.breaker.state == CLOSED or replica.check(api):
+                healthy += 1
+        return healthy
+
+    def start_health_checks(self, get_api, interval):
+        if self._checker is None:
+            self._checker = HealthChecker(self, get_api, interval)
+            self._checker.start()
+
+    def reset(self):
+        if self._checker is not None:
+            self._checker.stop()
+            self._checker = None
+        for replica in self.replicas:
+            replica.reset()
+
+    def get_stats(self):
+        return [replica.get_stats() for replica in self.replicas]
+
+
+class HealthChecker(threading.Thread):
+    def __init__(self, replica_set, get_api, interval):
+        super(HealthChecker, self).__init__()
+        self.daemon = True
+        self.replica_set = replica_set
+        self.get_api = get_api
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.replica_set.check_health(self.get_api())
+            except Exception:
+                logger.exception('replica health check failed')
+
+    def stop(self):
+        self._stopped.set()
+
+
+def is_idempotent(backends):
+    return not any(getattr(backend, 'update', False) for backend in backends)
+
+
+def get_budget(backends, retry_timeout):
+    """
+        Seconds available for retries: max query timeout of batch
+        (SetMaxQueryTime milliseconds) or retry_timeout
+    """
+    timeouts = [backend.timeout for backend in backends if getattr(backend, 'timeout', 0)]
+    if timeouts:
+        return max(timeouts) / 1000.0
+    return retry_timeout
+
+
+class ReplicaSessionMixin(object):
+    """
+        Runs every batch on replica chosen by replica set, searches
+        failed with connection errors are retried on other replicas
+        while time budget allows
+    """
+    def _connect(self):
+        # connection of one replica is taken per batch
+        raise ConnectError('replica sessions have no single connection')
+
+    def _run_batch(self, backends):
+        def run(client):
+            for backend in backends:
+                backend.apply(self.api, client)
+            return client.RunQueries()
+
+        return self._run_with_failover(run, is_idempotent(backends),
+                                       get_budget(backends, self.retry_timeout))
+
+    def build_excerpts(self, docs, index, words, options=None):
+        def build(client):
+            return client.BuildExcerpts(docs, index, words, options or {})
+
+        return self._run_with_failover(build, True, self.retry_timeout)
+
+    def build_keywords(self, query, index, hits=False):
+        def build(client):
+            return client.BuildKeywords(query, index, hits)
+
+        return self._run_with_failover(build, True, self.retry_timeout)
+
+    def update_attributes(self, index, attrs, values, mva=False):
+        """
+            Every replica keeps own attributes, so all of them are updated.
+            Ejected replicas are not contacted; when any replica is not
+            updated ReplicaUpdateError tells which ones were.
+        """
+        def update(client):
+            updated = client.UpdateAttributes(index, attrs, values, mva)
+            return None if updated is None or updated < 0 else updated
+
+        updated = {}
+        failed = {}
+        for replica in self.replica_set.replicas:
+            key = (replica.host, replica.port)
+            if not replica.breaker.allow():
+                failed[key] = ConnectError('replica is ejected')
+                continue
+            try:
+                updated[key] = self._run_on_replica(replica, update)
+            except SessionError as e:
+                failed[key] = e
+
+        if failed:
+            raise ReplicaUpdateError('%s of %s replicas are not updated: %s' % (
+                len(failed), len(self.replica_set.replicas),
+                '; '.join('%s:%s %s' % (host, port, error)
+                          for (host, port), error in sorted(failed.items()))),
+                updated, failed)
+        return max(updated.values())
+
+    def _run_with_failover(self, func, retry, budget):
+        deadline = None if budget is None else time.time() + budget
+        tried = []
+
+        while True:
+            replica = self.replica_set.choose(exclude=tried)
+            tried.append(replica)
+
+            try:
+                return self._run_on_replica(replica, func)
+            except (ConnectError, PoolTimeout) as e:
+                logger.warning('replica %s:%s failed: %s', replica.host, replica.port, e)
+                error = e
+
+            if not retry or len(tried) == len(self.replica_set.replicas):
+                raise error
+            if deadline is not None and time.time() >= deadline:
+                raise error
+
+    def _run_on_replica(self, replica, func):
+        """
+            func gets sphinxapi client and returns its answer or None
+        """
+        pool = replica.get_pool(self.api)
+        replica.begin()
+        ok = False
+        conn = None
+        try:
+            conn = pool.acquire()
+            client = conn.client
+
+            try:
+                results = func(client)
+            except Exception:
+                conn.broken = True
+                raise
+
+            if results is None:
+                # failed requests may stay queued in client
+                conn.broken = True
+                if client.IsConnectError():
+                    raise ConnectError(client.GetLastError())
+                # searchd answered, replica is fine
+                ok = True
+                raise QueryError(client.GetLastError())
+
+            ok = True
+            return results
+        finally:
+            if conn is not None:
+                pool.release(conn)
+            replica.end(ok)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+    Columnar search results: ids, weights and every numeric attr are kept
+    in typed arrays instead of a dict per match, rows are small views
+    built on access. ResultSet still answers result['matches'],
+    result['total_found'], ... like sphinxapi result dicts.
+
+    >>> result = qs.fetch(session)
+    >>> result.column('price')
+    array('I', [990, 450, ...])
+    >>> [(row.id, row.price) for row in result]
+    >>> result.to_numpy()['price']
+"""
+from __future__ import unicode_literals
+
+from array import array
+from collections import OrderedDict
+
+from six import integer_types
+from six.moves import range
+
+from ..models.attrs import BigInt, Bool, Float, Int, StringOrd, TimeStamp, WordCount
+from ..query.filters import INT64_TYPECODE
+from .protocol import (SPH_ATTR_BIGINT, SPH_ATTR_BOOL, SPH_ATTR_FLOAT, SPH_ATTR_INTEGER,
+                       SPH_ATTR_ORDINAL, SPH_ATTR_TIMESTAMP)
+
+
+# array typecodes of model attrs, other attrs (strings, MVA) are lists
+TYPECODES = {Int: 'I', TimeStamp: 'I', Bool: 'I', WordCount: 'I', StringOrd: 'I',
+             BigInt: INT64_TYPECODE, Float: 'f'}
+
+# typecodes of searchd attr types, for attrs missing in model
+API_TYPECODES = {SPH_ATTR_INTEGER: 'I', SPH_ATTR_TIMESTAMP: 'I', SPH_ATTR_BOOL: 'I',
+                 SPH_ATTR_ORDINAL: 'I', SPH_ATTR_BIGINT: INT64_TYPECODE, SPH_ATTR_FLOAT: 'f'}
+
+ID_TYPECODE = INT64_TYPECODE
+WEIGHT_TYPECODE = 'I'
+
+INFO_KEYS = ('status', 'error', 'warning', 'fields', 'attrs',
+             'total', 'total_found', 'time', 'words')
+MATCH_KEYS = ('id', 'weight', 'attrs')
+
+
+def get_typecode(attr_name, attr_type, index_attrs):
+    attr = index_attrs.get(attr_name)
+    if attr is not None:
+        return TYPECODES.get(type(attr))
+    return API_TYPECODES.get(attr_type)
+
+
+def make_column(typecode, values):
+    """
+        Typed array of values, list when values do not fit typecode
+    """
+    if typecode is None:
+        return values
+    try:
+        return array(typecode, values)
+    except (OverflowError, TypeError):
+        return values
+
+
+class Row(object):
+    """
+        Match view: row.id, row.weight, row.<attr> and match-like
+        row['id'], row['weight'], row['attrs']
+    """
+    __slots__ = ('result', 'position')
+
+    def __init__(self, result, position):
+        self.result = result
+        self.position = position
+
+    @property
+    def id(self):
+        return self.result.ids[self.position]
+
+    @property
+    def weight(self):
+        return self.result.weights[self.position]
+
+    @property
+    def attrs(self):
+        position = self.position
+        return dict((name, column[position]) for name, column in self.result.columns.items())
+
+    def __getattr__(self, name):
+        if name in Row.__slots__:
+            # not initialized row, e.g. while copying
+            raise AttributeError(name)
+        try:
+            return self.result.columns[name][self.position]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, key):
+        if key not in MATCH_KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in MATCH_KEYS:
+            return default
+        return getattr(self, key)
+
+    def __eq__(self, other):
+        if isinstance(other, Row):
+            other = {'id': other.id, 'weight': other.weight, 'attrs': other.attrs}
+        return {'id': self.id, 'weight': self.weight, 'attrs': self.attrs} == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Row(%s, %s, %r)' % (self.id, self.weight, self.attrs)
+
+
+class ResultSet(object):
+    """
+        columns is OrderedDict of attr name -> array or list,
+        info holds result keys besides matches
+    """
+    def __init__(self, ids, weights, columns, info):
+        self.ids = ids
+        self.weights = weights
+        self.columns = columns
+        self.info = info
+
+    @classmethod
+    def from_columns(cls, ids, weights, columns, info, index=None):
+        """
+            ids, weights and columns values are lists, typed by model
+            __attrs__ of index or by searchd attr types
+        """
+        index_attrs = getattr(index, '__attrs__', {})
+        typed = OrderedDict()
+        for attr_name, attr_type in info.get('attrs', []):
+            typecode = get_typecode(attr_name, attr_type, index_attrs)
+            typed[attr_name] = make_column(typecode, columns[attr_name])
+
+        return cls(make_column(ID_TYPECODE, ids), make_column(WEIGHT_TYPECODE, weights),
+                   typed, info)
+
+    @classmethod
+    def from_result(cls, result, index=None):
+        """
+            ResultSet of sphinxapi result dict, index is Index class
+        """
+        if isinstance(result, ResultSet):
+            return result
+
+        info = dict((key, result[key]) for key in INFO_KEYS if key in result)
+        info.setdefault('attrs', [])
+        matches = result.get('matches') or []
+        columns = dict((attr_name, [match['attrs'][attr_name] for match in matches])
+                       for attr_name, _ in info['attrs'])
+        return cls.from_columns([match['id'] for match in matches],
+                                [match['weight'] for match in matches],
+                                columns, info, index)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for position in range(len(self.ids)):
+            yield Row(self, position)
+
+    @property
+    def matches(self):
+        return list(self)
+
+    def __getitem__(self, key):
+        if isinstance(key, integer_types):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError(key)
+            return Row(self, key)
+        if key == 'matches':
+            return self.matches
+        return self.info[key]
+
+    def __setitem__(self, key, value):
+        if key not in INFO_KEYS:
+            raise KeyError(key)
+        self.info[key] = value
+
+    def __contains__(self, key):
+        return key == 'matches' or key in self.info
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def column(self, attr_name):
+        return self.columns[attr_name]
+
+    def to_numpy(self):
+        """
+            Dict of numpy arrays sharing memory of id, weight and typed attr
+            columns; string and MVA attrs are not exported
+        """
+        import numpy
+
+        exported = {'id': self.ids, 'weight': self.weights}
+        exported.update(self.columns)
+        return dict((name, numpy.frombuffer(column, dtype=column.typecode))
+                    for name, column in exported.items()
+                    if isinstance(column, array))
+
+    def __repr__(self):
+        return 'ResultSet(%s of %s)' % (len(self), self.info.get('total_found', 0))
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+    Client-side scatter-gather: the same queries go to every shard,
+    sorted match lists are merged with k-way heap merge.
+
+    >>> session = ShardedSession([node1, node2, node3], timeout=0.5)
+    >>> result, = session.run(Query('products').like('phone').orderby('-price')[40:60])
+"""
+from __future__ import unicode_literals
+
+import heapq
+import numbers
+import re
+import threading
+import time
+
+from ..exceptions import QueryError
+from ..query.orderby import Relevance, Asc, Desc, MultiSort, Expr
+from .results import ResultSet, Row
+
+
+# searchd default for max_matches option
+DEFAULT_MAX_MATCHES = 1000
+
+SEARCHD_OK = 0
+SEARCHD_WARNING = 3
+
+SORT_EXPR_ATTR = '_sort_expr'
+
+SPECIAL_SORT_ATTRS = {'@weight': 'weight', '@relevance': 'weight', '@rank': 'weight',
+                      '@id': 'id'}
+
+RE_SORT_CLAUSE = re.compile(r'^\s*(\S+)(?:\s+(ASC|DESC))?\s*$', re.I)
+
+
+class Reversed(object):
+    """
+        Inverts ordering of non-numeric values in merge keys
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def get_value(match, name):
+    if name in ('weight', 'id'):
+        return match[name]
+    return match['attrs'][name]
+
+
+def desc_key(value):
+    if isinstance(value, numbers.Number):
+        return -value
+    return Reversed(value)
+
+
+def parse_sort_clauses(expr):
+    """
+        'price DESC, @weight DESC' -> [('price', True), ('weight', True)]
+    """
+    clauses = []
+    for clause in expr.split(','):
+        match = RE_SORT_CLAUSE.match(clause)
+        if match is None:
+            raise QueryError('invalid sort clause %r' % clause)
+        name, direction = match.groups()
+        name = SPECIAL_SORT_ATTRS.get(name.lower(), name)
+        clauses.append((name, (direction or 'ASC').upper() == 'DESC'))
+    return clauses
+
+
+def get_sort_clauses(sort_mode):
+    """
+        Sort mode as (name, descending) pairs in sphinx order,
+        ties are broken by document id like searchd does
+    """
+    if sort_mode is None or isinstance(sort_mode, Relevance):
+        clauses = [('weight', True)]
+    elif isinstance(sort_mode, (Asc, Desc)):
+        name = SPECIAL_SORT_ATTRS.get(sort_mode.expr.lower(), sort_mode.expr)
+        clauses = [(name, isinstance(sort_mode, Desc))]
+        if name != 'weight':
+            clauses.append(('weight', True))
+    elif isinstance(sort_mode, MultiSort):
+        clauses = parse_sort_clauses(sort_mode.expr)
+    elif isinstance(sort_mode, Expr):
+        clauses = [(SORT_EXPR_ATTR, True)]
+    else:
+        raise QueryError('%s can not be merged across shards' % type(sort_mode).__name__)
+
+    if 'id' not in [name for name, _ in clauses]:
+        clauses.append(('id', False))
+    return clauses
+
+
+def get_sort_key(sort_mode):
+    clauses = get_sort_clauses(sort_mode)
+
+    def key(match):
+        return tuple(desc_key(get_value(match, name)) if descending else get_value(match, name)
+                     for name, descending in clauses)
+    return key
+
+
+def merge_matches(match_lists, key, count):
+    """
+        First count matches of k sorted lists, O(count * log k)
+    """
+    heap = []
+    for shard, matches in enumerate(match_lists):
+        if matches:
+            heap.append((key(matches[0]), shard, 0))
+    heapq.heapify(heap)
+
+    merged = []
+    while heap and len(merged) < count:
+        _, shard, position = heap[0]
+        matches = match_lists[shard]
+        merged.append(matches[position])
+
+        position += 1
+        if position < len(matches):
+            heapq.heapreplace(heap, (key(matches[position]), shard, position))
+        else:
+            heapq.heappop(heap)
+    return merged
+
+
+def merge_words(word_lists):
+    words = []
+    positions = {}
+    for word_list in word_lists:
+        for word in word_list:
+            position = positions.get(word['word'])
+            if position is None:
+                positions[word['word']] = len(words)
+                words.append(dict(word))
+            else:
+                words[position]['docs'] += word['docs']
+                words[position]['hits'] += word['hits']
+    return words
+
+
+def strip_sort_expr(results, matches):
+    """
+        Rows of columnar results build attrs from ResultSet columns,
+        so the column is dropped instead of match attr
+    """
+    for result in results:
+        if isinstance(result, ResultSet):
+            result.columns.pop(SORT_EXPR_ATTR, None)
+    for match in matches:
+        if not isinstance(match, Row):
+            match['attrs'].pop(SORT_EXPR_ATTR, None)
+
+
+def is_ok(result):
+    return result is not None and result.get('status') in (SEARCHD_OK, SEARCHD_WARNING)
+
+
+class ShardedSession(object):
+    """
+        servers are SearchServer instances holding the same index schema.
+        Shards which fail or do not answer within timeout seconds are
+        skipped when partial is True, merged result then gets
+        partial = True and failed shards in warning.
+    """
+    def __init__(self, servers, timeout=None, partial=True):
+        self.servers = list(servers)
+        self.timeout = timeout
+        self.partial = partial
+
+    def get_shard_backend(self, backend):
+        if backend.group_by is not None or backend.group_by_distinct is not None:
+            raise QueryError('group by queries can not be merged across shards')
+
+        window = backend.offset + backend.limit
+        max_matches = backend.max_matches or DEFAULT_MAX_MATCHES
+        if window > max_matches:
+            max_matches = window
+
+        shard_backend = backend.clone()
+        shard_backend.set_limit(0, window, max_matches, backend.cutoff)
+
+        if isinstance(backend.sort_mode, Expr):
+            # searchd does not return sort expression value, select it
+            shard_backend.set_select('%s, %s AS %s' % (backend.get_select(),
+                                                       backend.sort_mode.expr,
+                                                       SORT_EXPR_ATTR))
+        return shard_backend
+
+    def run_shard(self, server, backends, results, errors, position):
+        try:
+            with server.get_session() as session:
+                results[position] = session.run(*backends)
+        except Exception as e:
+            errors[position] = e
+
+    def scatter(self, backends):
+        results = [None] * len(self.servers)
+        errors = [None] * len(self.servers)
+
+        threads = []
+        for position, server in enumerate(self.servers):
+            thread = threading.Thread(target=self.run_shard,
+                                      args=(server, backends, results, errors, position))
+            # stuck shard must not block interpreter exit
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        for position, thread in enumerate(threads):
+            thread.join(None if deadline is None else max(deadline - time.time(), 0))
+            if thread.is_alive():
+                errors[position] = QueryError('shard timed out')
+
+        # late answers of timed out shards are dropped
+        errors = list(errors)
+        results = [None if error is not None else result
+                   for result, error in zip(results, errors)]
+        return results, errors
+
+    def gather(self, backend, shard_results, failed):
+        ok_results = [result for result in shard_results if is_ok(result)]
+        if not ok_results:
+            errors = [result['error'] for result in shard_results if result is not None]
+            return {'status': 1, 'error': '; '.join(errors) or 'all shards failed',
+                    'warning': '', 'fields': [], 'attrs': [], 'matches': [],
+                    'total': 0, 'total_found': 0, 'time': '0.000', 'words': []}
+
+        key = get_sort_key(backend.sort_mode)
+        window = backend.offset + backend.limit
+        merged = merge_matches([result['matches'] for result in ok_results], key, window)
+        matches = merged[backend.offset:window]
+
+        attrs = ok_results[0]['attrs']
+        if isinstance(backend.sort_mode, Expr):
+            strip_sort_expr(ok_results, matches)
+            attrs = [attr for attr in attrs if attr[0] != SORT_EXPR_ATTR]
+
+        warnings = [result['warning'] for result in ok_results if result.get('warning')]
+        failed = failed + [result['error'] for result in shard_results
+                           if result is not None and not is_ok(result)]
+        if failed:
+            warnings.append('%s shards failed: %s' % (len(failed), '; '.join(failed)))
+
+        max_matches = max(backend.max_matches or DEFAULT_MAX_MATCHES, window)
+        return {'status': SEARCHD_WARNING if warnings else SEARCHD_OK,
+                'error': '',
+                'warning': '; '.join(warnings),
+                'fields': ok_results[0]['fields'],
+                'attrs': attrs,
+                'matches': matches,
+                'total': min(sum(int(result['total']) for result in ok_results), max_matches),
+                'total_found': sum(int(result['total_found']) for result in ok_results),
+                'time': '%.3f' % max(float(result['time']) for result in ok_results),
+                'words': merge_words(result['words'] for result in ok_results),
+                'partial': bool(failed)}
+
+    def run(self, *qs_list):
+        """
+            Returns merged results in queries order
+        """
+        backends = [getattr(qs, 'query', qs) for qs in qs_list]
+        shard_backends = [self.get_shard_backend(backend) for backend in backends]
+
+        results, errors = self.scatter(shard_backends)
+
+        failed = ['%s:%s %s' % (server.host, server.port, error)
+                  for server, error in zip(self.servers, errors) if error is not None]
+        if failed and (not self.partial or len(failed) == len(self.servers)):
+            raise QueryError('; '.join(failed))
+
+        answered = [shard_results for shard_results in results if shard_results is not None]
+        return [self.gather(backend, [shard_results[i] for shard_results in answered], failed)
+                for i, backend in enumerate(backends)]
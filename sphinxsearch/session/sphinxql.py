@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+"""
+    SphinxQL backend. SelectBuilder turns sphinxapi-style setter calls into
+    parameterized SELECT statements, SphinxClient runs them in one
+    multi-statement round trip over MySQL protocol (PyMySQL). The module
+    mirrors sphinxapi constants and SphinxClient interface, so it can be
+    used as api of SearchServer listening with mysql41 protocol.
+"""
+from __future__ import unicode_literals
+
+import re
+
+from collections import defaultdict
+
+from six import text_type
+
+from ..exceptions import ConfigError, QueryError
+from .protocol import (SPH_SORT_RELEVANCE, SPH_SORT_ATTR_DESC, SPH_SORT_ATTR_ASC,
+                       SPH_SORT_TIME_SEGMENTS, SPH_SORT_EXTENDED, SPH_SORT_EXPR,
+                       SPH_GROUPBY_DAY, SPH_GROUPBY_WEEK, SPH_GROUPBY_MONTH,
+                       SPH_GROUPBY_YEAR, SPH_GROUPBY_ATTR, SPH_GROUPBY_ATTRPAIR,
+                       SPH_ATTR_NONE, SPH_ATTR_INTEGER, SPH_ATTR_TIMESTAMP,
+                       SPH_ATTR_ORDINAL, SPH_ATTR_BOOL, SPH_ATTR_FLOAT,
+                       SPH_ATTR_BIGINT, SPH_ATTR_STRING, SPH_ATTR_MULTI,
+                       SPH_ATTR_MULTI64)
+
+
+DEFAULT_PORT = 9306
+DEFAULT_CONNECT_TIMEOUT = 1.0
+
+PROTOCOL = 'mysql41'
+
+# sphinxapi magic names and their SphinxQL counterparts
+MAGIC_NAMES = {'@id': 'id',
+               '@weight': 'WEIGHT()',
+               '@rank': 'WEIGHT()',
+               '@relevance': 'WEIGHT()',
+               '@group': '_group',
+               '@count': '_count',
+               '@distinct': '_distinct',
+               '@geodist': '_geodist',
+               '@expr': '_expr'}
+
+RE_MAGIC_NAME = re.compile(r'@\w+')
+
+GROUPBY_FUNCTIONS = {SPH_GROUPBY_DAY: 'YEARMONTHDAY',
+                     SPH_GROUPBY_MONTH: 'YEARMONTH',
+                     SPH_GROUPBY_YEAR: 'YEAR'}
+
+# mysql client errors (CR_*) start from 2000, server ones are below
+CLIENT_ERRORS_START = 2000
+
+
+def translate(expr):
+    """
+        Replaces sphinxapi magic names, escapes % for statement formatting
+    """
+    expr = RE_MAGIC_NAME.sub(lambda m: MAGIC_NAMES.get(m.group(0).lower(), m.group(0)), expr)
+    return expr.replace('%', '%%')
+
+
+def placeholders(count):
+    return ', '.join(['%s'] * count)
+
+
+class SelectBuilder(object):
+    """
+        sphinxapi.SphinxClient compatible setters which compile every
+        AddQuery call into (sql, params) statement
+    """
+    def __init__(self):
+        self.statements = []
+
+        self._offset = 0
+        self._limit = 20
+        self._max_matches = 0
+        self._cutoff = 0
+        self._sort = SPH_SORT_RELEVANCE
+        self._sort_by = ''
+        self._min_id = 0
+        self._max_id = 0
+        self._max_query_time = 0
+        self._select = '*'
+
+        self.ResetFilters()
+        self.ResetGroupBy()
+        self.ResetOverrides()
+
+    def __len__(self):
+        return len(self.statements)
+
+    def ResetFilters(self):
+        self._filters = []
+        self._anchor = None
+
+    def ResetGroupBy(self):
+        self._group_by = ''
+        self._group_func = SPH_GROUPBY_DAY
+        self._group_sort = '@group desc'
+        self._group_distinct = ''
+
+    def ResetOverrides(self):
+        self._overrides = {}
+
+    def SetLimits(self, offset, limit, maxmatches=0, cutoff=0):
+        self._offset = offset
+        self._limit = limit
+        self._max_matches = maxmatches
+        self._cutoff = cutoff
+
+    def SetMaxQueryTime(self, maxquerytime):
+        self._max_query_time = maxquerytime
+
+    def SetSelect(self, select):
+        self._select = select
+
+    def SetIDRange(self, minid, maxid):
+        assert minid <= maxid
+        self._min_id = minid
+        self._max_id = maxid
+
+    def SetFilter(self, attribute, values, exclude=0):
+        if not values:
+            # like searchd, empty values match nothing, excluding them is no-op
+            if not exclude:
+                self._filters.append((None, [], '0'))
+            return
+        operator = 'NOT IN' if exclude else 'IN'
+        condition = '%s %s (%s)' % (translate(attribute), operator, placeholders(len(values)))
+        self._filters.append((condition, list(values), None))
+
+    def SetFilterRange(self, attribute, min_, max_, exclude=0):
+        attribute = translate(attribute)
+        if exclude:
+            # WHERE has no OR/NOT BETWEEN, excluded range goes to select list
+            expr = '%s < %%s OR %s > %%s' % (attribute, attribute)
+            self._filters.append((None, [min_, max_], expr))
+        else:
+            condition = '%s BETWEEN %%s AND %%s' % attribute
+            self._filters.append((condition, [min_, max_], None))
+
+    def SetFilterFloatRange(self, attribute, min_, max_, exclude=0):
+        self.SetFilterRange(attribute, float(min_), float(max_), exclude)
+
+    def SetGeoAnchor(self, attrlat, attrlong, latitude, longitude):
+        self._anchor = (attrlat, attrlong, latitude, longitude)
+
+    def SetSortMode(self, mode, clause=''):
+        self._sort = mode
+        self._sort_by = clause
+
+    def SetGroupBy(self, attribute, func, groupsort='@group desc'):
+        self._group_by = attribute
+        self._group_func = func
+        self._group_sort = groupsort
+
+    def SetGroupDistinct(self, attribute):
+        self._group_distinct = attribute
+
+    def SetOverride(self, name, type, values):
+        self._overrides[name] = values
+
+    def get_sort_clause(self):
+        if self._sort == SPH_SORT_RELEVANCE:
+            return 'WEIGHT() DESC, id ASC'
+        elif self._sort == SPH_SORT_ATTR_DESC:
+            return '%s DESC' % translate(self._sort_by)
+        elif self._sort == SPH_SORT_ATTR_ASC:
+            return '%s ASC' % translate(self._sort_by)
+        elif self._sort == SPH_SORT_EXTENDED:
+            return translate(self._sort_by)
+        elif self._sort == SPH_SORT_EXPR:
+            return '_expr DESC'
+        raise QueryError('sort mode %s is not supported by SphinxQL' % self._sort)
+
+    def get_group_key(self):
+        if self._group_func == SPH_GROUPBY_ATTR:
+            return translate(self._group_by)
+        elif self._group_func in GROUPBY_FUNCTIONS:
+            return '%s(%s)' % (GROUPBY_FUNCTIONS[self._group_func],
+                               translate(self._group_by))
+        raise QueryError('group by function %s is not supported by SphinxQL' % self._group_func)
+
+    def get_override_expr(self, name, values):
+        """
+            Nested IF() over document ids, one branch per distinct value
+        """
+        ids_by_value = defaultdict(list)
+        for doc_id, value in values.items():
+            ids_by_value[value].append(doc_id)
+
+        expr = translate(name)
+        params = []
+        for value, ids in sorted(ids_by_value.items(), reverse=True):
+            expr = 'IF(IN(id, %s), %%s, %s)' % (placeholders(len(ids)), expr)
+            params = sorted(ids) + [value] + params
+        return expr, params
+
+    def AddQuery(self, query, index='*', comment=''):
+        columns = [translate(self._select), 'WEIGHT() AS _weight']
+        select_params = []
+        where = []
+        where_params = []
+
+        if self._anchor is not None:
+            attrlat, attrlong, latitude, longitude = self._anchor
+            columns.append('GEODIST(%%s, %%s, %s, %s) AS _geodist' % (translate(attrlat),
+                                                                      translate(attrlong)))
+            select_params.extend([latitude, longitude])
+
+        for name in sorted(self._overrides):
+            expr, params = self.get_override_expr(name, self._overrides[name])
+            columns.append('%s AS _override_%s' % (expr, translate(name)))
+            select_params.extend(params)
+
+        if self._sort == SPH_SORT_EXPR:
+            columns.append('%s AS _expr' % translate(self._sort_by))
+
+        if query:
+            where.append('MATCH(%s)')
+            where_params.append(query)
+
+        if self._max_id:
+            where.append('id BETWEEN %s AND %s')
+            where_params.extend([self._min_id, self._max_id])
+
+        for position, (condition, params, expr) in enumerate(self._filters):
+            if expr is None:
+                where.append(condition)
+                where_params.extend(params)
+            else:
+                alias = '_filter%s' % position
+                columns.append('%s AS %s' % (expr, alias))
+                select_params.extend(params)
+                where.append('%s = 1' % alias)
+
+        if self._group_by:
+            columns.append('GROUPBY() AS _group')
+            columns.append('COUNT(*) AS _count')
+            if self._group_distinct:
+                columns.append('COUNT(DISTINCT %s) AS _distinct' % translate(self._group_distinct))
+
+        sql = ['SELECT %s FROM %s' % (', '.join(columns), ', '.join(index.split()))]
+        if where:
+            sql.append('WHERE %s' % ' AND '.join(where))
+
+        if self._group_by:
+            sql.append('GROUP BY %s' % self.get_group_key())
+            sql.append('WITHIN GROUP ORDER BY %s' % self.get_sort_clause())
+            sql.append('ORDER BY %s' % translate(self._group_sort))
+        elif self._sort != SPH_SORT_RELEVANCE:
+            sql.append('ORDER BY %s' % self.get_sort_clause())
+
+        sql.append('LIMIT %s, %s')
+        limit_params = [self._offset, self._limit]
+
+        options = []
+        for name, value in (('max_matches', self._max_matches),
+                            ('cutoff', self._cutoff),
+                            ('max_query_time', self._max_query_time)):
+            if value:
+                options.append('%s=%%s' % name)
+                limit_params.append(value)
+        if comment:
+            options.append('comment=%s')
+            limit_params.append(comment)
+        if options:
+            sql.append('OPTION %s' % ', '.join(options))
+
+        params = select_params + where_params + limit_params
+        self.statements.append((' '.join(sql), tuple(params)))
+        return len(self.statements) - 1
+
+
+def get_attr_type(type_code):
+    from pymysql.constants import FIELD_TYPE
+
+    if type_code == FIELD_TYPE.LONGLONG:
+        return SPH_ATTR_BIGINT
+    elif type_code in (FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE):
+        return SPH_ATTR_FLOAT
+    elif type_code in (FIELD_TYPE.LONG, FIELD_TYPE.INT24, FIELD_TYPE.SHORT, FIELD_TYPE.TINY):
+        return SPH_ATTR_INTEGER
+    return SPH_ATTR_STRING
+
+
+def parse_meta(rows):
+    """
+        SHOW META rows into sphinxapi result fields
+    """
+    meta = dict(rows)
+    words = []
+    position = 0
+    while 'keyword[%s]' % position in meta:
+        words.append({'word': meta['keyword[%s]' % position],
+                      'docs': int(meta.get('docs[%s]' % position, 0)),
+                      'hits': int(meta.get('hits[%s]' % position, 0))})
+        position += 1
+
+    return {'total': int(meta.get('total', 0)),
+            'total_found': int(meta.get('total_found', 0)),
+            'time': meta.get('time', '0.000'),
+            'words': words}
+
+
+def build_result(description, rows, meta_rows):
+    names = [column[0] for column in description]
+    attrs = [[name, get_attr_type(column[1])] for name, column in zip(names, description)
+             if name not in ('id', '_weight')]
+
+    matches = []
+    for row in rows:
+        row = dict(zip(names, row))
+        doc_id = row.pop('id')
+        weight = row.pop('_weight', 1)
+        matches.append({'id': doc_id, 'weight': weight, 'attrs': row})
+
+    result = {'status': 0, 'error': '', 'warning': '',
+              'fields': [], 'attrs': attrs, 'matches': matches}
+    result.update(parse_meta(meta_rows))
+    return result
+
+
+def build_error(error):
+    return {'status': 1, 'error': text_type(error), 'warning': '',
+            'fields': [], 'attrs': [], 'matches': [],
+            'total': 0, 'total_found': 0, 'time': '0.000', 'words': []}
+
+
+class SphinxClient(SelectBuilder):
+    """
+        sphinxapi.SphinxClient replacement talking SphinxQL, RunQueries()
+        sends every queued SELECT followed by SHOW META in single
+        multi-statement request
+    """
+    def __init__(self):
+        super(SphinxClient, self).__init__()
+        self._host = 'localhost'
+        self._port = DEFAULT_PORT
+        self._timeout = DEFAULT_CONNECT_TIMEOUT
+        self._conn = None
+        self._socket = None
+        self._error = ''
+        self._connerror = False
+
+    def SetServer(self, host, port=DEFAULT_PORT):
+        self._host = host
+        self._port = int(port)
+
+    def SetConnectTimeout(self, timeout):
+        self._timeout = float(timeout)
+
+    def GetLastError(self):
+        return self._error
+
+    def IsConnectError(self):
+        return self._connerror
+
+    def Open(self):
+        try:
+            import pymysql
+        except ImportError:
+            raise ConfigError('SphinxQL backend requires PyMySQL package')
+
+        from pymysql.constants import CLIENT
+
+        try:
+            self._conn = pymysql.connect(host=self._host,
+                                         port=self._port,
+                                         charset='utf8',
+                                         autocommit=True,
+                                         connect_timeout=self._timeout,
+                                         client_flag=CLIENT.MULTI_STATEMENTS)
+        except pymysql.MySQLError as e:
+            self._error = 'connection to %s:%s failed (%s)' % (self._host, self._port, e)
+            self._connerror = True
+            return False
+
+        self._socket = self._conn._sock
+        self._connerror = False
+        return True
+
+    def Close(self):
+        conn, self._conn = self._conn, None
+        self._socket = None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def RunQueries(self):
+        if not self.statements:
+            self._error = 'no queries defined, issue AddQuery() first'
+            return None
+
+        statements, self.statements = self.statements, []
+        if self._conn is None and not self.Open():
+            return None
+
+        import pymysql
+
+        results = []
+        while len(results) < len(statements):
+            try:
+                self._execute(statements[len(results):], results)
+            except pymysql.MySQLError as e:
+                if self.handle_error(e):
+                    return None
+
+                # searchd stops multi-statement on first failed SELECT,
+                # statements after it are resent with next request
+                results.append(build_error(e.args[-1]))
+
+        self._error = ''
+        return results
+
+    def Execute(self, query, params=()):
+        """
+            Runs single statement (INSERT, REPLACE, DELETE, ...),
+            returns affected rows count or None on error
+        """
+        if self._conn is None and not self.Open():
+            return None
+
+        import pymysql
+
+        cursor = self._conn.cursor()
+        try:
+            affected = cursor.execute(query, params)
+        except pymysql.MySQLError as e:
+            if not self.handle_error(e):
+                self._error = text_type(e.args[-1])
+            return None
+        finally:
+            cursor.close()
+
+        self._error = ''
+        return affected
+
+    def handle_error(self, error):
+        """
+            Returns True and closes connection if error is not
+            caused by statement itself
+        """
+        import pymysql
+
+        code = error.args[0] if error.args else None
+        if isinstance(error, pymysql.InterfaceError) or \
+                not isinstance(code, int) or code >= CLIENT_ERRORS_START:
+            self._error = text_type(error)
+            self._connerror = True
+            self.Close()
+            return True
+        return False
+
+    def _execute(self, statements, results):
+        cursor = self._conn.cursor()
+        try:
+            sql = ';\n'.join('%s;\nSHOW META' % cursor.mogrify(query, params)
+                             for query, params in statements)
+            cursor.execute(sql)
+
+            for position in range(len(statements)):
+                if position:
+                    cursor.nextset()
+                description, rows = cursor.description, cursor.fetchall()
+                cursor.nextset()
+                results.append(build_result(description, rows, cursor.fetchall()))
+        finally:
+            cursor.close()
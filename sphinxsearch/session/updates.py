@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+    Coalescing UpdateAttributes: changes are collected per document,
+    only the last value of every attribute is sent, in batches fitting
+    searchd max_packet_size.
+
+    >>> updater = AttributeUpdater(server, flush_interval=1, max_pending=100000)
+    >>> updater.start()
+    >>> updater.update(Products, ('price', 'stock'), {12: (990, 3), 13: (450, 0)})
+    >>> updater.update(Products, ('tags',), {12: ([1, 5],)})
+    >>> updater.stop()
+"""
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from six import string_types, text_type
+
+from ..exceptions import PoolTimeout
+from ..loggers import logger
+from ..models.attrs import MVA
+from ..utils import REQUEST_OVERHEAD, get_max_packet_size
+
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_PENDING = 100000
+
+# document id is 64 bit, values and MVA lengths are 32 bit
+DOC_ID_SIZE = 8
+VALUE_SIZE = 4
+
+
+def get_update_target(index, attrs, mva):
+    """
+        Returns (indexes_str, MVA attr names, value cleaners), MVA attrs
+        and cleaners of Index classes come from their __attrs__
+    """
+    if isinstance(index, string_types):
+        return text_type(index), frozenset(attrs) if mva else frozenset(), {}
+
+    index_attrs = index.__attrs__
+    unknown = set(attrs) - set(index_attrs)
+    if unknown:
+        raise ValueError('unknown attrs: %s' % ', '.join(sorted(unknown)))
+
+    mva_attrs = frozenset(name for name in attrs if isinstance(index_attrs[name], MVA))
+    cleaners = dict((name, index_attrs[name].clean) for name in attrs)
+    return ' '.join(index.get_index_names()), mva_attrs, cleaners
+
+
+def get_doc_size(values, mva):
+    if mva:
+        return DOC_ID_SIZE + sum(VALUE_SIZE * (len(value) + 1) for value in values)
+    return DOC_ID_SIZE + VALUE_SIZE * len(values)
+
+
+class AttributeUpdater(object):
+    """
+        server is SearchServer. update() blocks while max_pending
+        documents wait for flush, PoolTimeout is raised after put_timeout
+        seconds. Without start() changes are sent by flush() only,
+        or by update() itself when pending documents reach max_pending.
+    """
+    def __init__(self, server, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_pending=DEFAULT_MAX_PENDING, put_timeout=None):
+        self.server = server
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+
+        self.docs = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.updated = 0
+        self.errors = 0
+
+        # (indexes_str, mva) -> {doc_id: {attr: value}}
+        self._pending = {}
+        self._pending_docs = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self.run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """
+            Stops flusher after final flush
+        """
+        thread = self._thread
+        if thread is None:
+            return
+
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        thread.join()
+        self._thread = None
+
+    def wait_interval(self):
+        """
+            Waits flush_interval ignoring full queue wakeups, used after
+            failed flush, only stop() interrupts it
+        """
+        deadline = time.time() + self.flush_interval
+        remaining = self.flush_interval
+        while not self._stopping and remaining > 0:
+            self._cond.wait(remaining)
+            remaining = deadline - time.time()
+
+    def run(self):
+        failed = False
+        while True:
+            with self._cond:
+                if failed:
+                    self.wait_interval()
+                elif not self._stopping and self._pending_docs < self.max_pending:
+                    self._cond.wait(self.flush_interval)
+                stopping = self._stopping
+
+            try:
+                self.flush()
+                failed = False
+            except Exception:
+                # changes are kept and sent with next flush
+                logger.exception('attribute update failed')
+                failed = True
+
+            if stopping:
+                return
+
+    def wait_for_room(self):
+        deadline = None if self.put_timeout is None else time.time() + self.put_timeout
+        with self._cond:
+            while self.running and self._pending_docs >= self.max_pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeout('attribute update queue is full')
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+
+            full = self._pending_docs >= self.max_pending
+        if full:
+            self.flush()
+
+    def update(self, index, attrs, values, mva=False):
+        """
+            values is {doc_id: values tuple in attrs order}, index is
+            Index class or indexes string, mva marks all attrs of string
+            index as MVA
+        """
+        attrs = tuple(text_type(attr) for attr in attrs)
+        target, mva_attrs, cleaners = get_update_target(index, attrs, mva)
+
+        changes = []
+        for doc_id, doc_values in values.items():
+            if len(doc_values) != len(attrs):
+                raise ValueError('document %s has %s values for %s attrs'
+                                 % (doc_id, len(doc_values), len(attrs)))
+            for attr, value in zip(attrs, doc_values):
+                clean = cleaners.get(attr)
+                changes.append((int(doc_id), attr, value if clean is None else clean(value)))
+
+        self.wait_for_room()
+        with self._cond:
+            for doc_id, attr, value in changes:
+                docs = self._pending.setdefault((target, attr in mva_attrs), {})
+                doc = docs.get(doc_id)
+                if doc is None:
+                    doc = docs[doc_id] = {}
+                    self._pending_docs += 1
+                    self.docs += 1
+                elif attr in doc:
+                    self.coalesced += 1
+                doc[attr] = value
+
+            if self._pending_docs >= self.max_pending:
+                self._cond.notify_all()
+
+    def add(self, qs):
+        """
+            Queues Query.raw_update() changes
+        """
+        backend = getattr(qs, 'query', qs)
+        if not backend.update:
+            raise ValueError('query has no update')
+        self.update(backend.indexes_str, backend.attrs, backend.values)
+
+    def requeue(self, pending):
+        """
+            Puts back not sent changes, newer changes of the same attrs win
+        """
+        with self._cond:
+            for key, docs in pending.items():
+                current = self._pending.setdefault(key, {})
+                for doc_id, doc in docs.items():
+                    if doc_id not in current:
+                        current[doc_id] = {}
+                        self._pending_docs += 1
+                    for attr, value in doc.items():
+                        current[doc_id].setdefault(attr, value)
+
+    def iter_requests(self, pending):
+        """
+            Yields (indexes_str, attrs, values, mva), documents are grouped
+            by changed attrs and split to fit max_packet_size
+        """
+        max_size = get_max_packet_size(self.server)
+
+        for (target, mva), docs in sorted(pending.items()):
+            groups = {}
+            for doc_id, doc in docs.items():
+                groups.setdefault(tuple(sorted(doc)), {})[doc_id] = doc
+
+            for attrs, group in sorted(groups.items()):
+                request_size = REQUEST_OVERHEAD + len(target) + sum(len(attr) + VALUE_SIZE
+                                                                    for attr in attrs)
+                values = {}
+                size = request_size
+                for doc_id in sorted(group):
+                    doc_values = [list(group[doc_id][attr]) if mva else group[doc_id][attr]
+                                  for attr in attrs]
+                    doc_size = get_doc_size(doc_values, mva)
+                    if values and size + doc_size > max_size:
+                        yield target, attrs, values, mva
+                        values = {}
+                        size = request_size
+                    values[doc_id] = doc_values
+                    size += doc_size
+                if values:
+                    yield target, attrs, values, mva
+
+    def send(self, pending):
+        updated = 0
+        with self.server.get_session() as session:
+            for target, attrs, values, mva in self.iter_requests(pending):
+                updated += session.update_attributes(target, list(attrs), values, mva)
+                self.batches += 1
+        return updated
+
+    def flush(self):
+        """
+            Sends pending changes, returns updated documents count.
+            Failed changes are queued again before error is raised.
+        """
+        with self._flush_lock:
+            with self._cond:
+                pending, self._pending = self._pending, {}
+                self._pending_docs = 0
+                self._cond.notify_all()
+
+            if not pending:
+                return 0
+
+            try:
+                updated = self.send(pending)
+            except Exception:
+                self.errors += 1
+                self.requeue(pending)
+                raise
+
+            self.updated += updated
+            return updated
+
+    def get_stats(self):
+        return {'pending': self._pending_docs,
+                'docs': self.docs,
+                'coalesced': self.coalesced,
+                'batches': self.batches,
+                'updated': self.updated,
+                'errors': self.errors}
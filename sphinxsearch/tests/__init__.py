@@ -2,6 +2,26 @@
 from __future__ import unicode_literals
 
 from .config1 import Test
+from .pool import Test as PoolTest
+from .session import Test as SessionTest
+from .aio import Test as AsyncTest
+from .query import Test as QueryTest
+from .sphinxql import Test as SphinxQLTest
+from .bulk import Test as BulkTest
+from .xmlpipe import Test as XMLPipeTest
+from .scheduler import Test as SchedulerTest
+from .delta import Test as DeltaTest
+from .executor import Test as ExecutorTest
+from .engine import Test as EngineTest
+from .planner import Test as PlannerTest
+from .distributed import Test as DistributedTest
+from .sharded import Test as ShardedTest
+from .replicas import Test as ReplicasTest
+from .excerpts import Test as ExcerptsTest
+from .keywords import Test as KeywordsTest
+from .updates import Test as UpdatesTest
+from .facets import Test as FacetsTest
+from .results import Test as ResultsTest
 
 # import unittest
 # from itertools import product
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import sys
+import unittest
+
+from sphinxsearch import SearchServer
+from sphinxsearch.exceptions import ConfigError, ConnectError
+from sphinxsearch.query import Query
+from .searchd import FakeSearchd
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'asyncio session requires python 3.5+')
+class Test(unittest.TestCase):
+    def setUp(self):
+        import asyncio
+
+        self.searchd = FakeSearchd().start()
+        self.server = SearchServer(host=self.searchd.host, port=self.searchd.port, pool_size=2)
+        self.server.set_option('max_batch_queries', 2)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.server.async_session_maker.reset()
+        self.loop.close()
+        self.searchd.stop()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_run(self):
+        session = self.server.get_async_session()
+        qs = Query('products').like('phone')
+
+        results = self.run_async(session.run(qs[0:3],
+                                             qs.filter(category_id=[1, 2])[10:12],
+                                             qs.orderby('-price')))
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual([m['id'] for m in results[0]['matches']], [1, 2, 3])
+        self.assertEqual([m['attrs']['price'] for m in results[1]['matches']], [110, 120])
+        self.assertEqual(results[2]['total_found'], 1000)
+        self.assertEqual(results[0]['words'][0]['word'], 'phone')
+
+        # two pipelined batches over single connection
+        self.assertEqual(self.searchd.requests, 2)
+        self.assertEqual(self.server.async_session_maker.get_stats()['misses'], 1)
+
+        queries = self.searchd.queries
+        self.assertEqual(queries[1]['filters'], [('category_id', 0, [1, 2], 0)])
+        self.assertEqual((queries[2]['sort'], queries[2]['sort_by']), (1, 'price'))
+
+    def test_reuse(self):
+        session = self.server.get_async_session()
+        qs = Query('products')
+
+        self.run_async(session.run(qs))
+        self.run_async(session.run(qs))
+
+        stats = self.server.async_session_maker.get_stats()
+        self.assertEqual((stats['misses'], stats['hits']), (1, 1))
+
+    def test_timeout(self):
+        import asyncio
+
+        self.server.async_session_maker.timeout_grace = 0.05
+        self.searchd.delay = 0.5
+        session = self.server.get_async_session()
+
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_async(session.run(Query('products').timeout(10)))
+
+        stats = self.server.async_session_maker.get_stats()
+        self.assertEqual((stats['idle'], stats['discarded']), (0, 1))
+
+    def test_error(self):
+        session = self.server.get_async_session()
+
+        missing, found = self.run_async(session.run(Query('missing'), Query('products')[0:1]))
+        self.assertEqual(missing['error'], 'unknown local index')
+        self.assertEqual(len(found['matches']), 1)
+
+        self.server.async_session_maker.pool.port = self.searchd.port + 1
+        self.server.async_session_maker.pool.clear()
+        with self.assertRaises(ConnectError):
+            self.run_async(session.run(Query('products')))
+
+    def test_clear(self):
+        pool = self.server.async_session_maker.pool
+        conn = self.run_async(pool.acquire())
+        pool.clear()
+
+        # connection checked out before clear is closed, not reused
+        pool.release(conn)
+        self.assertTrue(conn.broken)
+        self.assertEqual(pool.get_stats()['idle'], 0)
+        self.assertEqual(pool.get_stats()['discarded'], 1)
+
+    def test_session_options(self):
+        # replicas options of sync sessions are ignored
+        server = SearchServer(host=self.searchd.host, port=self.searchd.port, pool_size=3,
+                              failure_threshold=2, reset_timeout=5, columnar=True)
+        session_maker = server.async_session_maker
+        self.assertEqual(session_maker.pool_options['size'], 3)
+        self.assertTrue(session_maker.columnar)
+
+        server = SearchServer(host=self.searchd.host, port=self.searchd.port,
+                              replicas=[(self.searchd.host, self.searchd.port + 1)])
+        with self.assertRaises(ConfigError):
+            server.async_session_maker
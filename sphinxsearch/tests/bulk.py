@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+import unittest
+
+from datetime import datetime
+
+from sphinxsearch.exceptions import ConfigError, QueryError
+from sphinxsearch.models import Index, RT, Int, BigInt, Float, Bool, TimeStamp, String, MVA
+from sphinxsearch.models.bulk import BulkWriter
+from sphinxsearch.session.pool import ConnectionPool
+from .utils import FakeApi, make_api
+
+
+class Products(Index):
+    __source__ = RT()
+    __fields__ = ('title',)
+
+    price = Int()
+    views = BigInt()
+    rating = Float()
+    in_stock = Bool()
+    created_at = TimeStamp()
+    brand = String()
+    tags = MVA(Int)
+
+
+def execute(client, query, params=()):
+    with client.api.lock:
+        client.connect_error = client.api.fail_connections > 0
+        if client.connect_error:
+            client.api.fail_connections -= 1
+            return None
+    if 'REPLACE' in query and params[0] == 13:
+        return None
+    return len(params)
+
+
+def is_connect_error(client):
+    return getattr(client, 'connect_error', False)
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.api = make_api({'Execute': execute, 'IsConnectError': is_connect_error},
+                            lock=threading.Lock(), fail_connections=0)
+        self.pool = ConnectionPool(self.api, 'localhost', 9306, size=2)
+
+    def tearDown(self):
+        self.pool.clear()
+
+    def get_docs(self, count):
+        for i in range(1, count + 1):
+            yield {'id': i, 'title': 'phone %s' % i, 'price': i * 10,
+                   'rating': '4.5', 'in_stock': i % 2, 'tags': [3, 1, 3],
+                   'created_at': datetime(2015, 1, 1)}
+
+    def test_insert(self):
+        self.api.fail_connections = 1
+        writer = BulkWriter(Products, self.pool, batch_size=4, workers=3, retry_delay=0)
+
+        stats = writer.run(self.get_docs(10))
+        self.assertEqual((stats['rows'], stats['batches'], stats['retries']), (10, 3, 1))
+        self.assertEqual(self.pool.get_stats()['discarded'], 1)
+
+        statements = sorted(self.api.get_requests('Execute'), key=lambda s: s[1][0])
+        query, params = statements[0]
+        self.assertEqual(query, 'INSERT INTO bulk_products (id, title, brand, created_at, in_stock, '
+                                'price, rating, tags, views) VALUES %s' %
+                                ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s)'] * 4))
+        self.assertEqual(params[:9], (1, 'phone 1', '', 1420070400, 1, 10, 4.5, (1, 3), 0))
+
+    def test_validation(self):
+        writer = BulkWriter(Products, self.pool, 'REPLACE', batch_size=2, workers=1)
+
+        self.assertRaises(ValueError, writer.run, [{'id': 1, 'color': 'red'}])
+        self.assertRaises(ValueError, writer.run, [{'id': 1, 'price': -1}])
+        self.assertRaises(QueryError, writer.run, self.get_docs(20))
+        self.assertRaises(ValueError, BulkWriter, Products, self.pool, 'UPDATE')
+
+        # sphinx protocol clients can't execute SphinxQL statements
+        pool = ConnectionPool(FakeApi, 'localhost', 9312)
+        self.assertRaises(ConfigError, BulkWriter, Products, pool)
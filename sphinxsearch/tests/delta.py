@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from sphinxsearch import Engine
+from sphinxsearch.engine.delta import DeltaManager
+from sphinxsearch.engine.executor import CommandFailed
+from sphinxsearch.models import Index, XML, Int
+
+
+FAKE_INDEXER = '''#!%s
+import sys
+args = sys.argv[3:]
+with open(sys.argv[2] + '.log', 'a') as f:
+    f.write(' '.join(args) + '\\n')
+if args[0] == '--merge':
+    sys.exit(0)
+with open(sys.argv[2] + '.docs') as f:
+    docs = int(f.read())
+print('collected %%s docs' %% docs)
+print('total %%s docs, %%s bytes' %% (docs, docs * 100))
+sys.exit(1 if docs < 0 else 0)
+'''
+
+
+class Articles(Index):
+    __source__ = XML('produce')
+    __delta__ = True
+    __merge_dst_range__ = {'deleted': 0}
+
+    deleted = Int()
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        indexer_path = os.path.join(self.tmp, 'indexer')
+        with open(indexer_path, 'w') as f:
+            f.write(FAKE_INDEXER % sys.executable)
+        os.chmod(indexer_path, 0o755)
+
+        self.conf = os.path.join(self.tmp, 'sphinx.conf')
+        self.engine = Engine()
+        self.engine.commands.prefix = self.tmp
+        self.engine.set_conf(self.conf)
+        self.engine.add_index(Articles)
+
+        self.watermarks = []
+        self.max_id = 0
+        self.state_path = os.path.join(self.tmp, 'state.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def get_manager(self):
+        return DeltaManager(self.engine, self.state_path, max_delta_docs=100,
+                            get_watermark=lambda index: self.max_id,
+                            set_watermark=lambda index, value: self.watermarks.append(value))
+
+    def set_delta_docs(self, docs):
+        with open(self.conf + '.docs', 'w') as f:
+            f.write(str(docs))
+
+    def get_log(self):
+        with open(self.conf + '.log') as f:
+            return f.read().splitlines()
+
+    def test_update(self):
+        self.assertEqual(Articles.get_index_names(), ('delta_articles', 'delta_articles_delta'))
+        manager = self.get_manager()
+
+        self.set_delta_docs(40)
+        self.max_id = 1040
+        self.assertEqual(manager.update_all(), {'delta_articles': False})
+
+        self.set_delta_docs(120)
+        self.max_id = 1120
+        self.assertTrue(manager.update(Articles))
+
+        self.assertEqual(self.get_log(), [
+            'delta_articles_delta --rotate',
+            'delta_articles_delta --rotate',
+            '--merge delta_articles delta_articles_delta --merge-dst-range deleted 0 0 '
+            '--merge-killlists --rotate',
+            'delta_articles_delta --rotate'])
+        self.assertEqual(self.watermarks, [1120])
+
+        with open(self.state_path) as f:
+            state = json.load(f)['delta_articles']
+        self.assertEqual((state['watermark'], state['merges'], state['reindexes']), (1120, 1, 3))
+        self.assertEqual(state['delta_bytes'], 12000)
+
+        # state survives restart
+        self.assertEqual(self.get_manager().get_stats()['delta_articles']['merges'], 1)
+
+    def test_failure(self):
+        manager = self.get_manager()
+        self.set_delta_docs(-1)
+        self.assertRaises(CommandFailed, manager.update, Articles)
+        self.assertEqual(self.watermarks, [])
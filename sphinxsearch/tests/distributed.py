@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+
+from sphinxsearch import Engine, SearchServer
+from sphinxsearch.engine.router import QueryRouter
+from sphinxsearch.engine.scheduler import ReindexScheduler
+from sphinxsearch.exceptions import ConfigError
+from sphinxsearch.models import Index, RT, Int, Agent, Distributed
+from sphinxsearch.query import Query
+from .utils import FakeClient, make_api
+
+
+def get_result(client, calls):
+    result = FakeClient.get_result(client, calls)
+    result['server'] = client.server
+    result['index'] = calls[-1][1][1]
+    return result
+
+
+RouterApi = make_api({'get_result': get_result})
+
+
+def get_server(port):
+    server = SearchServer('node%s' % port, port)
+    server.set_api(RouterApi)
+    return server
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.head, self.node1, self.node2, self.node3 = [get_server(port) for port in (9312, 1, 2, 3)]
+
+        def get_shard(name):
+            return type(Index)(str(name), (Index,), {'__source__': RT(), 'price': Int(),
+                                                     '__module__': __name__})
+
+        self.shard0, self.shard1, self.shard2 = [get_shard('shard%s' % i) for i in range(3)]
+
+        class Products(Index):
+            __source__ = Distributed(local=[self.shard0],
+                                     agents=[Agent(self.shard1, self.node1),
+                                             Agent(self.shard2, self.node2, self.node3)],
+                                     persistent=True, ha_strategy='nodeads',
+                                     query_timeout=3000)
+        self.products = Products
+
+    def test_config(self):
+        engine = Engine()
+        engine.server = self.head
+        engine.extend_indexes([self.products, self.shard0])
+
+        config = engine.create_config()
+        self.assertIn('index distributed_products\n{\n'
+                      '    type = distributed\n'
+                      '    agent_persistent = node1:1:distributed_shard1\n'
+                      '    agent_persistent = node2:2|node3:3:distributed_shard2\n'
+                      '    agent_query_timeout = 3000\n'
+                      '    ha_strategy = nodeads\n'
+                      '    local = distributed_shard0\n}', config)
+
+        source = self.products.__source__
+        self.assertEqual(source.get_servers(), [self.node1, self.node2, self.node3])
+        self.assertEqual(source.get_server_indexes(self.node3), [self.shard2])
+        self.assertEqual(ReindexScheduler(engine).get_indexes(), [])
+
+    def test_router(self):
+        router = QueryRouter()
+        router.add_index(self.products, self.head)
+
+        results = router.run(Query(self.shard2), Query(self.products),
+                             Query(self.shard1), Query(self.shard2))
+        self.assertEqual([(r['server'][1], r['index']) for r in results],
+                         [(2, 'distributed_shard2'), (9312, 'distributed_products'),
+                          (1, 'distributed_shard1'), (3, 'distributed_shard2')])
+
+        # one batch per node
+        pool = self.head.session_maker.pool
+        self.assertEqual(pool.get_stats()['opened'], 1)
+
+        self.assertRaises(ConfigError, router.run, Query(self.shard0))
+        self.assertRaises(ConfigError, router.run,
+                          Query('distributed_shard1 distributed_shard2'))
+
+        router.default = self.head
+        self.assertEqual(router.run(Query(self.shard0))[0]['server'][1], 9312)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sphinxsearch import Engine, Indexer, SearchServer
+from sphinxsearch.models import Index, RT, XML, MysqlSource, MysqlCertificate, Int, String
+
+
+class Products(Index):
+    __source__ = MysqlSource(host='localhost', port=3306, db='shop', user='shop', password='')
+    __delta__ = True
+
+    price = Int()
+    stock = Int()
+    title = String()
+
+
+class Users(Index):
+    __source__ = RT()
+
+    age = Int()
+
+
+class Articles(Index):
+    __source__ = XML('produce')
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.engine = Engine()
+        self.engine.server = SearchServer('localhost', 9312)
+        self.engine.indexer = Indexer()
+        self.engine.indexer.set_option('mem_limit', '256M')
+        self.engine.extend_indexes([Users, Products, Articles])
+        self.engine.set_conf(os.path.join(self.tmp, 'sphinx.conf'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def get_block_names(self, config):
+        return [line for line in config.splitlines() if line and line[0] not in '{} ']
+
+    def test_create_config(self):
+        config = self.engine.create_config()
+
+        self.assertEqual(self.get_block_names(config), [
+            'searchd', 'indexer',
+            'source engine_articles', 'index engine_articles',
+            'source engine_products', 'source engine_products_delta',
+            'index engine_products', 'index engine_products_delta',
+            'index engine_users'])
+        self.assertIn('    type = mysql\n    sql_attr_string = title', config)
+        self.assertIn('    sql_attr_uint = price\n    sql_attr_uint = stock', config)
+        self.assertIn('    rt_attr_uint = age', config)
+        self.assertIn('    listen = localhost:9312', config)
+
+        self.assertEqual(self.engine.create_config(), config)
+
+    def test_cache(self):
+        blocks = self.engine.get_index_blocks(Users)
+        self.assertIs(self.engine.get_index_blocks(Users), blocks)
+
+        Users.weight = Int()
+        try:
+            self.assertIn('rt_attr_uint = weight', self.engine.create_config())
+        finally:
+            del Users.weight
+        self.assertNotIn('weight', self.engine.create_config())
+
+        Products.__source__.db = 'shop2'
+        try:
+            self.assertIn('sql_db = shop2', self.engine.create_config())
+        finally:
+            Products.__source__.db = 'shop'
+
+        # in place changes of attrs dict, attr and nested source objects
+        Users.__attrs__['weight'] = Int()
+        try:
+            self.assertIn('rt_attr_uint = weight', self.engine.create_config())
+        finally:
+            del Users.__attrs__['weight']
+        self.assertNotIn('weight', self.engine.create_config())
+
+        title = Products.__attrs__['title']
+        Products.__attrs__['title'] = Int()
+        try:
+            self.assertIn('sql_attr_uint = title', self.engine.create_config())
+        finally:
+            Products.__attrs__['title'] = title
+        self.assertNotIn('sql_attr_uint = title', self.engine.create_config())
+
+        Products.__source__.certificate = MysqlCertificate('cert.pem', 'key.pem', 'ca.pem')
+        try:
+            self.assertIn('mysql_ssl_cert = cert.pem', self.engine.create_config())
+            Products.__source__.certificate.cert = 'other.pem'
+            self.assertIn('mysql_ssl_cert = other.pem', self.engine.create_config())
+        finally:
+            Products.__source__.certificate = None
+
+    def test_save(self):
+        self.assertTrue(self.engine.save())
+        stat = os.stat(self.engine.conf_file)
+        self.assertEqual(stat.st_mode & 0o777, 0o644)
+
+        self.assertFalse(self.engine.save())
+        self.assertEqual(os.stat(self.engine.conf_file).st_ino, stat.st_ino)
+
+        self.engine.indexer.set_option('mem_limit', '512M')
+        self.assertTrue(self.engine.save())
+        with open(self.engine.conf_file) as f:
+            self.assertIn('mem_limit = 512M', f.read())
+        self.assertEqual(os.listdir(self.tmp), ['sphinx.conf'])
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+
+from sphinxsearch import SearchServer
+from sphinxsearch.exceptions import QueryError
+from sphinxsearch.query import Query
+from sphinxsearch.session.excerpts import ExcerptBuilder, chunk_docs
+from sphinxsearch.utils import REQUEST_OVERHEAD
+from .utils import make_api
+
+
+def build_excerpts(client, docs, index, words, opts=None):
+    if client.api.fail:
+        return None
+    return ['%s%s' % (opts.get('before_match', ''), doc[:10]) for doc in docs]
+
+
+class Test(unittest.TestCase):
+    @property
+    def requests(self):
+        return self.api.get_requests('BuildExcerpts')
+
+    def setUp(self):
+        self.api = make_api({'BuildExcerpts': build_excerpts}, fail=False)
+        self.server = SearchServer('localhost', 1, pool_size=4)
+        self.server.set_api(self.api)
+        self.server.set_option('max_packet_size', '3K')
+        self.docs = ['document %02d %s' % (i, 'x' * 700) for i in range(10)]
+
+    def test_chunk_docs(self):
+        sizes = {0: 10, 1: 10, 2: 30, 4: 5}
+        self.assertEqual(chunk_docs([0, 1, 2, 4], sizes, 28), [[0, 1], [2], [4]])
+
+    def test_build(self):
+        excerpts = list(self.server.build_excerpts('products', self.docs, 'document',
+                                                   before_match='<b>'))
+        self.assertEqual(excerpts, ['<b>%s' % doc[:10] for doc in self.docs])
+
+        requests = self.requests
+        self.assertTrue(len(requests) > 1)
+        self.assertEqual(sorted(doc for docs, _, _, _ in requests for doc in docs), self.docs)
+        max_size = 3 * 1024 - REQUEST_OVERHEAD
+        for docs, index, words, opts in requests:
+            self.assertEqual((index, words, opts), ('products', 'document', {'before_match': '<b>'}))
+            self.assertTrue(sum(len(doc) + 4 for doc in docs) <= max_size)
+
+    def test_cache(self):
+        builder = self.server.get_excerpt_builder()
+        list(self.server.build_excerpts('products', self.docs[:5], 'document'))
+        count = len(self.requests)
+
+        excerpts = list(self.server.build_excerpts('products', self.docs, 'document'))
+        self.assertEqual(excerpts, [doc[:10] for doc in self.docs])
+        sent = [doc for docs, _, _, _ in self.requests[count:] for doc in docs]
+        self.assertEqual(sorted(sent), self.docs[5:])
+        self.assertEqual(builder.get_stats(), {'hits': 5, 'misses': 10})
+
+        # other options are other snippets
+        list(self.server.build_excerpts('products', self.docs[:1], 'document', limit=50))
+        self.assertEqual(builder.misses, 11)
+
+        self.server.invalidate_cache(['products'])
+        list(self.server.build_excerpts('products', self.docs[:1], 'document'))
+        self.assertEqual(builder.misses, 12)
+
+    def test_errors(self):
+        self.assertRaises(QueryError, self.server.build_excerpts, 'products', ['x' * 4096], 'x')
+
+        self.api.fail = True
+        builder = ExcerptBuilder(self.server, workers=2)
+        excerpts = builder.build('products', self.docs, 'document')
+        self.assertRaises(QueryError, list, excerpts)
+
+    def test_query(self):
+        excerpts = Query('products delta').excerpts(self.server, self.docs[:2], 'document')
+        self.assertEqual(list(excerpts), [doc[:10] for doc in self.docs[:2]])
+        self.assertEqual(self.requests[0][1], 'products')
+
+        self.assertRaises(QueryError, Query('*').excerpts, self.server, self.docs, 'document')
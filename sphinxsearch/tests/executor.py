@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from sphinxsearch import Engine
+from sphinxsearch.engine.executor import (CommandExecutor, CommandFailed,
+                                          parse_indexer_output, STDOUT, STDERR)
+from sphinxsearch.utils.cmdtools import Command, CommandChain
+
+
+INDEXER_OUTPUT = '''Sphinx 2.2.11-id64-release (95ae9a6)
+using config file '/etc/sphinx.conf'...
+indexing index 'products'...
+WARNING: attribute 'price' not found - IGNORING
+collected 4 docs, 0.0 MB
+sorted 0.0 Mhits, 100.0% done
+total 4 docs, 193 bytes
+total 0.015 sec, 12335 bytes/sec, 255.65 docs/sec
+indexing index 'products_delta'...
+collected 1 docs, 0.0 MB
+total 1 docs, 20 bytes
+total 0.005 sec, 4000 bytes/sec, 200.00 docs/sec
+ERROR: index 'users': sql_connect: Access denied.
+'''
+
+SCRIPT = '''
+import sys, time
+sys.stdout.write('total 2 docs, 10 bytes\\n')
+sys.stdout.flush()
+sys.stderr.write('WARNING: slow\\n')
+sys.stderr.flush()
+time.sleep(float(sys.argv[1]))
+sys.exit(int(sys.argv[2]))
+'''
+
+# ignores SIGTERM, so it is killed after kill_grace
+STUBBORN_SCRIPT = '''
+import signal, time
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+time.sleep(10)
+'''
+
+
+FAKE_INDEXER = '''#!%s
+import sys
+sys.exit(0)
+'''
+
+
+def script(sleep=0, code=0):
+    return Command([sys.executable, '-c', SCRIPT, sleep, code])
+
+
+class Test(unittest.TestCase):
+    def test_command_argv(self):
+        engine = Engine()
+        engine.set_conf('/etc/sphinx search/sphinx.conf')
+
+        cmd = engine.commands.merge('main', 'delta', deleted=0, rotate=True)
+        self.assertEqual(cmd.argv, ['indexer', '--config', '/etc/sphinx search/sphinx.conf',
+                                    '--merge', 'main', 'delta', '--merge-dst-range',
+                                    'deleted', '0', '0', '--rotate'])
+        self.assertEqual(cmd, ' '.join(cmd.argv))
+
+        cmd = engine.commands.restart(pidfile='/tmp/searchd.pid')
+        self.assertEqual([c.argv[-1] for c in cmd.commands], ['/tmp/searchd.pid'] * 2)
+        self.assertEqual(cmd.commands[0].argv[3:5], ['--stop', '--stopwait'])
+        self.assertEqual(cmd, ' ; '.join(cmd.commands))
+
+    def test_parse(self):
+        report = parse_indexer_output(INDEXER_OUTPUT)
+        self.assertEqual([s.name for s in report.indexes], ['products', 'products_delta'])
+        self.assertEqual((report.docs, report.bytes), (5, 213))
+        self.assertAlmostEqual(report.elapsed, 0.02)
+        self.assertEqual(report.warnings, ["attribute 'price' not found - IGNORING"])
+        self.assertEqual(report.errors, ["index 'users': sql_connect: Access denied."])
+
+    def test_run(self):
+        lines = []
+        result = CommandExecutor().run(script(), on_line=lambda *args: lines.append(args))
+
+        self.assertTrue(result.ok)
+        self.assertEqual(sorted(lines), [(STDERR, 'WARNING: slow'),
+                                         (STDOUT, 'total 2 docs, 10 bytes')])
+        self.assertEqual(result.report.docs, 2)
+        self.assertEqual(result.report.warnings, ['slow'])
+
+        result = CommandExecutor().run(script(code=2))
+        self.assertEqual(result.returncode, 2)
+        self.assertRaises(CommandFailed, result.check)
+
+    def test_timeout_and_cancel(self):
+        started_at = time.time()
+        result = CommandExecutor(timeout=0.3).run(script(sleep=10))
+        self.assertTrue(result.timed_out)
+        self.assertFalse(result.ok)
+        self.assertTrue(time.time() - started_at < 5)
+
+        process = CommandExecutor().start(script(sleep=10))
+        threading.Timer(0.2, process.cancel).start()
+        result = process.wait()
+        self.assertTrue(result.cancelled)
+        self.assertEqual(result.report.docs, 2)
+
+    @unittest.skipIf(sys.platform == 'win32', 'requires SIGTERM')
+    def test_kill_grace(self):
+        process = CommandExecutor(timeout=0.1, kill_grace=0.5).start(
+            Command([sys.executable, '-c', STUBBORN_SCRIPT]))
+        polls = []
+        get = process._queue.get
+        process._queue.get = lambda *args, **kwargs: polls.append(1) or get(*args, **kwargs)
+
+        result = process.wait()
+        self.assertTrue(result.timed_out)
+        # output is polled with positive timeout while process ignores SIGTERM
+        self.assertTrue(len(polls) < 50, len(polls))
+
+    def test_chain(self):
+        result = CommandExecutor().run(CommandChain([script(code=1), script(code=0)]))
+        self.assertEqual(result.returncode, 1)
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'asyncio executor requires python 3.5+')
+    def test_async(self):
+        import asyncio
+        from sphinxsearch.engine.aio import AsyncCommandExecutor
+
+        loop = asyncio.new_event_loop()
+        try:
+            lines = []
+            result = loop.run_until_complete(AsyncCommandExecutor().run(
+                script(), on_line=lambda *args: lines.append(args)))
+            self.assertEqual((result.returncode, result.report.docs, len(lines)), (0, 2, 2))
+
+            result = loop.run_until_complete(AsyncCommandExecutor(timeout=0.3).run(script(sleep=10)))
+            self.assertTrue(result.timed_out)
+        finally:
+            loop.close()
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'asyncio executor requires python 3.5+')
+    @unittest.skipIf(sys.platform == 'win32', 'requires executable scripts')
+    def test_async_rotate(self):
+        import asyncio
+        from sphinxsearch.engine.aio import AsyncCommandExecutor
+
+        tmp = tempfile.mkdtemp()
+        loop = asyncio.new_event_loop()
+        try:
+            path = os.path.join(tmp, 'indexer')
+            with open(path, 'w') as f:
+                f.write(FAKE_INDEXER % sys.executable)
+            os.chmod(path, 0o755)
+
+            engine = Engine()
+            engine.commands.prefix = tmp
+            engine.set_conf(os.path.join(tmp, 'sphinx.conf'))
+            rotated = []
+            engine.commands.add_rotate_listener(rotated.append)
+
+            result = loop.run_until_complete(AsyncCommandExecutor().run(
+                engine.commands.reindex('products', 'products_delta')))
+            self.assertTrue(result.ok)
+            self.assertEqual(rotated, [['products', 'products_delta']])
+        finally:
+            loop.close()
+            shutil.rmtree(tmp)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+
+from sphinxsearch.exceptions import QueryError
+from sphinxsearch.query import Query
+from sphinxsearch.query.filters import Range
+from sphinxsearch.query.groupby import Month
+from sphinxsearch.session import Session
+from .utils import FakeApi, FakeClient, make_api
+
+
+def get_result(client, calls):
+    """
+        Grouped queries get two groups of their attr
+    """
+    result = FakeClient.get_result(client, calls)
+    group_by = [args for name, args in calls if name == 'SetGroupBy']
+    if group_by:
+        attr_name = group_by[0][0]
+        result['matches'] = [{'id': i, 'weight': 1,
+                              'attrs': {attr_name: i, '@groupby': i, '@count': 10 * i}}
+                             for i in (2, 1)]
+        result['total_found'] = 2
+    return result
+
+
+FacetApi = make_api({'get_result': get_result})
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.session = Session(FacetApi, 'localhost', 9312)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_facets(self):
+        qs = Query('products').like('phone').filter(brand_id=[1, 2], price=Range(10, 100))
+        facets = qs.facets('brand_id', 'color_id', Month('created'), limit=5)
+        self.assertEqual(list(facets.facets), ['brand_id', 'color_id', 'created__month'])
+
+        result = facets.run(self.session)
+        batch, = self.session.conn.batches
+        self.assertEqual(len(batch), 4)
+
+        main, brand, color, month = batch
+        self.assertFalse([args for name, args in main if name == 'SetGroupBy'])
+        self.assertIn(('SetFilter', ('brand_id', [1, 2], False)), main)
+
+        # drill-sideways: own filter is not applied, others are
+        self.assertNotIn(('SetFilter', ('brand_id', [1, 2], False)), brand)
+        self.assertIn(('SetFilterRange', ('price', 10, 100, False)), brand)
+        self.assertIn(('SetGroupBy', ('brand_id', FakeApi.SPH_GROUPBY_ATTR, '@count desc')), brand)
+        self.assertIn(('SetLimits', (0, 5, 0, 0)), brand)
+        self.assertIn(('SetFilter', ('brand_id', [1, 2], False)), color)
+        self.assertIn(('SetGroupBy', ('created', FakeApi.SPH_GROUPBY_MONTH, '@group desc')), month)
+
+        self.assertEqual(result.matches, [])
+        self.assertEqual(result['brand_id'].values, [(2, 20), (1, 10)])
+        self.assertEqual(result['created__month'].total, 2)
+        self.assertEqual([facet.name for facet in result],
+                         ['brand_id', 'color_id', 'created__month'])
+
+        # base query is not changed
+        self.assertIsNone(qs.query.group_by)
+        self.assertIn('brand_id', qs.query.filters)
+
+    def test_errors(self):
+        qs = Query('products')
+        self.assertRaises(QueryError, qs.facets, 'brand_id', 'brand_id')
+        self.assertRaises(TypeError, qs.facets, 'brand_id', size=5)
+
+        facets = qs.facets('brand_id')
+        self.assertRaises(QueryError, facets.parse, [{'error': 'unknown attr'}, {}])
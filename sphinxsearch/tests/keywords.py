@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+
+from sphinxsearch import SearchServer
+from sphinxsearch.exceptions import QueryError
+from sphinxsearch.query import Query
+from .utils import make_api
+
+
+def build_keywords(client, query, index, hits):
+    if query == 'broken':
+        return None
+
+    keywords = []
+    for word in query.split():
+        keyword = {'tokenized': word.lower(), 'normalized': word.lower().rstrip('s')}
+        if hits:
+            keyword.update(docs=len(word), hits=len(word) * 2)
+        keywords.append(keyword)
+    return keywords
+
+
+class Test(unittest.TestCase):
+    @property
+    def requests(self):
+        return self.api.get_requests('BuildKeywords')
+
+    def setUp(self):
+        self.api = make_api({'BuildKeywords': build_keywords})
+        self.server = SearchServer('localhost', 1)
+        self.server.set_api(self.api)
+
+    def test_batch(self):
+        results = self.server.build_keywords('products', ['Red phones', 'case', 'Red phones'])
+        self.assertEqual(results, [
+            [{'tokenized': 'red', 'normalized': 'red'},
+             {'tokenized': 'phones', 'normalized': 'phone'}],
+            [{'tokenized': 'case', 'normalized': 'case'}],
+            [{'tokenized': 'red', 'normalized': 'red'},
+             {'tokenized': 'phones', 'normalized': 'phone'}],
+        ])
+        self.assertEqual(self.requests, [('Red phones', 'products', False),
+                                         ('case', 'products', False)])
+
+        # returned lists are copies
+        results[0][0]['tokenized'] = 'changed'
+        self.server.build_keywords('products', ['case', 'Red phones', 'cover'])
+        self.assertEqual(self.requests[2:], [('cover', 'products', False)])
+        self.assertEqual(self.server.build_keywords('products', ['Red phones'])[0][0]['tokenized'],
+                         'red')
+
+        stats = self.server.get_keyword_stats()
+        self.assertEqual(stats.get_stats(), {'hits': 3, 'misses': 3, 'size': 3})
+
+    def test_hits(self):
+        with_stats, = self.server.build_keywords('products', ['phones'], hits=True)
+        without_stats, = self.server.build_keywords('products', ['phones'])
+        self.assertEqual(self.requests, [('phones', 'products', True)])
+        self.assertIn('docs', with_stats[0])
+        # cached stats answer looks like hits=False one
+        self.assertEqual(without_stats, [dict((key, value) for key, value in keyword.items()
+                                              if key not in ('docs', 'hits'))
+                                         for keyword in with_stats])
+        self.assertNotIn('hits', without_stats[0])
+
+        self.server.build_keywords('products', ['case'])
+        self.server.build_keywords('products', ['case'], hits=True)
+        self.assertEqual(self.requests[1:], [('case', 'products', False),
+                                             ('case', 'products', True)])
+
+        # caches are per index
+        self.server.build_keywords('archive', ['phones'], hits=True)
+        self.assertEqual(self.requests[3:], [('phones', 'archive', True)])
+
+    def test_rotate(self):
+        self.server.build_keywords('products', ['phones'])
+        self.server.build_keywords('archive', ['phones'])
+        self.server.invalidate_cache(['products'])
+
+        self.server.build_keywords('products', ['phones'])
+        self.server.build_keywords('archive', ['phones'])
+        self.assertEqual(self.requests, [('phones', 'products', False),
+                                         ('phones', 'archive', False),
+                                         ('phones', 'products', False)])
+
+    def test_query(self):
+        keywords = Query('products delta').keywords(self.server, 'phones', hits=True)
+        self.assertEqual(keywords, [{'tokenized': 'phones', 'normalized': 'phone',
+                                     'docs': 6, 'hits': 12}])
+        self.assertEqual(len(Query('products').keywords(self.server, ['a', 'b'])), 2)
+
+        self.assertRaises(QueryError, Query('products').keywords, self.server, 'broken')
+        self.assertRaises(QueryError, Query('*').keywords, self.server, 'phones')
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from sphinxsearch import Engine, Indexer, SearchServer
+from sphinxsearch.engine.planner import (parse_config, ConfigChange, CHANGED, REMOVED,
+                                         NOOP, ROTATE, REINDEX, RESTART)
+from sphinxsearch.models import Index, RT, MysqlSource, Int
+
+
+CONFIG = '''
+# products
+source base
+{
+    type = mysql
+    sql_host = localhost
+    sql_attr_uint = price
+}
+
+source products : base
+{
+    sql_query = SELECT id, title, \\
+        price FROM products
+    sql_attr_uint = stock
+    sql_attr_uint = price
+}
+
+index products {
+    source = products
+}
+'''
+
+
+def get_index(name, source, **attrs):
+    attrs.update({'__source__': source, '__module__': __name__})
+    return type(Index)(str(name), (Index,), attrs)
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+        self.products = get_index('products', MysqlSource(host='localhost', port=3306, db='shop'),
+                                  price=Int(), __delta__=True)
+        self.users = get_index('users', RT(), age=Int())
+        self.orders = get_index('orders', MysqlSource(host='localhost', port=3306, db='shop'))
+
+        self.engine = Engine()
+        self.engine.server = SearchServer('localhost', 9312)
+        self.engine.server.set_option('pid_file', os.path.join(self.tmp, 'searchd.pid'))
+        self.engine.indexer = Indexer()
+        self.engine.extend_indexes([self.products, self.users, self.orders])
+        self.engine.set_conf(os.path.join(self.tmp, 'sphinx.conf'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_parse(self):
+        blocks = parse_config(CONFIG)
+        self.assertEqual(list(blocks), ['source base', 'source products', 'index products'])
+        self.assertEqual(blocks['source products']['type'], ['mysql'])
+        self.assertEqual(blocks['source products']['sql_attr_uint'], ['stock', 'price'])
+        self.assertEqual(blocks['source products']['sql_query'],
+                         ['SELECT id, title, price FROM products'])
+
+    def test_initial(self):
+        plan = self.engine.plan_changes()
+        self.assertTrue(plan.restart)
+        self.assertEqual(plan.reindex, ['planner_orders', 'planner_products',
+                                        'planner_products_delta'])
+        self.assertEqual([c.argv[3] for c in plan.commands], ['--stop', 'planner_orders', '--start'])
+        self.assertNotIn('--rotate', plan.commands[1])
+
+    def test_changes(self):
+        self.engine.save()
+        plan = self.engine.plan_changes()
+        self.assertFalse(plan)
+        self.assertEqual((plan.changes, plan.commands), ([], []))
+
+        self.engine.indexer.set_option('mem_limit', '1G')
+        self.products.stock = Int()
+        plan = self.engine.plan_changes()
+        self.assertEqual(plan.changes, [
+            ConfigChange('index planner_products', CHANGED, REINDEX, ['source']),
+            ConfigChange('index planner_products_delta', CHANGED, REINDEX, ['source']),
+            ConfigChange('indexer', CHANGED, NOOP, ['mem_limit']),
+            ConfigChange('source planner_products', CHANGED, NOOP, ['sql_attr_uint']),
+            ConfigChange('source planner_products_delta', CHANGED, NOOP, ['sql_attr_uint'])])
+        rotated = []
+        self.engine.commands.add_rotate_listener(rotated.append)
+        self.assertEqual(len(plan.commands), 1)
+        self.assertEqual(plan.commands[0].argv[3:],
+                         ['planner_products', 'planner_products_delta', '--rotate'])
+        # building commands does not invalidate caches
+        self.assertEqual(rotated, [])
+
+        self.engine.save()
+        self.users.weight = Int()
+        plan = self.engine.plan_changes()
+        self.assertEqual(plan.changes, [ConfigChange('index planner_users', CHANGED,
+                                                     RESTART, ['rt_attr_uint'])])
+
+    def test_rotate(self):
+        self.engine.save()
+        self.engine._indexes.discard(self.orders)
+
+        plan = self.engine.plan_changes()
+        self.assertEqual([(c.block, c.kind, c.action) for c in plan.changes],
+                         [('index planner_orders', REMOVED, ROTATE),
+                          ('source planner_orders', REMOVED, NOOP)])
+        self.assertTrue(plan.rotate)
+        self.assertEqual(plan.commands, [])
+
+        searchd = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(10)'])
+        try:
+            with open(os.path.join(self.tmp, 'searchd.pid'), 'w') as f:
+                f.write('%s\n' % searchd.pid)
+            self.assertEqual(plan.apply(), [])
+            self.assertEqual(searchd.wait(), -signal.SIGHUP)
+        finally:
+            if searchd.poll() is None:
+                searchd.kill()
+                searchd.wait()
+
+        self.assertFalse(self.engine.plan_changes())
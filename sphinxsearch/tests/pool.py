@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+import unittest
+
+from sphinxsearch.exceptions import PoolTimeout, ConnectError, QueryError
+from sphinxsearch.query import Query
+from sphinxsearch.session import Session
+from sphinxsearch.session.pool import ConnectionPool
+from .utils import FakeApi, FakeClient, make_api
+
+
+def run_queries(client):
+    if client.api.fail:
+        # like sphinxapi, requests stay queued
+        return None
+    return FakeClient.RunQueries(client)
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool(FakeApi, 'localhost', 9312, size=2)
+
+    def tearDown(self):
+        self.pool.clear()
+
+    def test_reuse(self):
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        self.assertIs(self.pool.acquire(), conn)
+
+        stats = self.pool.get_stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['in_use'], 1)
+
+    def test_dead_socket_replaced(self):
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        conn.client._peer.close()
+
+        new_conn = self.pool.acquire()
+        self.assertIsNot(new_conn, conn)
+        self.assertEqual(self.pool.get_stats()['discarded'], 1)
+
+    def test_expired(self):
+        self.pool.max_lifetime = 1
+        conn = self.pool.acquire()
+        conn.created_at -= 10
+        self.pool.release(conn)
+        self.assertIsNot(self.pool.acquire(), conn)
+
+    def test_bounded(self):
+        first = self.pool.acquire()
+        self.pool.acquire()
+        self.assertRaises(PoolTimeout, self.pool.acquire, timeout=0.01)
+
+        threading.Timer(0.05, self.pool.release, (first,)).start()
+        self.assertIs(self.pool.acquire(timeout=5), first)
+        self.assertEqual(self.pool.get_stats()['waits'], 2)
+
+    def test_connect_error(self):
+        FakeClient.refuse = True
+        try:
+            self.assertRaises(ConnectError, self.pool.acquire)
+        finally:
+            FakeClient.refuse = False
+        self.assertEqual(self.pool.get_stats()['opened'], 0)
+
+    def test_clear(self):
+        conn = self.pool.acquire()
+        self.pool.release(self.pool.acquire())
+        self.pool.clear()
+        self.assertEqual(self.pool.get_stats()['idle'], 0)
+
+        # connection checked out before clear is closed, not reused
+        self.pool.release(conn)
+        self.assertIsNone(conn.client._socket)
+        stats = self.pool.get_stats()
+        self.assertEqual((stats['opened'], stats['idle'], stats['discarded']), (0, 0, 1))
+        self.assertIsNot(self.pool.acquire(), conn)
+
+    def test_session(self):
+        with Session(FakeApi, 'localhost', 9312, pool=self.pool) as session:
+            client = session.conn
+            self.assertIs(session.conn, client)
+            self.assertEqual(self.pool.get_stats()['in_use'], 1)
+
+        self.assertEqual(self.pool.get_stats()['idle'], 1)
+
+    def test_failed_batch(self):
+        api = make_api({'RunQueries': run_queries}, fail=True)
+        pool = ConnectionPool(api, 'localhost', 9312, size=1)
+        with Session(api, 'localhost', 9312, pool=pool) as session:
+            failed_client = session.conn
+            self.assertRaises(QueryError, session.run, Query('products'))
+        api.fail = False
+        self.assertEqual(pool.get_stats()['discarded'], 1)
+
+        # queued requests of failed batch are not sent again
+        with Session(api, 'localhost', 9312, pool=pool) as session:
+            session.run(Query('users'))
+            self.assertIsNot(session.conn, failed_client)
+            batch, = session.conn.batches
+            self.assertEqual([calls[-1] for calls in batch], [('AddQuery', ('', 'users'))])
+        pool.clear()
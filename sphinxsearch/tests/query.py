@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+
+from array import array
+from ctypes import c_int64
+from struct import pack
+
+from six import PY3
+
+from sphinxsearch.exceptions import QueryError
+from sphinxsearch.query import Query
+from sphinxsearch.query.filters import (All, Any, FloatRange, IDRange, Not, Range,
+                                        FilterValues, INT64_TYPECODE)
+from sphinxsearch.query.optimizer import NOTHING, optimize_filter
+from sphinxsearch.session import Session, protocol
+from sphinxsearch.utils.persistent import PersistentMap, MAX_CHAIN_DEPTH
+from .utils import FakeApi, FakeClient, make_api
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+SCROLL_IDS = list(range(3, 60, 2))
+
+
+def get_scroll_result(client, calls):
+    ids = SCROLL_IDS
+    for name, args in calls:
+        # like searchd, last SetIDRange wins
+        if name == 'SetIDRange' and args != (0, 0):
+            start, end = args
+        elif name == 'SetFilterRange' and args[0] in ('id', '@id'):
+            ids = [i for i in ids if args[1] <= i <= args[2]]
+        elif name == 'SetFilter' and args[0] in ('id', '@id'):
+            ids = [i for i in ids if i in args[1]]
+    offset, limit = dict(calls)['SetLimits'][:2]
+
+    ids = [i for i in ids if start <= i <= end][offset:offset + limit]
+    result = FakeClient.get_result(client, calls)
+    result['matches'] = [{'id': i, 'weight': 1, 'attrs': {}} for i in ids]
+    return result
+
+
+ScrollApi = make_api({'get_result': get_scroll_result})
+
+
+def get_calls(backend):
+    client = FakeClient()
+    backend.apply(FakeApi, client)
+    calls, = client._queued
+    return calls
+
+
+class Test(unittest.TestCase):
+    def test_persistent_map(self):
+        empty = PersistentMap()
+        first = empty.set('a', 1)
+        second = first.set('b', 2).remove('a')
+
+        self.assertEqual(empty, {})
+        self.assertEqual(first, {'a': 1})
+        self.assertEqual(second, {'b': 2})
+        self.assertNotIn('a', second)
+        self.assertIs(second.remove('missing'), second)
+
+        deep = empty
+        for i in range(MAX_CHAIN_DEPTH * 3):
+            deep = deep.set(i % 5, i)
+        self.assertEqual(deep[0], MAX_CHAIN_DEPTH * 3 - 3)
+        self.assertEqual(len(deep), 5)
+
+    def test_structural_sharing(self):
+        base = Query('products').filter(brand_id=1)
+        chained = base.filter(category_id=2).orderby('-price')[0:10]
+
+        self.assertEqual(sorted(base.query.filters.keys()), ['brand_id'])
+        self.assertEqual(sorted(chained.query.filters.keys()), ['brand_id', 'category_id'])
+        self.assertIs(chained.query.filters._parent, base.query.filters)
+        self.assertIs(chained.query.overrides, base.query.overrides)
+
+    def test_apply(self):
+        qs = Query('products').filter(tags=All(1, 2),
+                                      rating=FloatRange(1.5, 4.5),
+                                      id=IDRange(100, 200),
+                                      brand_id=Not(7))
+        qs = qs.geo('lat', 'long', 0.5, 1.5).override('price', 'SPH_ATTR_INTEGER', **{'10': 5})
+
+        replayed = get_calls(qs.query)
+        self.assertEqual(replayed[-1], ('AddQuery', ('', 'products')))
+        self.assertIn(('SetFilter', ('tags', [1], False)), replayed)
+        self.assertIn(('SetFilter', ('brand_id', [7], True)), replayed)
+        self.assertIn(('SetIDRange', (100, 200)), replayed)
+        self.assertIn(('SetOverride', ('price', FakeApi.SPH_ATTR_INTEGER, {10: 5})), replayed)
+
+    def test_iterate(self):
+        session = Session(ScrollApi, 'localhost', 9312)
+        qs = Query('products').filter(id=IDRange(10, 100))[40:50]
+
+        ids = [match['id'] for match in qs.iterate(session, batch_size=4)]
+        self.assertEqual(ids, list(range(11, 60, 2)))
+
+        batches = session.conn.batches
+        self.assertEqual(len(batches), 7)
+        for (calls,) in batches:
+            self.assertIn(('SetLimits', (0, 4, 4, 0)), calls)
+            self.assertIn(('SetSortMode', (FakeApi.SPH_SORT_ATTR_ASC, '@id')), calls)
+        self.assertIn(('SetIDRange', (58, 100)), batches[-1][0])
+
+        # early exit stops background prefetch
+        iterator = Query('products').iterate(session, batch_size=2)
+        self.assertEqual(next(iterator)['id'], 3)
+        iterator.close()
+
+        ids = [match['id'] for match in Query('products').iterate(session, 10, prefetch=False)]
+        self.assertEqual(ids, SCROLL_IDS)
+
+        # id filters do not replace batch IDRange
+        qs = Query('products').filter(id=list(range(1, 41)))
+        ids = [match['id'] for match in qs.iterate(session, batch_size=4, prefetch=False)]
+        self.assertEqual(ids, list(range(3, 40, 2)))
+        qs = Query('products').filter(id=[3, 5, 7, 9, 55])
+        ids = [match['id'] for match in qs.iterate(session, batch_size=2, prefetch=False)]
+        self.assertEqual(ids, [3, 5, 7, 9, 55])
+        session.close()
+
+    def test_filter_values(self):
+        values = array(INT64_TYPECODE, [1, 5, 9])
+        self.assertIs(Any(values).values.array, values)
+
+        sources = [[9, 1, 5, 5], (5, 9, 1), set([1, 5, 9]), array(INT64_TYPECODE, [9, 5, 1, 9])]
+        if PY3:
+            # python 2 arrays have no buffer interface
+            sources.append(memoryview(values))
+            # big and little endian buffers, one of them is not native
+            sources.extend(memoryview((int64 * 4)(9, 1, 5, 9))
+                           for int64 in (c_int64.__ctype_be__, c_int64.__ctype_le__))
+        for source in sources:
+            self.assertEqual(Any(source).values, [1, 5, 9])
+        self.assertEqual(Any(9, '1', 5).values, [1, 5, 9])
+        self.assertEqual(Any(7).values, [7])
+        self.assertEqual(Any(range(3, 6)).values, [3, 4, 5])
+        self.assertEqual(Not([2, 1]).values, [1, 2])
+
+        big = FilterValues(range(-2, 1000, 3))
+        self.assertEqual(big.pack(), pack('>%dq' % len(big), *range(-2, 1000, 3)))
+
+        builder = protocol.SearchRequestBuilder()
+        builder.SetFilter('brand_id', big)
+        builder.SetFilter('brand_id', big.tolist())
+        self.assertEqual(builder._filters[0], builder._filters[1])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_filter_numpy(self):
+        self.assertEqual(Any(numpy.array([5, 1, 5], dtype='int32')).values, [1, 5])
+
+    def test_fit_filters(self):
+        qs = Query('products').filter(brand_id=[1, 2, 3], category_id=range(10, 20),
+                                      id=range(100, 110), tags=Not([1, 3, 5, 7, 9]),
+                                      price=All(Not([2, 4, 6]), Range(1, 100)))
+        self.assertIs(qs.query.fit_filters(10), qs.query)
+
+        fitted = qs.query.fit_filters(3)
+        filters = dict(fitted.get_filters())
+        self.assertIs(filters['brand_id'], qs.query.filters['brand_id'])
+        self.assertEqual(repr(filters['category_id']),
+                         repr(Range(10, 19)))
+        self.assertIsInstance(filters['id'], IDRange)
+        self.assertEqual((filters['id'].start, filters['id'].end), (100, 109))
+
+        calls = get_calls(fitted)
+        self.assertIn(('SetFilter', ('tags', [1, 3, 5], True)), calls)
+        self.assertIn(('SetFilter', ('tags', [7, 9], True)), calls)
+        self.assertIn(('SetFilter', ('price', [2, 4, 6], True)), calls)
+        self.assertIn(('SetIDRange', (100, 109)), calls)
+
+        excluded = Query('products').filter(category_id=Not(range(10, 20))).query.fit_filters(3)
+        self.assertIn(('SetFilterRange', ('category_id', 10, 19, True)),
+                      get_calls(excluded))
+
+        # included values can not be split, filters of one attr are intersected
+        qs = Query('products').filter(brand_id=[1, 3, 5, 7])
+        self.assertRaises(QueryError, qs.query.fit_filters, 3)
+
+        session = Session(FakeApi, 'localhost', 9312, max_filter_values=3)
+        session.run(Query('products').filter(tags=Not([1, 3, 5, 7])))
+        first, = session.conn.batches[0]
+        self.assertIn(('SetFilter', ('tags', [7], True)), first)
+        session.close()
+
+    def test_filter_equality(self):
+        self.assertEqual(Any(1, 2, 3), Any([3, 2, 1]))
+        self.assertNotEqual(Any(1, 2), Not([1, 2]))
+        self.assertNotEqual(Range(1, 10), IDRange(1, 10))
+        self.assertEqual(All(Range(1, 10), Not([5])), All(Not([5]), Range(1, 10)))
+        self.assertEqual(len(set([Range(1, 10), Range(1, 10), FloatRange(1, 10)])), 2)
+
+        # filters of one attr are intersected
+        qs = Query('products').filter(price=Range(10, 100)).filter(price=Range(50, 200))
+        self.assertEqual(qs.query.filters['price'], All(Range(10, 100), Range(50, 200)))
+
+    def test_optimize_filter(self):
+        self.assertEqual(optimize_filter('price', All(Range(10, 100), Range(50, 200), Not([1, 60]))),
+                         All(Range(50, 100), Not([60])))
+        self.assertEqual(optimize_filter('brand_id', Any(3, 4, 5)), Range(3, 5))
+        self.assertEqual(optimize_filter('brand_id', Any(3, 4)), Any(3, 4))
+        self.assertEqual(optimize_filter('id', Any(7)), Any(7))
+        self.assertEqual(optimize_filter('price', All(IDRange(1, 50), Range(5, 30), IDRange(20, 80))),
+                         All(Range(5, 30), IDRange(20, 50)))
+        self.assertEqual(optimize_filter('brand_id', All(Any(1, 2, 3, 8), Range(2, 10), Not([3]))),
+                         Any(2, 8))
+        self.assertEqual(optimize_filter('brand_id', All(Range(1, 10), Not([1, 2]), Not(Range(9, 20)))),
+                         Range(3, 8))
+        self.assertIsNone(optimize_filter('brand_id', Not([])))
+
+        op = All(Range(1, 10), Not([5]))
+        self.assertIs(optimize_filter('brand_id', op), op)
+
+        self.assertIs(optimize_filter('price', All(Range(1, 10), Range(20, 30))), NOTHING)
+        self.assertIs(optimize_filter('price', All(Any(1, 2), Not([1, 2]))), NOTHING)
+        self.assertIs(optimize_filter('price', All(FloatRange(1, 2), FloatRange(3, 4))), NOTHING)
+        self.assertIs(optimize_filter('id', All(IDRange(1, 2), IDRange(3, 4))), NOTHING)
+
+    def test_merge_id_ranges(self):
+        # searchd keeps only last SetIDRange, all of them are intersected
+        qs = Query('products').filter(id=IDRange(1, 50), price=All(Range(5, 30), IDRange(20, 80)))
+        backend = qs.query.optimize_filters()
+        self.assertEqual(backend.filters['@id'], IDRange(20, 50))
+        self.assertEqual(backend.filters['price'], Range(5, 30))
+        self.assertNotIn('id', backend.filters)
+
+        calls = get_calls(backend)
+        id_ranges = [args for name, args in calls if name == 'SetIDRange' and args != (0, 0)]
+        self.assertEqual(id_ranges, [(20, 50)])
+
+        qs = Query('products').filter(id=IDRange(1, 10), **{'@id': IDRange(20, 30)})
+        self.assertTrue(qs.query.optimize_filters().matches_nothing)
+
+        # contiguous ids fitted to IDRange are merged too
+        qs = Query('products').filter(id=range(100, 200), **{'@id': IDRange(150, 300)})
+        fitted = qs.query.fit_filters(10)
+        self.assertEqual(dict(fitted.get_filters()), {'@id': IDRange(150, 199)})
+
+    def test_match_nothing(self):
+        qs = Query('products').filter(id=range(100, 110), brand_id=[1, 2])
+        backend = qs.query.optimize_filters()
+        self.assertFalse(backend.matches_nothing)
+        self.assertEqual(backend.filters['id'], Range(100, 109))
+        calls = get_calls(backend)
+        self.assertIn(('SetFilterRange', ('id', 100, 109, False)), calls)
+
+        session = Session(FakeApi, 'localhost', 9312)
+        empty = qs.filter(brand_id=Not([1, 2]))
+        results = session.run(empty, qs)
+        self.assertEqual(results[0]['matches'], [])
+        self.assertEqual(results[0]['total_found'], 0)
+        first, = session.conn.batches[0]
+        self.assertIn(('SetFilter', ('brand_id', [1, 2], False)), first)
+        self.assertEqual(len(session.conn.batches), 1)
+
+        session.run(empty)
+        self.assertEqual(len(session.conn.batches), 1)
+        session.close()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+import unittest
+
+from sphinxsearch import SearchServer
+from sphinxsearch.exceptions import ConfigError, ConnectError, QueryError, ReplicaUpdateError
+from sphinxsearch.query import Query
+from sphinxsearch.session.replicas import (CircuitBreaker, ReplicaSet, LEAST_OUTSTANDING,
+                                           CLOSED, OPEN, HALF_OPEN, get_budget, is_idempotent)
+from .utils import FakeClient, make_api
+
+
+def is_refused(client):
+    return client.server[1] in client.api.down
+
+
+def is_connect_error(client):
+    return client.refuse
+
+
+def run_queries(client):
+    if client.refuse:
+        client._queued = []
+        return None
+    if client.server[1] in client.api.failing:
+        # searchd error, requests stay queued in client
+        return None
+    client.api.sent.append(list(client._queued))
+    return FakeClient.RunQueries(client)
+
+
+def update_attributes(client, index, attrs, values, mva=False):
+    if client.refuse:
+        return -1
+    client.api.updated.append(client.server[1])
+    return len(values)
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.api = make_api({'refuse': property(is_refused),
+                             'IsConnectError': is_connect_error,
+                             'RunQueries': run_queries,
+                             'UpdateAttributes': update_attributes},
+                            down=set(), failing=set(), sent=[], updated=[])
+        self.server = SearchServer('localhost', 1, replicas=[('localhost', 2), ('localhost', 3)],
+                                   failure_threshold=2, reset_timeout=0.1)
+        self.server.set_api(self.api)
+
+    def tearDown(self):
+        self.server.session_maker.reset()
+
+    def get_stats(self):
+        return dict((stats['port'], stats) for stats in self.server.session_maker.get_replica_stats())
+
+    def test_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertEqual((breaker.state, breaker.allow()), (CLOSED, True))
+        breaker.record_failure()
+        self.assertEqual((breaker.state, breaker.allow()), (OPEN, False))
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_least_outstanding(self):
+        replica_set = ReplicaSet([('a', 1), ('b', 2), ('c', 3)], {}, balancing=LEAST_OUTSTANDING)
+        first, second, third = replica_set.replicas
+        first.outstanding, second.outstanding, third.outstanding = 2, 0, 1
+        self.assertIs(replica_set.choose(), second)
+        self.assertIs(replica_set.choose(exclude=[second]), third)
+
+        third.breaker.opened_at = time.time()
+        self.assertIs(replica_set.choose(exclude=[second]), first)
+        self.assertRaises(ConnectError, replica_set.choose, exclude=[first, second])
+
+    def test_failover(self):
+        self.api.down = {2}
+
+        for _ in range(20):
+            with self.server.get_session() as session:
+                result, = session.run(Query('products'))
+            self.assertEqual(result['status'], 0)
+
+        stats = self.get_stats()
+        self.assertEqual(stats[2]['failures'], 2)
+        self.assertEqual(stats[2]['state'], OPEN)
+        self.assertEqual(sum(s['requests'] - s['failures'] for s in stats.values()), 20)
+
+        # ejected replica is probed again by health check
+        self.api.down = set()
+        self.assertEqual(self.server.session_maker.check_health(), 3)
+        self.assertEqual(self.get_stats()[2]['state'], CLOSED)
+
+        self.api.down = {1, 2, 3}
+        with self.server.get_session() as session:
+            self.assertRaises(ConnectError, session.run, Query('products'))
+
+    def test_retry_budget(self):
+        self.assertFalse(is_idempotent([Query('products').raw_update(('price',), {1: (2,)}).query]))
+        self.assertTrue(is_idempotent([Query('products').query]))
+        self.assertEqual(get_budget([Query('products').timeout(1500).query], 5), 1.5)
+        self.assertEqual(get_budget([Query('products').query], 5), 5)
+
+        self.assertRaises(ConfigError, lambda: self.server.async_session_maker)
+
+    def test_failed_batch_not_resent(self):
+        self.api.failing = set([1, 2, 3])
+        with self.server.get_session() as session:
+            self.assertRaises(QueryError, session.run, Query('products'))
+
+        self.api.failing = set()
+        for _ in range(6):
+            with self.server.get_session() as session:
+                session.run(Query('users'))
+        self.assertEqual([len(batch) for batch in self.api.sent], [1] * 6)
+
+    def test_update_attributes(self):
+        with self.server.get_session() as session:
+            self.assertEqual(session.update_attributes('products', ['price'], {1: [10]}), 1)
+        self.assertEqual(sorted(self.api.updated), [1, 2, 3])
+
+        self.api.down = {2}
+        for _ in range(3):
+            self.api.updated = []
+            with self.server.get_session() as session:
+                with self.assertRaises(ReplicaUpdateError) as ctx:
+                    session.update_attributes('products', ['price'], {1: [10]})
+            error = ctx.exception
+            self.assertEqual(error.updated, {('localhost', 1): 1, ('localhost', 3): 1})
+            self.assertEqual(list(error.failed), [('localhost', 2)])
+            self.assertEqual(sorted(self.api.updated), [1, 3])
+
+        # ejected replica is not contacted
+        self.assertEqual(self.get_stats()[2]['requests'], 3)
+        self.assertIsInstance(error.failed[('localhost', 2)], ConnectError)
+
+        # no replicas configured
+        self.assertIsNone(SearchServer('localhost', 9312).session_maker.check_health())
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import copy
+import unittest
+
+from array import array
+
+from sphinxsearch.exceptions import QueryError
+from sphinxsearch.models import Index, RT, Int, BigInt, Float, MVA
+from sphinxsearch.query import Query
+from sphinxsearch.query.filters import INT64_TYPECODE
+from sphinxsearch.session import Session, protocol
+from sphinxsearch.session.results import ResultSet, Row
+from .searchd import build_search_result
+from .utils import FakeApi, make_api
+
+
+class Products(Index):
+    __source__ = RT()
+    __fields__ = ('title',)
+
+    price = Int()
+    views = BigInt()
+    rating = Float()
+    tags = MVA(Int)
+
+
+def get_result():
+    return {'status': 0, 'error': '', 'warning': '', 'fields': ['title'],
+            'attrs': [['price', FakeApi.SPH_ATTR_INTEGER], ['views', FakeApi.SPH_ATTR_BIGINT],
+                      ['rating', FakeApi.SPH_ATTR_FLOAT], ['tags', FakeApi.SPH_ATTR_MULTI],
+                      ['@count', FakeApi.SPH_ATTR_INTEGER]],
+            'matches': [{'id': i, 'weight': 100 + i,
+                         'attrs': {'price': 10 * i, 'views': 2 ** 40 + i, 'rating': 0.5 * i,
+                                   'tags': [i, i + 1], '@count': i}}
+                        for i in range(1, 4)],
+            'total': 3, 'total_found': 30, 'time': '0.001', 'words': []}
+
+
+ResultApi = make_api({'get_result': lambda client, calls: get_result()})
+
+
+class Test(unittest.TestCase):
+    def test_columns(self):
+        result = ResultSet.from_result(get_result(), Products)
+        self.assertEqual(len(result), 3)
+        self.assertEqual(result.ids, array(INT64_TYPECODE, [1, 2, 3]))
+        self.assertEqual(result.column('price'), array('I', [10, 20, 30]))
+        self.assertEqual(result.column('views').typecode, INT64_TYPECODE)
+        self.assertEqual(result.column('rating'), array('f', [0.5, 1.0, 1.5]))
+        self.assertEqual(result.column('tags'), [[1, 2], [2, 3], [3, 4]])
+        # attrs missing in model are typed by searchd attr types
+        self.assertEqual(result.column('@count'), array('I', [1, 2, 3]))
+
+        # values not fitting typecode are kept in list
+        big = get_result()
+        big['matches'][0]['attrs']['price'] = 2 ** 40
+        self.assertIsInstance(ResultSet.from_result(big, Products).column('price'), list)
+
+    def test_rows(self):
+        result = ResultSet.from_result(get_result())
+        row = result[-1]
+        self.assertIsInstance(row, Row)
+        self.assertEqual((row.id, row.weight, row.price, row.rating), (3, 103, 30, 1.5))
+        self.assertEqual(row['attrs']['tags'], [3, 4])
+        self.assertRaises(AttributeError, getattr, row, 'missing')
+        self.assertRaises(KeyError, row.__getitem__, 'price')
+        self.assertRaises(IndexError, result.__getitem__, 3)
+        self.assertRaises(AttributeError, setattr, row, 'price', 1)
+        self.assertEqual(copy.copy(row), row)
+
+        # sphinxapi result compatibility
+        self.assertEqual(result['matches'], get_result()['matches'])
+        self.assertEqual([match['id'] for match in result['matches']], [1, 2, 3])
+        self.assertEqual(result['total_found'], 30)
+        self.assertIsNone(result.get('missing'))
+        result['warning'] = 'slow'
+        self.assertEqual(result['warning'], 'slow')
+
+    def test_session(self):
+        session = Session(ResultApi, 'localhost', 9312, columnar=True)
+        result, empty = session.run(Query('products'), Query('products').filter(id=[]))
+        self.assertIsInstance(result, ResultSet)
+        self.assertEqual(list(result.ids), [1, 2, 3])
+        self.assertEqual(len(empty), 0)
+        session.close()
+
+        session = Session(ResultApi, 'localhost', 9312)
+        result = Query(Products).fetch(session)
+        self.assertEqual(result.column('price').typecode, 'I')
+        self.assertEqual(result.column('views').typecode, INT64_TYPECODE)
+        session.close()
+
+        session = Session(FakeApi, 'localhost', 9312)
+        session.conn.get_result = lambda calls: {'status': 1, 'error': 'unknown index'}
+        self.assertRaises(QueryError, Query('products').fetch, session)
+        session.close()
+
+    def test_protocol(self):
+        payload = b''.join(build_search_result(query) for query in [
+            {'index': 'products', 'offset': 0, 'limit': 3, 'term': 'phone'},
+            {'index': 'missing'}])
+        result, failed = protocol.parse_search_response(payload, 2, columnar=True)
+
+        self.assertEqual(list(result.ids), [1, 2, 3])
+        self.assertEqual(result.column('price'), array('I', [10, 20, 30]))
+        self.assertEqual(result['total_found'], 1000)
+        self.assertEqual(result['words'], [{'word': 'phone', 'docs': 1000, 'hits': 2000}])
+        self.assertEqual(result['matches'],
+                         protocol.parse_search_response(payload, 2)[0]['matches'])
+
+        self.assertIsInstance(failed, ResultSet)
+        self.assertEqual(failed['error'], 'unknown local index')
+        self.assertEqual(len(failed), 0)
+
+        # 64 bit ids are unsigned like in sphinxapi
+        payload = build_search_result({'index': 'products', 'offset': 2 ** 63 - 1,
+                                       'limit': 2, 'term': ''})
+        result, = protocol.parse_search_response(payload, 1)
+        self.assertEqual([match['id'] for match in result['matches']], [2 ** 63, 2 ** 63 + 1])
+        result, = protocol.parse_search_response(payload, 1, columnar=True)
+        self.assertEqual(list(result.ids), [2 ** 63, 2 ** 63 + 1])
+
+    def test_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest('numpy is not installed')
+
+        result = ResultSet.from_result(get_result(), Products)
+        exported = result.to_numpy()
+        self.assertNotIn('tags', exported)
+        self.assertEqual(exported['price'].tolist(), [10, 20, 30])
+        self.assertEqual(exported['id'].dtype, numpy.dtype(INT64_TYPECODE))
+
+        # numpy arrays share columns memory
+        result.column('price')[0] = 11
+        self.assertEqual(exported['price'][0], 11)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from sphinxsearch import Engine, Indexer, SearchServer
+from sphinxsearch.exceptions import ConfigError
+from sphinxsearch.models import Index, RT, XML, Int
+from sphinxsearch.engine.scheduler import ReindexScheduler, parse_size
+
+
+FAKE_INDEXER = '''#!%s
+import sys, time
+index = sys.argv[3]
+print('indexing %%s' %% ' '.join(sys.argv[1:]))
+with open(sys.argv[2] + '.' + index, 'w') as f:
+    f.write('%%f' %% time.time())
+time.sleep(0.2)
+with open(sys.argv[2] + '.' + index, 'a') as f:
+    f.write(' %%f' %% time.time())
+if index.endswith('broken'):
+    sys.exit(3)
+# like indexer 2.1+, --nohup leaves .tmp files instead of .new
+with open('%%s.%%s.%%s' %% (sys.argv[2], index, 'tmp' if '--nohup' in sys.argv else 'new'), 'w') as f:
+    f.write('built')
+'''
+
+FAKE_INDEXTOOL = '''#!%s
+import os, sys
+conf, index = sys.argv[2], sys.argv[4]
+assert sys.argv[3] == '--check' and '--rotate' in sys.argv
+print('checking %%s' %% index)
+if os.path.exists('%%s.%%s.corrupt' %% (conf, index)):
+    sys.exit(1)
+os.rename('%%s.%%s.tmp' %% (conf, index), '%%s.%%s.new' %% (conf, index))
+'''
+
+
+def get_index(name, source):
+    return type(Index)(str(name), (Index,), {'__source__': source, 'price': Int(),
+                                          '__module__': __name__})
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        for name, source in (('indexer', FAKE_INDEXER), ('indextool', FAKE_INDEXTOOL)):
+            path = os.path.join(self.tmp, name)
+            with open(path, 'w') as f:
+                f.write(source % sys.executable)
+            os.chmod(path, 0o755)
+
+        self.engine = Engine()
+        self.engine.commands.prefix = self.tmp
+        self.engine.set_conf(os.path.join(self.tmp, 'sphinx.conf'))
+
+        self.engine.server = SearchServer('localhost', 9312)
+        self.engine.server.set_option('pid_file', os.path.join(self.tmp, 'searchd.pid'))
+        self.engine.indexer = Indexer()
+        self.engine.indexer.set_option('mem_limit', '256M')
+
+        for name in ('products', 'users', 'orders', 'broken'):
+            self.engine.add_index(get_index(name, XML('produce')))
+        self.engine.add_index(get_index('realtime', RT()))
+
+        self.searchd = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(10)'])
+        with open(os.path.join(self.tmp, 'searchd.pid'), 'w') as f:
+            f.write('%s\n' % self.searchd.pid)
+
+    def tearDown(self):
+        if self.searchd.poll() is None:
+            self.searchd.kill()
+        self.searchd.wait()
+        shutil.rmtree(self.tmp)
+
+    def get_files(self, extension):
+        suffix = '.' + extension
+        return sorted(name[len('sphinx.conf.'):-len(suffix)] for name in os.listdir(self.tmp)
+                      if name.startswith('sphinx.conf.') and name.endswith(suffix))
+
+    def get_span(self, result):
+        with open(os.path.join(self.tmp, 'sphinx.conf.%s' % result.name)) as f:
+            return [float(v) for v in f.read().split()]
+
+    def test_run(self):
+        rotated = []
+        self.engine.commands.add_rotate_listener(rotated.append)
+
+        results = self.engine.reindex(mem_budget='512M', concurrency=3)
+
+        self.assertEqual([r.name for r in results],
+                         ['scheduler_broken', 'scheduler_orders',
+                          'scheduler_products', 'scheduler_users'])
+        self.assertEqual([r.returncode for r in results], [3, 0, 0, 0])
+        self.assertTrue(all(r.elapsed >= 0.2 for r in results))
+        self.assertIn('--rotate', results[1].output)
+        self.assertIn('--nohup', results[1].output)
+
+        # mem budget allows two 256M indexers at once
+        spans = [self.get_span(r) for r in results]
+        for start, _ in spans:
+            running = [1 for s, e in spans if s <= start < e]
+            self.assertTrue(len(running) <= 2)
+
+        self.assertEqual(self.searchd.wait(), -signal.SIGHUP)
+        self.assertEqual(rotated[-1], ['scheduler_orders', 'scheduler_products', 'scheduler_users'])
+
+        # built indexes wait for rotation as .new files when SIGHUP is sent
+        self.assertEqual(self.get_files('new'),
+                         ['scheduler_orders', 'scheduler_products', 'scheduler_users'])
+        self.assertEqual(self.get_files('tmp'), [])
+        self.assertIn('checking scheduler_orders', results[1].output)
+
+    def test_failed_check(self):
+        open(os.path.join(self.tmp, 'sphinx.conf.scheduler_users.corrupt'), 'w').close()
+        rotated = []
+        self.engine.commands.add_rotate_listener(rotated.append)
+
+        results = ReindexScheduler(self.engine, concurrency=4).run()
+        self.assertEqual([r.returncode for r in results], [3, 0, 0, 1])
+        self.assertEqual(self.get_files('new'), ['scheduler_orders', 'scheduler_products'])
+        self.assertEqual(self.get_files('tmp'), ['scheduler_users'])
+        self.assertEqual(self.searchd.wait(), -signal.SIGHUP)
+        self.assertEqual(rotated[-1], ['scheduler_orders', 'scheduler_products'])
+
+    def test_budget(self):
+        self.assertEqual(parse_size('1G'), 1024 ** 3)
+        self.engine.indexer.set_option('max_iops', 40)
+
+        scheduler = ReindexScheduler(self.engine, concurrency=8, iops_budget=100)
+        self.assertEqual(scheduler.get_max_workers(), 2)
+
+        scheduler = ReindexScheduler(self.engine, mem_budget='128M')
+        self.assertRaises(ConfigError, scheduler.get_max_workers)
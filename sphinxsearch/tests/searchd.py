@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+    Fake searchd speaking binary protocol on localhost, used by offline tests.
+    Every query gets `limit` matches with ids offset+1..offset+limit
+    and `price` attribute equal to id * 10.
+"""
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from struct import pack
+
+from six.moves import socketserver
+
+from sphinxsearch.session import protocol
+from sphinxsearch.session.protocol import ResponseReader, pack_string
+
+
+def parse_search_query(reader):
+    query = {}
+    offset, limit, _, ranker, sort = reader.unpack('>5L')
+    query.update(offset=offset, limit=limit, sort=sort)
+    query['sort_by'] = reader.read_string()
+    query['term'] = reader.read_string()
+    reader.unpack('>%dL' % reader.read_uint())
+    query['index'] = reader.read_string()
+    _, query['min_id'], query['max_id'] = reader.unpack('>LQQ')
+
+    filters = query['filters'] = []
+    for _ in range(reader.read_uint()):
+        attr = reader.read_string()
+        filter_type = reader.read_uint()
+        if filter_type == protocol.SPH_FILTER_VALUES:
+            values = list(reader.unpack('>%dq' % reader.read_uint()))
+        elif filter_type == protocol.SPH_FILTER_RANGE:
+            values = list(reader.unpack('>2q'))
+        else:
+            values = list(reader.unpack('>2f'))
+        exclude = reader.read_uint()
+        filters.append((attr, filter_type, values, exclude))
+
+    query['group_func'] = reader.read_uint()
+    query['group_by'] = reader.read_string()
+    query['max_matches'] = reader.read_uint()
+    query['group_sort'] = reader.read_string()
+    query['cutoff'], _, _ = reader.unpack('>3L')
+    query['group_distinct'] = reader.read_string()
+
+    if reader.read_uint():
+        query['anchor'] = (reader.read_string(), reader.read_string()) + reader.unpack('>2f')
+
+    for _ in range(reader.read_uint()):
+        reader.read_string()
+        reader.read_uint()
+
+    query['max_query_time'] = reader.read_uint()
+
+    for _ in range(reader.read_uint()):
+        reader.read_string()
+        reader.read_uint()
+
+    query['comment'] = reader.read_string()
+
+    overrides = query['overrides'] = {}
+    for _ in range(reader.read_uint()):
+        name = reader.read_string()
+        attr_type, count = reader.unpack('>2L')
+        value_format = {protocol.SPH_ATTR_FLOAT: '>Qf',
+                        protocol.SPH_ATTR_BIGINT: '>Qq'}.get(attr_type, '>Ql')
+        overrides[name] = dict(reader.unpack(value_format) for _ in range(count))
+
+    query['select'] = reader.read_string()
+    return query
+
+
+def build_search_result(query):
+    if query['index'] == 'missing':
+        return pack('>L', protocol.SEARCHD_ERROR) + pack_string('unknown local index')
+
+    ids = range(query['offset'] + 1, query['offset'] + query['limit'] + 1)
+
+    result = [pack('>L', protocol.SEARCHD_OK),
+              pack('>L', 1), pack_string('title'),
+              pack('>L', 1), pack_string('price'), pack('>L', protocol.SPH_ATTR_INTEGER),
+              pack('>2L', len(ids), 1)]
+    for doc_id in ids:
+        result.append(pack('>QLL', doc_id, 1, doc_id * 10 & 0xffffffff))
+
+    result.append(pack('>4L', len(ids), 1000, 1, 1))
+    result.append(pack_string(query['term']) + pack('>2L', 1000, 2000))
+    return b''.join(result)
+
+
+class SearchdHandler(socketserver.BaseRequestHandler):
+    def recv(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def handle(self):
+        self.request.sendall(pack('>L', 1))
+        if self.recv(4) is None:
+            return
+
+        while True:
+            header = self.recv(8)
+            if header is None:
+                return
+            command, _, length = protocol.parse_header(header)
+            body = self.recv(length)
+            if command == protocol.SEARCHD_COMMAND_PERSIST:
+                continue
+
+            reader = ResponseReader(body)
+            _, count = reader.unpack('>2L')
+            queries = [parse_search_query(reader) for _ in range(count)]
+            self.server.queries.extend(queries)
+            self.server.requests += 1
+
+            if self.server.delay:
+                time.sleep(self.server.delay)
+
+            payload = b''.join(build_search_result(query) for query in queries)
+            response = pack(protocol.HEADER_FORMAT, protocol.SEARCHD_OK,
+                            protocol.VER_COMMAND_SEARCH, len(payload))
+            self.request.sendall(response + payload)
+
+
+class FakeSearchd(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), SearchdHandler)
+        self.queries = []
+        self.requests = 0
+        self.delay = 0
+        self.host, self.port = self.server_address
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from sphinxsearch import Engine, SearchServer
+from sphinxsearch.engine.executor import CommandExecutor
+from sphinxsearch.query import Query
+from sphinxsearch.query.filters import Range
+from sphinxsearch.session import Session
+from sphinxsearch.session.cache import LocalCache, ResultCache
+from .utils import FakeApi
+
+
+FAKE_INDEXER = '''#!%s
+import sys
+sys.exit(1 if 'broken' in sys.argv else 0)
+'''
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.session = Session(FakeApi, 'localhost', 9312, max_batch_queries=2)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_clone(self):
+        qs = Query('products')
+        filtered = qs.filter(category_id=[1, 2])[10:30]
+
+        self.assertEqual(qs.query.filters, {})
+        self.assertEqual((qs.query.offset, qs.query.limit), (0, 20))
+        self.assertEqual((filtered.query.offset, filtered.query.limit), (10, 20))
+
+    def test_run(self):
+        qs = Query('products').like('phone')
+        queries = [qs.filter(category_id=[1, 2]).orderby('-price'),
+                   qs.filter(price=Range(10, 100)).groupby('brand_id')[5],
+                   qs.max(1000).timeout(50)]
+
+        results = self.session.run(*queries)
+        self.assertEqual(len(results), 3)
+
+        batches = self.session.conn.batches
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+
+        first, second = batches[0]
+        self.assertIn(('SetFilter', ('category_id', [1, 2], False)), first)
+        self.assertIn(('SetSortMode', (FakeApi.SPH_SORT_ATTR_DESC, 'price')), first)
+        self.assertEqual(first[-1], ('AddQuery', ('phone', 'products')))
+
+        self.assertIn(('SetFilterRange', ('price', 10, 100, False)), second)
+        self.assertIn(('SetGroupBy', ('brand_id', FakeApi.SPH_GROUPBY_ATTR, '@group desc')), second)
+        self.assertIn(('SetLimits', (5, 1, 0, 0)), second)
+
+        third, = batches[1]
+        self.assertIn(('SetLimits', (0, 20, 1000, 0)), third)
+        self.assertIn(('SetMaxQueryTime', (50,)), third)
+
+    def test_result_cache(self):
+        cache = ResultCache(LocalCache(maxsize=3))
+        session = Session(FakeApi, 'localhost', 9312, result_cache=cache)
+        qs = Query('products').like('phone')
+
+        session.run(qs.cache(), qs.filter(brand_id=1).cache(30), qs)
+        session.run(qs.cache(), qs.filter(brand_id=2).cache())
+
+        # second batch sends only new cacheable query
+        first, second = session.conn.batches
+        self.assertEqual((len(first), len(second)), (3, 1))
+        self.assertIn(('SetFilter', ('brand_id', [2], False)), second[0])
+
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 3))
+        self.assertEqual(stats['evictions'], 1)
+        session.close()
+
+    def test_cache_invalidation(self):
+        cache = ResultCache()
+        engine = Engine()
+        engine.server = SearchServer('localhost', 9312, result_cache=cache)
+        engine.commands.set_conf('/etc/sphinx.conf')
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with open(os.path.join(tmp, 'indexer'), 'w') as f:
+            f.write(FAKE_INDEXER % sys.executable)
+        os.chmod(os.path.join(tmp, 'indexer'), 0o755)
+        engine.commands.prefix = tmp
+        executor = CommandExecutor()
+
+        session = Session(FakeApi, 'localhost', 9312, result_cache=cache)
+        qs = Query('products').cache()
+
+        session.run(qs)
+        executor.run(engine.commands.reindex('products', rotate=False))
+        session.run(qs)
+
+        # cache is invalidated after rotation, not when command is built
+        merge = engine.commands.merge('products', 'products_delta')
+        session.run(qs)
+        self.assertEqual(len(session.conn.batches), 1)
+        executor.run(merge)
+        session.run(qs)
+        self.assertEqual(len(session.conn.batches), 2)
+
+        executor.run(engine.commands.reindex('broken'))
+        executor.run(engine.commands.reindex('products', nohup=True))
+        session.run(qs)
+
+        self.assertEqual(len(session.conn.batches), 2)
+        # products and products_delta of merge
+        self.assertEqual(cache.get_stats()['invalidations'], 2)
+        session.close()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+import unittest
+
+from sphinxsearch import SearchServer
+from sphinxsearch.exceptions import QueryError
+from sphinxsearch.query import Query
+from sphinxsearch.query.orderby import Asc, Desc, MultiSort, Expr
+from sphinxsearch.session.sharded import (ShardedSession, get_sort_clauses, get_sort_key,
+                                          merge_matches)
+from .utils import FakeApi, FakeClient, make_api
+
+
+def match(doc_id, weight, price):
+    return {'id': doc_id, 'weight': weight, 'attrs': {'price': price, 'title': 't%s' % doc_id}}
+
+
+SHARDS = {
+    1: [match(1, 10, 5), match(4, 7, 30), match(7, 1, 8)],
+    2: [match(2, 9, 40), match(5, 7, 1)],
+    3: [match(3, 12, 7), match(6, 2, 50), match(9, 2, 3), match(12, 1, 2)],
+}
+
+
+def run_queries(client):
+    time.sleep(client.api.delay.get(client.server[1], 0))
+    return FakeClient.RunQueries(client)
+
+
+def get_result(client, calls):
+    result = FakeClient.get_result(client, calls)
+    shard = client.server[1]
+    matches = [dict(m, attrs=dict(m['attrs'])) for m in SHARDS[shard]]
+
+    order = [args for name, args in calls if name == 'SetSortMode'][-1]
+    if order[0] == FakeApi.SPH_SORT_ATTR_DESC:
+        matches.sort(key=lambda m: (-m['attrs']['price'], -m['weight'], m['id']))
+    elif order[0] == FakeApi.SPH_SORT_EXPR:
+        for m in matches:
+            m['attrs']['_sort_expr'] = m['weight'] * 100 + m['id']
+        matches.sort(key=lambda m: -m['attrs']['_sort_expr'])
+    elif order[0] == FakeApi.SPH_SORT_EXTENDED:
+        matches.sort(key=lambda m: (m['attrs']['title'], m['id']))
+    else:
+        matches.sort(key=lambda m: (-m['weight'], m['id']))
+
+    attrs = [['price', 1], ['title', 7]]
+    if order[0] == FakeApi.SPH_SORT_EXPR:
+        attrs.append(['_sort_expr', 1])
+
+    limits = [args for name, args in calls if name == 'SetLimits'][-1]
+    result.update(matches=matches[:limits[1]], total=len(matches), total_found=len(matches) * 10,
+                  attrs=attrs, time='0.0%s0' % shard,
+                  words=[{'word': 'phone', 'docs': shard, 'hits': shard * 2}])
+    result['limits'] = limits
+    return result
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.api = make_api({'RunQueries': run_queries, 'get_result': get_result}, delay={})
+        self.servers = []
+        for port in sorted(SHARDS):
+            server = SearchServer('localhost', port)
+            server.set_api(self.api)
+            self.servers.append(server)
+
+    def ids(self, result):
+        return [m['id'] for m in result['matches']]
+
+    def test_merge(self):
+        session = ShardedSession(self.servers)
+
+        result, by_price, multi = session.run(Query('products')[2:6],
+                                              Query('products').orderby(Desc('price'))[:3],
+                                              Query('products').orderby(MultiSort('title ASC')))
+
+        self.assertEqual(self.ids(result), [2, 4, 5, 6])
+        self.assertEqual((result['total'], result['total_found']), (9, 90))
+        self.assertEqual(result['words'], [{'word': 'phone', 'docs': 6, 'hits': 12}])
+        self.assertEqual(result['time'], '0.030')
+        self.assertFalse(result['partial'])
+
+        self.assertEqual(self.ids(by_price), [6, 2, 4])
+        self.assertEqual(self.ids(multi), [1, 12, 2, 3, 4, 5, 6, 7, 9])
+
+    def test_expr(self):
+        result, = ShardedSession(self.servers).run(Query('products').orderby(Expr('@weight*100+@id'))[:2])
+        self.assertEqual(self.ids(result), [3, 1])
+        self.assertNotIn('_sort_expr', result['matches'][0]['attrs'])
+        self.assertEqual(result['attrs'], [['price', 1], ['title', 7]])
+
+        servers = []
+        for port in sorted(SHARDS):
+            server = SearchServer('localhost', port, columnar=True)
+            server.set_api(self.api)
+            servers.append(server)
+        result, = ShardedSession(servers).run(Query('products').orderby(Expr('@weight*100+@id'))[:2])
+        self.assertEqual(self.ids(result), [3, 1])
+        self.assertEqual(result['matches'][0]['attrs'], {'price': 7, 'title': 't3'})
+
+    def test_partial(self):
+        self.api.delay = {2: 0.5}
+        session = ShardedSession(self.servers, timeout=0.1)
+
+        result, = session.run(Query('products')[:3])
+        self.assertEqual(self.ids(result), [3, 1, 4])
+        self.assertTrue(result['partial'])
+        self.assertEqual(result['total_found'], 70)
+        self.assertIn('localhost:2 shard timed out', result['warning'])
+
+        session = ShardedSession(self.servers, timeout=0.1, partial=False)
+        self.assertRaises(QueryError, session.run, Query('products'))
+        self.assertRaises(QueryError, session.run, Query('products').groupby('price'))
+
+    def test_merge_matches(self):
+        lists = [[1, 4, 7], [], [2, 3, 9]]
+        self.assertEqual(merge_matches(lists, lambda v: v, 4), [1, 2, 3, 4])
+        self.assertEqual(merge_matches(lists, lambda v: v, 10), [1, 2, 3, 4, 7, 9])
+
+    def test_special_sort_attrs(self):
+        self.assertEqual(get_sort_clauses(Desc('@id')), [('id', True), ('weight', True)])
+        self.assertEqual(get_sort_clauses(Asc('@weight')), [('weight', False), ('id', False)])
+        self.assertEqual(get_sort_clauses(Desc('@rank')), [('weight', True), ('id', False)])
+        self.assertEqual(get_sort_clauses(Asc('price')),
+                         [('price', False), ('weight', True), ('id', False)])
+
+        lists = [sorted(matches, key=lambda m: -m['id']) for matches in SHARDS.values()]
+        merged = merge_matches(lists, get_sort_key(Desc('@id')), 4)
+        self.assertEqual([m['id'] for m in merged], [12, 9, 7, 6])
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+
+from sphinxsearch import SearchServer
+from sphinxsearch.exceptions import QueryError
+from sphinxsearch.query import Query
+from sphinxsearch.query.filters import All, FloatRange, IDRange, Not, Range
+from sphinxsearch.query.groupby import Month, Week
+from sphinxsearch.query.orderby import Desc, Expr, MultiSort
+from sphinxsearch.session import sphinxql
+from sphinxsearch.session.sphinxql import SelectBuilder, SphinxClient, parse_meta
+
+
+def meta(total, keyword):
+    return [('total', str(total)), ('total_found', str(total * 10)), ('time', '0.001'),
+            ('keyword[0]', keyword), ('docs[0]', '5'), ('hits[0]', '7')]
+
+
+class FakeCursor(object):
+    """
+        Replays result sets of next conn.responses item, exception in
+        result sets is raised when cursor reaches it like pymysql does
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.sets = []
+        self.position = 0
+
+    def mogrify(self, query, params):
+        return query % tuple(repr(param) for param in params)
+
+    def execute(self, sql):
+        self.conn.executed.append(sql)
+        self.sets = self.conn.responses.pop(0)
+        self.position = -1
+        self.nextset()
+
+    def nextset(self):
+        self.position += 1
+        if isinstance(self.sets[self.position], Exception):
+            raise self.sets[self.position]
+        return True
+
+    @property
+    def description(self):
+        return self.sets[self.position][0]
+
+    def fetchall(self):
+        return self.sets[self.position][1]
+
+    def close(self):
+        pass
+
+
+class FakeConnection(object):
+    def __init__(self, responses):
+        self.responses = responses
+        self.executed = []
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+class Test(unittest.TestCase):
+    def compile(self, qs):
+        builder = SelectBuilder()
+        qs.query.apply(sphinxql, builder)
+        statement, = builder.statements
+        return statement
+
+    def test_select(self):
+        qs = Query('products products_delta').like('phone')
+        qs = qs.filter(brand_id=[1, 2], tags=All(3, 4), category_id=Not(5),
+                       price=Range(10, 100), rating=FloatRange(1.5, 4.5),
+                       id=IDRange(100, 200))
+        qs = qs.orderby(MultiSort(Desc('price'), '@id ASC'))[20:30].max(500).timeout(50)
+
+        sql, params = self.compile(qs)
+        self.assertEqual(sql, 'SELECT *, WEIGHT() AS _weight FROM products, products_delta '
+                              'WHERE MATCH(%s) AND id BETWEEN %s AND %s '
+                              'AND brand_id IN (%s, %s) AND category_id NOT IN (%s) '
+                              'AND price BETWEEN %s AND %s AND rating BETWEEN %s AND %s '
+                              'AND tags IN (%s) AND tags IN (%s) '
+                              'ORDER BY price DESC, id ASC '
+                              'LIMIT %s, %s OPTION max_matches=%s, max_query_time=%s')
+        self.assertEqual(params, ('phone', 100, 200, 1, 2, 5, 10, 100, 1.5, 4.5, 3, 4,
+                                  20, 10, 500, 50))
+
+    def test_select_expressions(self):
+        qs = Query('products').filter(price=Not(Range(10, 100)))
+        qs = qs.geo('lat', 'long', 0.5, 1.5).orderby(Expr('@weight + price % 10'))
+        qs = qs.override('price', 'SPH_ATTR_INTEGER', **{'1': 5, '2': 5, '3': 7})
+        qs = qs.groupby(Month('created')).cache()
+
+        sql, params = self.compile(qs)
+        self.assertEqual(sql, 'SELECT *, WEIGHT() AS _weight, '
+                              'GEODIST(%s, %s, lat, long) AS _geodist, '
+                              'IF(IN(id, %s, %s), %s, IF(IN(id, %s), %s, price)) AS _override_price, '
+                              'WEIGHT() + price %% 10 AS _expr, '
+                              'price < %s OR price > %s AS _filter0, '
+                              'GROUPBY() AS _group, COUNT(*) AS _count '
+                              'FROM products WHERE _filter0 = 1 '
+                              'GROUP BY YEARMONTH(created) WITHIN GROUP ORDER BY _expr DESC '
+                              'ORDER BY _group desc LIMIT %s, %s')
+        self.assertEqual(params, (0.5, 1.5, 1, 2, 5, 3, 7, 10, 100, 0, 20))
+
+        self.assertRaises(QueryError, self.compile, Query('products').groupby(Week('created')))
+
+    def test_meta(self):
+        meta = parse_meta([('total', '20'), ('total_found', '1500'), ('time', '0.003'),
+                           ('keyword[0]', 'phone'), ('docs[0]', '10'), ('hits[0]', '12')])
+        self.assertEqual(meta, {'total': 20, 'total_found': 1500, 'time': '0.003',
+                                'words': [{'word': 'phone', 'docs': 10, 'hits': 12}]})
+
+    def test_listener(self):
+        server = SearchServer(listen='127.0.0.1:9306:mysql41')
+        self.assertEqual((server.host, server.port, server.protocol), ('127.0.0.1', 9306, 'mysql41'))
+        self.assertIs(server.api, sphinxql)
+        self.assertIs(server.session_maker.pool.api, sphinxql)
+
+        server = SearchServer('localhost', 9306, protocol='mysql41')
+        self.assertEqual(server.get_options_dict()['listen'], 'localhost:9306:mysql41')
+
+        server = SearchServer(listen='/var/run/searchd.sock')
+        self.assertFalse(hasattr(server, 'session_maker'))
+
+    def test_empty_filter(self):
+        sql, params = self.compile(Query('products').filter(brand_id=[]))
+        self.assertEqual(sql, 'SELECT *, WEIGHT() AS _weight, 0 AS _filter0 '
+                              'FROM products WHERE _filter0 = 1 LIMIT %s, %s')
+
+        builder = SelectBuilder()
+        builder.SetFilter('brand_id', [], exclude=True)
+        builder.AddQuery('', 'products')
+        self.assertEqual(builder.statements,
+                         [('SELECT *, WEIGHT() AS _weight FROM products LIMIT %s, %s', (0, 20))])
+
+    def get_client(self, responses):
+        try:
+            from pymysql.constants import FIELD_TYPE
+        except ImportError:
+            raise unittest.SkipTest('PyMySQL is not installed')
+
+        description = (('id', FIELD_TYPE.LONGLONG), ('_weight', FIELD_TYPE.LONG),
+                       ('price', FIELD_TYPE.LONG), ('title', FIELD_TYPE.VAR_STRING))
+        client = SphinxClient()
+        client._conn = FakeConnection([[item if isinstance(item, Exception)
+                                        else (description if i % 2 == 0 else None, item)
+                                        for i, item in enumerate(sets)]
+                                       for sets in responses])
+        for query in ('phone', 'case', 'cable'):
+            client.AddQuery(query, 'products')
+        return client
+
+    def test_run_queries(self):
+        client = self.get_client([[[(1, 10, 990, 'red phone')], meta(1, 'phone'),
+                                   [(2, 7, 15, 'case'), (3, 5, 20, 'case')], meta(2, 'case'),
+                                   [], meta(0, 'cable')]])
+        conn = client._conn
+        phone, case, cable = client.RunQueries()
+
+        sql, = conn.executed
+        self.assertEqual(sql.count('SHOW META'), 3)
+        self.assertEqual(phone['matches'], [{'id': 1, 'weight': 10,
+                                             'attrs': {'price': 990, 'title': 'red phone'}}])
+        self.assertEqual(phone['attrs'], [['price', sphinxql.SPH_ATTR_INTEGER],
+                                          ['title', sphinxql.SPH_ATTR_STRING]])
+        self.assertEqual([m['id'] for m in case['matches']], [2, 3])
+        self.assertEqual((case['total'], case['total_found']), (2, 20))
+        self.assertEqual(case['words'], [{'word': 'case', 'docs': 5, 'hits': 7}])
+        self.assertEqual((cable['status'], cable['matches']), (0, []))
+        self.assertEqual(client.GetLastError(), '')
+        self.assertEqual(len(client), 0)
+
+    def test_run_queries_errors(self):
+        import pymysql
+
+        # searchd stops at failed statement, the rest is resent
+        client = self.get_client([[[(1, 10, 990, 'red phone')], meta(1, 'phone'),
+                                   pymysql.ProgrammingError(1064, 'unknown column')],
+                                  [[], meta(0, 'cable')]])
+        conn = client._conn
+        phone, case, cable = client.RunQueries()
+        self.assertEqual([m['id'] for m in phone['matches']], [1])
+        self.assertEqual((case['status'], case['error']), (1, 'unknown column'))
+        self.assertEqual(cable['status'], 0)
+        self.assertEqual(len(conn.executed), 2)
+        self.assertNotIn("'phone'", conn.executed[1])
+        self.assertIn("'cable'", conn.executed[1])
+
+        # connection errors close connection
+        client = self.get_client([[pymysql.OperationalError(2013, 'Lost connection')]])
+        conn = client._conn
+        self.assertIsNone(client.RunQueries())
+        self.assertTrue(client.IsConnectError())
+        self.assertIn('Lost connection', client.GetLastError())
+        self.assertTrue(conn.closed)
+        self.assertIsNone(client._conn)
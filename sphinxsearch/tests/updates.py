@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+import unittest
+
+from sphinxsearch import SearchServer
+from sphinxsearch.exceptions import PoolTimeout, QueryError
+from sphinxsearch.models import Index, RT, Int, Float, MVA
+from sphinxsearch.query import Query
+from sphinxsearch.session.updates import AttributeUpdater
+from .utils import make_api
+
+
+class Offers(Index):
+    __source__ = RT()
+    __fields__ = ('title',)
+
+    price = Int()
+    rating = Float()
+    tags = MVA(Int)
+
+
+NAME = Offers.get_index_names()[0]
+
+
+def update_attributes(client, index, attrs, values, mva=False, ignorenonexistent=False):
+    time.sleep(client.api.delay)
+    if client.api.fail:
+        return -1
+    return len(values)
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.api = make_api({'UpdateAttributes': update_attributes}, fail=False, delay=0)
+        self.server = SearchServer('localhost', 1)
+        self.server.set_api(self.api)
+
+    @property
+    def requests(self):
+        return self.api.get_requests('UpdateAttributes')
+
+    def test_coalesce(self):
+        updater = AttributeUpdater(self.server)
+        updater.update(Offers, ('price', 'rating'), {1: (10, 1.5), 2: ('20', 2)})
+        updater.update(Offers, ('price',), {1: (11,), 3: (30,)})
+        updater.update(Offers, ('tags',), {1: ([3, 1, 3],)})
+        updater.update('archive', ('flags',), {1: ([7],)}, mva=True)
+
+        self.assertEqual(updater.flush(), 5)
+        self.assertEqual(self.requests, [
+            ('archive', ['flags'], {1: [[7]]}, True),
+            (NAME, ['price'], {3: [30]}, False),
+            (NAME, ['price', 'rating'], {1: [11, 1.5], 2: [20, 2.0]}, False),
+            (NAME, ['tags'], {1: [[1, 3]]}, True),
+        ])
+        self.assertEqual(updater.get_stats(), {'pending': 0, 'docs': 5, 'coalesced': 1,
+                                               'batches': 4, 'updated': 5, 'errors': 0})
+        self.assertEqual(updater.flush(), 0)
+
+        self.assertRaises(ValueError, updater.update, Offers, ('size',), {1: (1,)})
+        self.assertRaises(ValueError, updater.update, Offers, ('price',), {1: (1, 2)})
+
+    def test_packet_size(self):
+        self.server.set_option('max_packet_size', '2K')
+        updater = AttributeUpdater(self.server)
+        updater.update(NAME, ('price', 'stock'), dict((i, (i, 1)) for i in range(1, 201)))
+        updater.flush()
+
+        requests = self.requests
+        self.assertTrue(len(requests) > 1)
+        self.assertEqual(sorted(i for _, _, values, _ in requests for i in values),
+                         list(range(1, 201)))
+        for _, _, values, _ in requests:
+            self.assertTrue(1024 + len(values) * 16 <= 2048)
+
+    def test_errors(self):
+        updater = AttributeUpdater(self.server)
+        updater.update(Offers, ('price',), {1: (10,), 2: (20,)})
+
+        self.api.fail = True
+        self.assertRaises(QueryError, updater.flush)
+        self.assertEqual(updater.get_stats()['pending'], 2)
+
+        # newer values are not overwritten by failed ones
+        updater.update(Offers, ('price',), {1: (15,)})
+        updater.requeue({(NAME, False): {1: {'price': 10}}})
+        self.api.fail = False
+        updater.flush()
+        self.assertEqual(self.requests, [(NAME, ['price'], {1: [10], 2: [20]}, False),
+                                         (NAME, ['price'], {1: [15], 2: [20]}, False)])
+
+        updater.add(Query(Offers).raw_update(('price',), {4: (40,)}))
+        updater.flush()
+        self.assertEqual(self.requests[-1], (NAME, ['price'], {4: [40]}, False))
+        self.assertRaises(ValueError, updater.add, Query(Offers))
+
+    def test_background(self):
+        with AttributeUpdater(self.server, flush_interval=0.01) as updater:
+            updater.update(Offers, ('price',), {1: (10,)})
+            for _ in range(100):
+                if self.requests:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(self.requests, [(NAME, ['price'], {1: [10]}, False)])
+            updater.update(Offers, ('price',), {2: (20,)})
+        self.assertEqual(len(self.requests), 2)
+        self.assertFalse(updater.running)
+
+    def test_bounded(self):
+        self.api.delay = 0.2
+        updater = AttributeUpdater(self.server, flush_interval=10, max_pending=2, put_timeout=0.05)
+        updater.start()
+        try:
+            updater.update(Offers, ('price',), {1: (10,), 2: (20,)})
+            # flusher is woken by full queue and is busy sending
+            time.sleep(0.05)
+            updater.update(Offers, ('price',), {3: (30,), 4: (40,)})
+            self.assertRaises(PoolTimeout, updater.update, Offers, ('price',), {5: (50,)})
+        finally:
+            self.api.delay = 0
+            updater.stop()
+        self.assertEqual(sorted(i for _, _, values, _ in self.requests for i in values),
+                         [1, 2, 3, 4])
+
+        # without flusher full queue is flushed by update itself
+        updater = AttributeUpdater(self.server, max_pending=1)
+        updater.update(Offers, ('price',), {6: (60,)})
+        updater.update(Offers, ('price',), {7: (70,)})
+        self.assertEqual(self.requests[-1], (NAME, ['price'], {6: [60]}, False))
+
+    def test_failed_flush_backoff(self):
+        self.api.fail = True
+        updater = AttributeUpdater(self.server, flush_interval=0.2, max_pending=2)
+        updater.start()
+        try:
+            updater.update(Offers, ('price',), {1: (10,), 2: (20,)})
+            time.sleep(0.1)
+            # full queue does not make flusher retry without waiting
+            self.assertEqual(updater.get_stats()['errors'], 1)
+        finally:
+            updater.stop()
+        self.assertEqual(updater.get_stats()['errors'], 2)
+        self.assertEqual(updater.get_stats()['pending'], 2)
@@ -1,9 +1,136 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import socket
+import threading
+
 from itertools import product
 
 
+class FakeClient(object):
+    """
+        sphinxapi.SphinxClient double: records calls, opens socketpair
+        instead of searchd connection, answers RunQueries with empty results
+    """
+    refuse = False
+
+    def __init__(self):
+        self._socket = None
+        self._peer = None
+        self.calls = []
+        self.batches = []
+        self._queued = []
+
+    def __getattr__(self, name):
+        if not name[:1].isupper():
+            raise AttributeError(name)
+
+        def method(*args):
+            self.calls.append((name, args))
+        return method
+
+    def SetServer(self, host, port):
+        self.server = (host, port)
+
+    def Open(self):
+        if self.refuse:
+            return False
+        self._socket, self._peer = socket.socketpair()
+        return True
+
+    def Close(self):
+        for sock in (self._socket, self._peer):
+            if sock is not None:
+                sock.close()
+        self._socket = self._peer = None
+
+    def GetLastError(self):
+        return 'connection refused' if self.refuse else ''
+
+    def IsConnectError(self):
+        return False
+
+    def AddQuery(self, query, index='*', comment=''):
+        self.calls.append(('AddQuery', (query, index)))
+        self._queued.append(self.calls)
+        self.calls = []
+
+    def RunQueries(self):
+        batch, self._queued = self._queued, []
+        self.batches.append(batch)
+        return [self.get_result(calls) for calls in batch]
+
+    def get_result(self, calls):
+        return {'status': 0, 'error': '', 'warning': '',
+                'fields': [], 'attrs': [], 'matches': [],
+                'total': 0, 'total_found': 0, 'time': '0.000', 'words': []}
+
+
+class FakeApi(object):
+    SphinxClient = FakeClient
+
+    SPH_SORT_RELEVANCE = 0
+    SPH_SORT_ATTR_DESC = 1
+    SPH_SORT_ATTR_ASC = 2
+    SPH_SORT_TIME_SEGMENTS = 3
+    SPH_SORT_EXTENDED = 4
+    SPH_SORT_EXPR = 5
+
+    SPH_GROUPBY_DAY = 0
+    SPH_GROUPBY_WEEK = 1
+    SPH_GROUPBY_MONTH = 2
+    SPH_GROUPBY_YEAR = 3
+    SPH_GROUPBY_ATTR = 4
+
+    SPH_ATTR_INTEGER = 1
+    SPH_ATTR_TIMESTAMP = 2
+    SPH_ATTR_ORDINAL = 3
+    SPH_ATTR_BOOL = 4
+    SPH_ATTR_FLOAT = 5
+    SPH_ATTR_BIGINT = 6
+    SPH_ATTR_STRING = 7
+    SPH_ATTR_MULTI = 0x40000001
+
+
+class RecordingApi(FakeApi):
+    requests = ()
+
+    @classmethod
+    def get_requests(cls, name):
+        """
+            Args of recorded calls of client method name
+        """
+        return [args for method, args in cls.requests if method == name]
+
+
+def make_api(methods, **options):
+    """
+        RecordingApi with own client class, so tests share no state.
+        methods are {name: func(client, *args)} set on client class, calls
+        of sphinxapi methods among them are recorded in api.requests as
+        (name, args). options become api attributes, methods read them
+        from client.api.
+    """
+    requests = []
+    lock = threading.Lock()
+
+    def recorded(name, func):
+        def method(self, *args):
+            with lock:
+                requests.append((name, args))
+            return func(self, *args)
+        return method
+
+    attrs = dict((name, recorded(name, func) if name[:1].isupper() else func)
+                 for name, func in methods.items())
+    client_cls = type(str('RecordingClient'), (FakeClient,), attrs)
+
+    options.update(SphinxClient=client_cls, requests=requests)
+    api = type(str('RecordingApi'), (RecordingApi,), options)
+    client_cls.api = api
+    return api
+
+
 def get_api():  # pragma: no cover
     import sphinxapi
     return sphinxapi
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+
+from io import BytesIO
+from xml.etree import ElementTree
+
+from sphinxsearch.models import Index, XML, Int, BigInt, Float, String, MVA
+from sphinxsearch.models.xmlpipe import XMLPipeWriter, get_command, main
+
+
+COMMAND = get_command('sphinxsearch.tests.xmlpipe:Articles',
+                      'sphinxsearch.tests.xmlpipe:iter_articles',
+                      'sphinxsearch.tests.xmlpipe:get_deleted')
+
+
+class Articles(Index):
+    __source__ = XML(COMMAND)
+    __fields__ = ('title', 'content')
+
+    author_id = Int()
+    views = BigInt()
+    rating = Float()
+    slug = String()
+    tags = MVA(BigInt)
+
+
+def iter_articles():
+    for i in range(1, 101):
+        yield {'id': i, 'title': 'Article <%s>' % i, 'content': 'text & more\x01',
+               'author_id': i % 7, 'rating': 0.5, 'tags': [i, 1, i]}
+
+
+def get_deleted():
+    return [500, 501]
+
+
+class Test(unittest.TestCase):
+    def parse(self, data):
+        # indexer reads stream without namespace processing
+        return ElementTree.fromstring(data.replace(b'sphinx:', b'sphinx-'))
+
+    def test_stream(self):
+        stream = BytesIO()
+        main(COMMAND.split()[1:] + ['--buffer-size', '512'], stream=stream)
+
+        docset = self.parse(stream.getvalue())
+        schema = docset.find('sphinx-schema')
+        self.assertEqual([(el.tag, el.get('name'), el.get('type')) for el in schema],
+                         [('sphinx-field', 'title', None),
+                          ('sphinx-field', 'content', None),
+                          ('sphinx-attr', 'author_id', 'int'),
+                          ('sphinx-attr', 'rating', 'float'),
+                          ('sphinx-attr', 'slug', 'string'),
+                          ('sphinx-attr', 'tags', 'multi_64'),
+                          ('sphinx-attr', 'views', 'bigint')])
+
+        documents = docset.findall('sphinx-document')
+        self.assertEqual(len(documents), 100)
+        doc = documents[9]
+        self.assertEqual(doc.get('id'), '10')
+        self.assertEqual(doc.find('title').text, 'Article <10>')
+        self.assertEqual(doc.find('content').text, 'text & more ')
+        self.assertEqual(doc.find('tags').text, '1,10')
+        self.assertIsNone(doc.find('views'))
+
+        killlist = docset.find('sphinx-killlist')
+        self.assertEqual([el.text for el in killlist], ['500', '501'])
+
+    def test_buffering(self):
+        class Stream(BytesIO):
+            writes = 0
+
+            def write(self, data):
+                self.writes += 1
+                return BytesIO.write(self, data)
+
+        stream = Stream()
+        writer = XMLPipeWriter(Articles, stream, buffer_size=4096)
+        writer.write_documents(iter_articles())
+        self.assertTrue(1 < stream.writes < 10)
+
+        self.assertRaises(ValueError, writer.write_document, {'id': 1, 'author_id': -1})
+        writer.close()
+        self.assertEqual(writer.documents, 100)
+
+    def test_config(self):
+        options = Articles.__source__.get_option_dicts(Articles, {})
+        self.assertEqual(options['source xmlpipe_articles'],
+                         {'type': 'xmlpipe2', 'xmlpipe_command': COMMAND})
+        self.assertEqual(options['index xmlpipe_articles'], {'source': 'xmlpipe_articles'})
@@ -1,6 +1,46 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import re
+
+from itertools import count
+
+from six import string_types
+
+
+_versions = count(1)
+
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+RE_SIZE = re.compile(r'^\s*(\d+)\s*([KMG]?)\s*$', re.I)
+
+# searchd default for max_packet_size option
+DEFAULT_MAX_PACKET_SIZE = 8 * 1024 ** 2
+
+# request header, index name and options besides request payload
+REQUEST_OVERHEAD = 1024
+
+
+def next_version():
+    """
+        Globally increasing number, used to detect config changes
+    """
+    return next(_versions)
+
+
+class Versioned(object):
+    """
+        __config_version__ changes on every attribute assignment
+    """
+    __config_version__ = 0
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, '__config_version__', next_version())
+
+    def get_config_version(self):
+        return self.__config_version__
+
 
 def set_abstract(cls, value):
     cls.__abstract_index__ = value
@@ -8,3 +48,21 @@ def set_abstract(cls, value):
 
 def is_abstract(cls):
     return cls.__abstract_index__
+
+
+def parse_size(value):
+    """
+    >>> parse_size('512M')
+    536870912
+    """
+    if isinstance(value, string_types):
+        match = RE_SIZE.match(value)
+        if match is None:
+            raise ValueError('invalid size %r' % value)
+        number, unit = match.groups()
+        return int(number) * SIZE_UNITS[unit.upper()]
+    return int(value)
+
+
+def get_max_packet_size(server):
+    return parse_size(server.get_option_value('max_packet_size', DEFAULT_MAX_PACKET_SIZE))
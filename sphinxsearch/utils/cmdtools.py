@@ -1,6 +1,54 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, print_function
 
+from six import text_type
+
+
+class Command(text_type):
+    """
+        Command line built by CommandBuilder, keeps argv list for running
+        without shell, str value stays space separated for backward compatibility
+    """
+    def __new__(cls, argv):
+        argv = [text_type(arg) for arg in argv]
+        command = super(Command, cls).__new__(cls, ' '.join(argv))
+        command.argv = argv
+        command.on_success = []
+        return command
+
+    @property
+    def commands(self):
+        return [self]
+
+    def succeeded(self):
+        """
+            Called by CommandExecutor once command finished with code 0
+        """
+        for callback in self.on_success:
+            callback()
+
+
+class CommandChain(text_type):
+    """
+        Several commands which must run one after another,
+        next command runs only if previous one succeeded
+    """
+    def __new__(cls, commands):
+        commands = list(commands)
+        chain = super(CommandChain, cls).__new__(cls, ' ; '.join(commands))
+        chain.commands = commands
+        return chain
+
+
+def flatten_args(cmd_splitted):
+    args = []
+    for arg in cmd_splitted:
+        if isinstance(arg, (list, tuple)):
+            args.extend(arg)
+        else:
+            args.append(arg)
+    return args
+
 
 class CmdUnknownOptionException(Exception):
     def __init__(self, keys):
@@ -52,7 +100,7 @@ def cmd_decorator(func):
             option, conflicted = e.option, e.conflicted
             raise TypeError('option %s conflictz with options; %s' % (option, conflicted))
         else:
-            return ' '.join(cmd_splitted)
+            return Command(flatten_args(cmd_splitted))
     return wrapper
 
 
@@ -98,7 +146,10 @@ def cmd_named_kwarg(name, option, **kwargs):
                     option_value = apply(option_value)
                 if option:
                     cmd_splitted.append(option)
-                cmd_splitted.append(unicode(option_value))
+                if isinstance(option_value, (list, tuple)):
+                    cmd_splitted.extend(map(text_type, option_value))
+                else:
+                    cmd_splitted.append(text_type(option_value))
             return cmd_splitted
         return wrapper
     return decorator
@@ -3,3 +3,5 @@ from __future__ import unicode_literals
 
 
 CONFIG_INDENT = ' ' * 4
+
+CONFIG_FILE_MODE = 0o644
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+
+MAX_CHAIN_DEPTH = 16
+
+_missing = object()
+
+
+class PersistentMap(object):
+    """
+        Immutable mapping built as parent-linked chain of single-key deltas.
+        set() and remove() are O(1) and share structure with the parent;
+        reads walk the chain, full materialization is memoized on the node.
+
+    >>> empty = PersistentMap()
+    >>> filters = empty.set('price', 1).set('brand', 2)
+    >>> filters['price'], len(empty)
+    (1, 0)
+    """
+    __slots__ = ('_parent', '_key', '_value', '_cache')
+
+    def __init__(self, items=None):
+        self._parent = None
+        self._key = None
+        self._value = None
+        self._cache = dict(items or ())
+
+    def _delta(self, key, value):
+        new_instance = self.__class__.__new__(self.__class__)
+        new_instance._parent = self
+        new_instance._key = key
+        new_instance._value = value
+        new_instance._cache = None
+        return new_instance
+
+    def set(self, key, value):
+        return self._delta(key, value)
+
+    def remove(self, key):
+        if key not in self:
+            return self
+        return self._delta(key, _missing)
+
+    def get(self, key, default=None):
+        node = self
+        depth = 0
+
+        while node._cache is None:
+            if node._key == key:
+                return default if node._value is _missing else node._value
+            node = node._parent
+            depth += 1
+
+            if depth > MAX_CHAIN_DEPTH:
+                return self._materialize().get(key, default)
+
+        return node._cache.get(key, default)
+
+    def _materialize(self):
+        if self._cache is not None:
+            return self._cache
+
+        chain = []
+        node = self
+        while node._cache is None:
+            chain.append(node)
+            node = node._parent
+
+        items = node._cache.copy()
+        for node in reversed(chain):
+            if node._value is _missing:
+                items.pop(node._key, None)
+            else:
+                items[node._key] = node._value
+
+        self._cache = items
+        return items
+
+    def to_dict(self):
+        return self._materialize().copy()
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self):
+        return len(self._materialize())
+
+    def __bool__(self):
+        return bool(len(self))
+
+    __nonzero__ = __bool__
+
+    def __eq__(self, other):
+        if isinstance(other, PersistentMap):
+            other = other._materialize()
+        return self._materialize() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def items(self):
+        return self.to_dict().items()
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def values(self):
+        return self.to_dict().values()
+
+    def __repr__(self):
+        return 'PersistentMap(%r)' % self.to_dict()